@@ -3,15 +3,20 @@ Admin endpoints for PhotoPro AI backend.
 User management, analytics, and system monitoring.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from typing import List, Optional
 from datetime import datetime, timedelta
 from database import get_db
-from models import User, GeneratedPhoto, CreditTransaction
-from schemas import UserResponse, PhotoResponse, CreditHistoryResponse
+from models import User, GeneratedPhoto, CreditTransaction, DeletionJob, GcRun
+from schemas import UserResponse, PhotoResponse, CreditHistoryResponse, DeletionJobResponse, GcRunResponse
 from auth import get_current_user
+from url_signing import url_signer, PHOTO_URL_FIELDS
+from asset_index import asset_index, cloudinary
+from bulk_deletion import bulk_deleter, delete_account_data, delete_failed_generations
+from storage_gc import garbage_collector
+from upload_expiry import upload_expiry
 import json
 
 # Create admin router
@@ -84,7 +89,8 @@ async def get_admin_stats(
         "styles": [
             {"style": style, "count": count} 
             for style, count in style_stats
-        ]
+        ],
+        "storage": upload_expiry.storage_growth(db)
     }
 
 
@@ -147,7 +153,7 @@ async def get_user_photos(
         GeneratedPhoto.user_id == user_id
     ).order_by(desc(GeneratedPhoto.created_at)).all()
     
-    return photos
+    return url_signer.sign_models(photos, PhotoResponse, PHOTO_URL_FIELDS)
 
 
 @admin_router.get("/users/{user_id}/transactions", response_model=List[CreditHistoryResponse])
@@ -260,7 +266,7 @@ async def get_all_photos(
         query = query.filter(GeneratedPhoto.style == style)
     
     photos = query.order_by(desc(GeneratedPhoto.created_at)).offset(skip).limit(limit).all()
-    return photos
+    return url_signer.sign_models(photos, PhotoResponse, PHOTO_URL_FIELDS)
 
 
 @admin_router.get("/analytics/daily")
@@ -321,3 +327,151 @@ async def get_daily_analytics(
             for date, total in daily_credits
         ]
     }
+
+
+@admin_router.post("/assets/reconcile")
+async def reconcile_asset_index(
+    prefix: str = Query("photopro/", min_length=1),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Re-sync the local Cloudinary asset index under a prefix"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if cloudinary is None:
+        raise HTTPException(status_code=400, detail="Cloudinary is not configured")
+    
+    return await asset_index.reconcile(db, prefix)
+
+
+@admin_router.delete("/users/{user_id}", response_model=DeletionJobResponse, status_code=202)
+async def delete_user(
+    user_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete a user account and queue its stored objects for deletion"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    job = delete_account_data(db, user)
+    background_tasks.add_task(bulk_deleter.run, job.id)
+    return job
+
+
+@admin_router.post("/cleanup/failed-generations", response_model=DeletionJobResponse, status_code=202)
+async def cleanup_failed_generations(
+    background_tasks: BackgroundTasks,
+    older_than_days: int = Query(7, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Remove failed generations and any outputs they stored"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = delete_failed_generations(db, timedelta(days=older_than_days))
+    background_tasks.add_task(bulk_deleter.run, job.id)
+    return job
+
+
+@admin_router.get("/deletion-jobs/{job_id}", response_model=DeletionJobResponse)
+async def get_deletion_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get progress of a bulk deletion job"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = db.query(DeletionJob).filter(DeletionJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    
+    return job
+
+
+@admin_router.post("/storage/gc", response_model=GcRunResponse, status_code=202)
+async def start_storage_gc(
+    background_tasks: BackgroundTasks,
+    dry_run: bool = Query(True),
+    grace_hours: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Find (and unless dry_run, delete) stored objects no row references"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    grace_period = timedelta(hours=grace_hours) if grace_hours is not None else None
+    try:
+        run = garbage_collector.create_run(db, dry_run=dry_run, grace_period=grace_period)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    background_tasks.add_task(garbage_collector.run, run.id)
+    return run
+
+
+@admin_router.get("/storage/gc/{run_id}", response_model=GcRunResponse)
+async def get_storage_gc(
+    run_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get progress and report of a garbage collection run"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    run = db.query(GcRun).filter(GcRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Garbage collection run not found")
+    
+    return run
+
+
+@admin_router.post("/storage/gc/{run_id}/resume", response_model=GcRunResponse, status_code=202)
+async def resume_storage_gc(
+    run_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Continue a failed garbage collection run from its checkpoint"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    run = db.query(GcRun).filter(GcRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Garbage collection run not found")
+    
+    garbage_collector.resume(db, run)
+    background_tasks.add_task(garbage_collector.run, run.id)
+    return run
+
+
+@admin_router.post("/uploads/expire")
+async def expire_uploads(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Remove uploads past their plan's retention now instead of at the next scheduled pass"""
+    
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return await upload_expiry.expire(db)
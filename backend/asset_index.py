@@ -0,0 +1,241 @@
+"""
+Local index of Cloudinary assets for PhotoPro AI.
+Listings are answered from the database; the Admin API, which is rate
+limited and pages at most 500 resources at a time, is only walked (via
+next_cursor) to reconcile the index.
+"""
+
+import asyncio
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import CloudinaryAsset
+from storage_backends import run_storage_call
+
+try:
+    import cloudinary
+    import cloudinary.api
+    import cloudinary.exceptions
+except ImportError:  # Only needed to reconcile against Cloudinary
+    cloudinary = None
+
+# <CLOUDINARY_FOLDER>/uploads/<user_id>/<name>, the storage key layout
+USER_FOLDER_PATTERN = re.compile(r"^[^/]+/uploads/(\d+)/")
+
+# Largest page the Admin API returns
+RECONCILE_PAGE_SIZE = 500
+
+# Retries of a rate-limited Admin API page, with exponential backoff
+RATE_LIMIT_RETRIES = 4
+RATE_LIMIT_BACKOFF_SECONDS = 2.0
+
+
+@contextmanager
+def index_session(db: Optional[Session] = None) -> Iterator[Session]:
+    """The caller's session, or a short-lived one for an index update"""
+    if db is not None:
+        yield db
+        return
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _parse_created_at(value: Optional[str]) -> datetime:
+    if not value:
+        return datetime.utcnow()
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+class CloudinaryAssetIndex:
+    """Database mirror of Cloudinary assets, updated on upload and delete"""
+
+    def __init__(self):
+        self.records = 0
+        self.removals = 0
+        self.listings = 0
+        self.pages_fetched = 0
+        self.rate_limited = 0
+        self.last_reconcile: Optional[Dict[str, Any]] = None
+
+    def _apply(self, asset: CloudinaryAsset, resource: Dict[str, Any]):
+        public_id = resource["public_id"]
+        match = USER_FOLDER_PATTERN.match(public_id)
+        asset.user_id = int(match.group(1)) if match else None
+        asset.folder = public_id.rsplit("/", 1)[0] if "/" in public_id else ""
+        asset.url = resource.get("secure_url") or resource.get("url", "")
+        asset.format = resource.get("format")
+        asset.width = resource.get("width")
+        asset.height = resource.get("height")
+        asset.bytes = resource.get("bytes", 0)
+        asset.created_at = _parse_created_at(resource.get("created_at"))
+
+    def upsert(
+        self,
+        db: Session,
+        resources: Iterable[Dict[str, Any]],
+        reconciled_at: Optional[datetime] = None
+    ) -> int:
+        """
+        Insert or update index entries from upload results or Admin API resources
+
+        Args:
+            db: Database session
+            resources: Resources keyed by 'public_id'
+            reconciled_at: Start of the reconcile these resources came from
+
+        Returns:
+            Number of entries that were not in the index before
+        """
+        by_id = {resource["public_id"]: resource for resource in resources}
+        if not by_id:
+            return 0
+
+        existing = {
+            asset.public_id: asset
+            for asset in db.query(CloudinaryAsset).filter(CloudinaryAsset.public_id.in_(list(by_id)))
+        }
+        for public_id, resource in by_id.items():
+            asset = existing.get(public_id)
+            if asset is None:
+                asset = CloudinaryAsset(public_id=public_id)
+                db.add(asset)
+            self._apply(asset, resource)
+            if reconciled_at is not None:
+                asset.reconciled_at = reconciled_at
+        db.commit()
+
+        self.records += len(by_id)
+        return len(by_id) - len(existing)
+
+    def record(self, db: Session, resource: Dict[str, Any]):
+        """Index one uploaded asset"""
+        self.upsert(db, [resource])
+
+    def remove(self, db: Session, public_id: str) -> bool:
+        """Drop a deleted asset from the index"""
+        removed = db.query(CloudinaryAsset).filter(CloudinaryAsset.public_id == public_id).delete()
+        db.commit()
+        self.removals += removed
+        return bool(removed)
+
+    def remove_many(self, db: Session, public_ids: List[str]) -> int:
+        """Drop deleted assets from the index in one statement"""
+        removed = db.query(CloudinaryAsset).filter(
+            CloudinaryAsset.public_id.in_(public_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        self.removals += removed
+        return removed
+
+    def list(self, db: Session, folder: str, limit: int = 100, offset: int = 0) -> List[CloudinaryAsset]:
+        """Assets directly in a folder, newest first (no Admin API call)"""
+        self.listings += 1
+        return db.query(CloudinaryAsset).filter(
+            CloudinaryAsset.folder == folder
+        ).order_by(CloudinaryAsset.created_at.desc()).offset(offset).limit(limit).all()
+
+    def list_prefix(self, db: Session, prefix: str, limit: int = 1000) -> List[CloudinaryAsset]:
+        """Assets whose public ID starts with a prefix, in public ID order"""
+        self.listings += 1
+        return db.query(CloudinaryAsset).filter(
+            CloudinaryAsset.public_id.startswith(prefix, autoescape=True)
+        ).order_by(CloudinaryAsset.public_id).limit(limit).all()
+
+    async def iter_resources(self, prefix: str, page_size: int = RECONCILE_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream every uploaded resource under a prefix from the Admin API
+
+        Pages are fetched one at a time by next_cursor, so memory stays at one
+        page however many assets there are. Rate-limited pages are retried
+        with exponential backoff.
+        """
+        cursor = None
+        while True:
+            options = {"type": "upload", "prefix": prefix, "max_results": page_size}
+            if cursor:
+                options["next_cursor"] = cursor
+
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                try:
+                    page = await run_storage_call(cloudinary.api.resources, **options)
+                    break
+                except cloudinary.exceptions.RateLimited:
+                    self.rate_limited += 1
+                    if attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    await asyncio.sleep(RATE_LIMIT_BACKOFF_SECONDS * 2 ** attempt)
+            self.pages_fetched += 1
+
+            for resource in page.get("resources", []):
+                yield resource
+
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
+
+    async def reconcile(self, db: Session, prefix: str) -> Dict[str, Any]:
+        """
+        Bring the index for a prefix in line with Cloudinary
+
+        Adds or refreshes every remote asset, marking it with the reconcile's
+        start time, then drops entries the walk did not mark. Only one page
+        of resources is held at a time.
+
+        Returns:
+            Dict with 'seen', 'added' and 'removed' counts
+        """
+        started = datetime.utcnow()
+        seen = 0
+        added = 0
+        page: List[Dict[str, Any]] = []
+
+        async for resource in self.iter_resources(prefix):
+            seen += 1
+            page.append(resource)
+            if len(page) >= RECONCILE_PAGE_SIZE:
+                added += self.upsert(db, page, reconciled_at=started)
+                page = []
+        added += self.upsert(db, page, reconciled_at=started)
+
+        # Assets uploaded while the walk was running may have been missed by
+        # it; they are not stale
+        removed = db.query(CloudinaryAsset).filter(
+            CloudinaryAsset.public_id.startswith(prefix, autoescape=True),
+            CloudinaryAsset.created_at < started,
+            or_(CloudinaryAsset.reconciled_at.is_(None), CloudinaryAsset.reconciled_at < started)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        self.last_reconcile = {
+            "prefix": prefix,
+            "seen": seen,
+            "added": added,
+            "removed": removed,
+            "started_at": started.isoformat(),
+            "seconds": round((datetime.utcnow() - started).total_seconds(), 2)
+        }
+        return self.last_reconcile
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get asset index statistics"""
+        return {
+            "records": self.records,
+            "removals": self.removals,
+            "listings": self.listings,
+            "pages_fetched": self.pages_fetched,
+            "rate_limited": self.rate_limited,
+            "last_reconcile": self.last_reconcile
+        }
+
+
+# Global asset index
+asset_index = CloudinaryAssetIndex()
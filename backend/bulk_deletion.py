@@ -0,0 +1,267 @@
+"""
+Bulk deletion of stored objects for PhotoPro AI.
+Keys are recorded in a deletion job, deleted in batches of the provider's
+bulk limit under a rate limit, and marked off batch by batch so an
+interrupted job resumes where it stopped.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import (
+    CreditTransaction, DeletionJob, DeletionJobItem, GeneratedPhoto, ImageFingerprint, Upload, User
+)
+from object_catalog import is_content_addressed, object_catalog
+from storage_backends import storage_backend
+from write_spool import write_spool
+
+# Jobs that still have pending items
+UNFINISHED_STATUSES = ("pending", "running")
+
+
+class BulkDeleter:
+    """Runs deletion jobs against the configured storage backend"""
+
+    def __init__(self):
+        self.jobs_run = 0
+        self.batches = 0
+        self.retries = 0
+        self.keys_deleted = 0
+        self.keys_failed = 0
+        self._running: Set[int] = set()
+        # Next time a batch may start; shared by all jobs in this process
+        self._next_slot = 0.0
+
+    def collect(self, db: Session, urls: Iterable[Optional[str]]) -> Tuple[List[str], int]:
+        """
+        Split stored object URLs into keys to delete and shared objects to release
+
+        Content-addressed objects may be referenced by other users, so only
+        this reference is dropped; garbage collection removes them once no
+        references remain. Releases are left uncommitted for the caller to
+        commit with its row deletes. URLs outside the storage backend are
+        skipped.
+
+        Returns:
+            (keys to delete, number of references released)
+        """
+        keys = []
+        released = 0
+        for url in urls:
+            key = storage_backend.key_for_url(url) if url else None
+            if key is None:
+                continue
+            if is_content_addressed(key):
+                content_hash = os.path.splitext(os.path.basename(key))[0]
+                if object_catalog.release(db, content_hash) is not None:
+                    released += 1
+            else:
+                keys.append(key)
+        return keys, released
+
+    def create_job(
+        self,
+        db: Session,
+        keys: Iterable[str],
+        reason: str,
+        user_id: Optional[int] = None,
+        released: int = 0
+    ) -> DeletionJob:
+        """Record a deletion job and its keys; run it with run()"""
+        unique_keys = list(dict.fromkeys(keys))
+        job = DeletionJob(
+            user_id=user_id,
+            reason=reason,
+            status="pending" if unique_keys else "completed",
+            total=len(unique_keys),
+            released=released,
+            finished_at=None if unique_keys else datetime.utcnow()
+        )
+        db.add(job)
+        db.flush()
+        db.bulk_insert_mappings(DeletionJobItem, [{"job_id": job.id, "key": key} for key in unique_keys])
+        db.commit()
+        db.refresh(job)
+        return job
+
+    async def _throttle(self):
+        """Wait for the next batch slot under BULK_DELETE_BATCHES_PER_SECOND"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / settings.BULK_DELETE_BATCHES_PER_SECOND
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def delete_keys(self, keys: List[str]) -> List[str]:
+        """
+        Delete one batch under the rate limit, retrying failed keys with backoff
+
+        Writes of these keys still waiting in the write spool are dropped
+        first, so a later flush does not bring the objects back.
+
+        Returns:
+            Keys that still could not be deleted
+        """
+        for key in keys:
+            await write_spool.discard(key)
+        for attempt in range(settings.BULK_DELETE_MAX_ATTEMPTS):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(2 ** attempt)
+            await self._throttle()
+            self.batches += 1
+            try:
+                keys = await storage_backend.delete_batch(keys)
+            except Exception as e:
+                print(f"Delete batch of {len(keys)} keys failed: {e}")
+            if not keys:
+                break
+        return keys
+
+    def _record(self, db: Session, job: DeletionJob, batch: List[Tuple[int, str]], failed: Set[str]):
+        """Mark a finished batch off in the job"""
+        deleted_ids = [item_id for item_id, key in batch if key not in failed]
+        failed_ids = [item_id for item_id, key in batch if key in failed]
+        if deleted_ids:
+            db.query(DeletionJobItem).filter(DeletionJobItem.id.in_(deleted_ids)).update(
+                {DeletionJobItem.status: "deleted", DeletionJobItem.attempts: DeletionJobItem.attempts + 1},
+                synchronize_session=False
+            )
+        if failed_ids:
+            db.query(DeletionJobItem).filter(DeletionJobItem.id.in_(failed_ids)).update(
+                {DeletionJobItem.status: "failed", DeletionJobItem.attempts: DeletionJobItem.attempts + 1},
+                synchronize_session=False
+            )
+        job.deleted += len(deleted_ids)
+        job.failed += len(failed_ids)
+        db.commit()
+        self.keys_deleted += len(deleted_ids)
+        self.keys_failed += len(failed_ids)
+
+    async def run(self, job_id: int):
+        """
+        Delete a job's pending keys
+
+        Batches run BULK_DELETE_CONCURRENCY at a time. Each finished batch is
+        committed, so after a crash or restart only unfinished batches are
+        sent again.
+        """
+        if job_id in self._running:
+            return
+        self._running.add(job_id)
+        db = SessionLocal()
+        try:
+            job = db.query(DeletionJob).filter(DeletionJob.id == job_id).first()
+            if job is None or job.status not in UNFINISHED_STATUSES:
+                return
+            job.status = "running"
+            db.commit()
+            self.jobs_run += 1
+
+            pending = db.query(DeletionJobItem.id, DeletionJobItem.key).filter(
+                DeletionJobItem.job_id == job_id,
+                DeletionJobItem.status == "pending"
+            ).order_by(DeletionJobItem.id).all()
+            size = storage_backend.delete_batch_size
+            batches = [[tuple(item) for item in pending[start:start + size]] for start in range(0, len(pending), size)]
+            limit = asyncio.Semaphore(settings.BULK_DELETE_CONCURRENCY)
+
+            async def delete(batch):
+                async with limit:
+                    failed = await self.delete_keys([key for _, key in batch])
+                self._record(db, job, batch, set(failed))
+
+            await asyncio.gather(*(delete(batch) for batch in batches))
+
+            job.status = "completed_with_errors" if job.failed else "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            self._running.discard(job_id)
+            db.close()
+
+    async def resume_unfinished(self):
+        """Run jobs left pending or interrupted by a restart"""
+        db = SessionLocal()
+        try:
+            job_ids = [
+                job_id for (job_id,) in db.query(DeletionJob.id).filter(
+                    DeletionJob.status.in_(UNFINISHED_STATUSES)
+                ).order_by(DeletionJob.id)
+            ]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            await self.run(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get bulk deletion statistics"""
+        return {
+            "batch_size": storage_backend.delete_batch_size,
+            "jobs_run": self.jobs_run,
+            "running": len(self._running),
+            "batches": self.batches,
+            "retries": self.retries,
+            "keys_deleted": self.keys_deleted,
+            "keys_failed": self.keys_failed
+        }
+
+
+def delete_account_data(db: Session, user: User) -> DeletionJob:
+    """
+    Remove a user's account and rows, and queue their objects for deletion
+
+    Returns:
+        The deletion job for the user's stored objects
+    """
+    uploads = db.query(Upload).filter(Upload.user_id == user.id).all()
+    photos = db.query(GeneratedPhoto).filter(GeneratedPhoto.user_id == user.id).all()
+
+    # Originals are owned through Upload rows; photo.original_url is not a
+    # reference. Expired uploads already gave theirs up
+    urls = [upload.url for upload in uploads if upload.expired_at is None]
+    urls += [url for photo in photos for url in (photo.processed_url, photo.thumbnail_url)]
+    keys, released = bulk_deleter.collect(db, urls)
+
+    user_id = user.id
+    db.query(ImageFingerprint).filter(ImageFingerprint.user_id == user_id).delete(synchronize_session=False)
+    db.query(CreditTransaction).filter(CreditTransaction.user_id == user_id).delete(synchronize_session=False)
+    db.query(GeneratedPhoto).filter(GeneratedPhoto.user_id == user_id).delete(synchronize_session=False)
+    db.query(Upload).filter(Upload.user_id == user_id).delete(synchronize_session=False)
+    db.delete(user)
+
+    # Commits the releases, the row deletes and the job together
+    return bulk_deleter.create_job(db, keys, "account_deletion", user_id=user_id, released=released)
+
+
+def delete_failed_generations(db: Session, older_than: timedelta) -> DeletionJob:
+    """
+    Remove failed generations older than a cutoff and queue any outputs
+    they stored for deletion
+    """
+    photos = db.query(GeneratedPhoto).filter(
+        GeneratedPhoto.status == "failed",
+        GeneratedPhoto.created_at < datetime.utcnow() - older_than
+    ).all()
+
+    keys, released = bulk_deleter.collect(
+        db, [url for photo in photos for url in (photo.processed_url, photo.thumbnail_url)]
+    )
+    photo_ids = [photo.id for photo in photos]
+    for start in range(0, len(photo_ids), 1000):
+        db.query(GeneratedPhoto).filter(
+            GeneratedPhoto.id.in_(photo_ids[start:start + 1000])
+        ).delete(synchronize_session=False)
+
+    return bulk_deleter.create_job(db, keys, "failed_generations", released=released)
+
+
+# Global bulk deleter
+bulk_deleter = BulkDeleter()
@@ -3,6 +3,7 @@ Configuration settings for PhotoPro AI backend.
 Handles environment variables and application settings.
 """
 
+from pydantic import Field
 from pydantic_settings import BaseSettings
 from typing import Optional
 
@@ -22,9 +23,86 @@ class Settings(BaseSettings):
     AWS_BUCKET_NAME: str = ""
     AWS_REGION: str = "us-east-1"
     
+    # Object storage: "s3", "cloudinary" or "local"
+    STORAGE_BACKEND: str = "s3"
+    STORAGE_WORKERS: int = 16  # Threads for blocking SDK calls
+    CLOUDINARY_FOLDER: str = "photopro"
+    LOCAL_STORAGE_DIR: str = "./storage_data"
+    LOCAL_STORAGE_BASE_URL: str = "http://localhost:8000/files"
+    DIRECT_UPLOAD_EXPIRES: int = 900  # Seconds a presigned upload policy stays valid
+    STORAGE_PRIVATE: bool = False  # Hand out presigned read URLs instead of public ones
+    SIGNED_URL_EXPIRES: int = 3600
+    SIGNED_URL_REFRESH_MARGIN: int = 300  # Re-sign this long before expiry; also the signing window
+    SIGNED_URL_CACHE_SIZE: int = 50000
+    BULK_DELETE_CONCURRENCY: int = 4  # Delete batches in flight per job
+    BULK_DELETE_BATCHES_PER_SECOND: float = 2.0  # Across all jobs; Cloudinary's Admin API is rate limited per hour
+    BULK_DELETE_MAX_ATTEMPTS: int = 3
+    GC_GRACE_PERIOD_HOURS: int = 48  # Orphans younger than this may still be mid-upload
+    UPLOAD_RETENTION_DAYS: dict = {"free": 30, "pro": 365, "enterprise": 0}  # Per plan; 0 keeps uploads forever
+    UPLOAD_EXPIRY_INTERVAL_HOURS: float = 6.0  # How often expired uploads are removed; 0 disables
+    RESUMABLE_UPLOAD_DIR: str = "./upload_spool"
+    RESUMABLE_UPLOAD_EXPIRES: int = 24 * 3600  # Seconds an idle resumable upload is kept
+    RESUMABLE_MAX_ACTIVE_PER_USER: int = 5
+    UPLOAD_MANY_MAX_FILES: int = 20
+    UPLOAD_MANY_MAX_BYTES: int = 100 * 1024 * 1024  # Across all files in one request
+    
+    # Write-behind spool for storage writes while the provider is slow or down
+    WRITE_SPOOL_ENABLED: bool = True
+    WRITE_SPOOL_DIR: str = "./write_spool"
+    WRITE_SPOOL_TIMEOUT: float = 2.0  # Seconds a write waits on the provider before it is spooled
+    WRITE_SPOOL_RETRY_SECONDS: float = 5.0  # First flush retry delay, doubled per attempt
+    WRITE_SPOOL_MAX_BACKOFF_SECONDS: float = 300.0
+    WRITE_SPOOL_FLUSH_CONCURRENCY: int = 4
+    
+    # S3 client tuning
+    S3_ENDPOINT_URL: Optional[str] = None  # S3-compatible endpoint (MinIO, moto) instead of AWS
+    S3_MAX_POOL_CONNECTIONS: int = 64  # >= STORAGE_WORKERS * S3_MULTIPART_CONCURRENCY
+    S3_CONNECT_TIMEOUT: float = 5.0
+    S3_READ_TIMEOUT: float = 30.0
+    S3_MAX_ATTEMPTS: int = 3
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024
+    S3_MULTIPART_CHUNKSIZE: int = 8 * 1024 * 1024
+    S3_MULTIPART_CONCURRENCY: int = 4
+    
     # Replicate API
     REPLICATE_API_TOKEN: str = ""
     
+    # Image processing
+    IMAGE_WORKERS: int = 4
+    IMAGE_PIXEL_BUDGET: int = 64 * 1024 * 1024  # Decoded pixels in flight per worker
+    IMAGE_BUDGET_TIMEOUT: float = 10.0  # Seconds to wait for budget before 503
+    MAX_IMAGE_PIXELS: int = 4096 * 4096  # Pillow decompression-bomb limit
+    # Perceptual-hash bits for a near-duplicate; duplicates.MAX_DISTANCE is
+    # the most the band index can search
+    DUPLICATE_MAX_DISTANCE: int = Field(6, ge=0, le=11)
+    
+    # Pre-flight quality gate
+    QUALITY_GATE_MODE: str = "warn"  # off, warn, reject
+    QUALITY_MIN_SHARPNESS: float = 40.0  # Laplacian variance at 256px
+    QUALITY_MIN_BRIGHTNESS: float = 40.0
+    QUALITY_MAX_BRIGHTNESS: float = 225.0
+    QUALITY_MAX_CLIPPED_FRACTION: float = 0.4
+    QUALITY_FACE_CHECK: bool = False  # Requires opencv-python-headless
+    
+    # Outbound HTTP (model outputs, source images)
+    HTTP_TIMEOUT: float = 30.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_PER_HOST: int = 16
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_MAX_DOWNLOAD_BYTES: int = 50 * 1024 * 1024
+    
+    # Local media cache
+    MEDIA_CACHE_DIR: str = "./media_cache"
+    MEDIA_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    
+    # On-the-fly image transforms
+    TRANSFORM_DIMENSIONS: list = [32, 64, 96, 128, 160, 200, 256, 320, 400, 480, 512, 640, 800, 1024, 1280, 1600, 2048]  # Allowed w/h values
+    TRANSFORM_DEFAULT_QUALITY: int = 82
+    
+    # Batch ZIP downloads
+    ZIP_FETCH_CONCURRENCY: int = 4
+    
     # CORS Origins
     CORS_ORIGINS: list = ["http://localhost:3000", "https://photopro-ai.vercel.app"]
     
@@ -0,0 +1,159 @@
+"""
+Direct-to-storage uploads for PhotoPro AI.
+Clients get a presigned POST policy, send the file straight to storage, then
+confirm; the API only reads the object's header bytes to validate it.
+"""
+
+import os
+import time
+import uuid
+from typing import Any, Dict
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+
+from config import settings
+from image_headers import (
+    FORMAT_CONTENT_TYPES, IMAGE_HEADER_BYTES, MAX_IMAGE_HEADER_BYTES,
+    needs_more_header, parse_image_header
+)
+from storage_backends import StorageObjectNotFound, storage_backend
+from utils import (
+    ALLOWED_IMAGE_EXTENSIONS, MAX_UPLOAD_BYTES, prevalidate_image_header, read_exif_orientation
+)
+
+# Signing algorithm for upload tokens (matches auth access tokens)
+ALGORITHM = "HS256"
+
+# Content type each allowed extension must be uploaded with
+EXTENSION_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+
+# How long after the policy expires the upload may still be confirmed
+COMPLETION_GRACE_SECONDS = 3600
+
+
+async def create_upload_intent(user_id: int, filename: str, content_type: str, size: int) -> Dict[str, Any]:
+    """
+    Issue a presigned upload policy for one image
+
+    Args:
+        user_id: Owner of the upload
+        filename: Client file name (only the extension is kept)
+        content_type: MIME type the client will send
+        size: Declared size in bytes
+
+    Returns:
+        Dict with the storage 'url' and form 'fields', the object 'key', and
+        an 'upload_token' to pass to complete_upload
+
+    Raises:
+        HTTPException: 400 if the declared file is not acceptable
+    """
+    extension = os.path.splitext(filename.lower())[1]
+    if extension not in ALLOWED_IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="File must be JPG, PNG, or WEBP format")
+    if EXTENSION_CONTENT_TYPES[extension] != content_type:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Content type for {extension} files must be {EXTENSION_CONTENT_TYPES[extension]}"
+        )
+    if not 0 < size <= MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=400, detail="File size must be less than 10MB")
+
+    key = f"uploads/{user_id}/{uuid.uuid4()}{extension}"
+    expires_in = settings.DIRECT_UPLOAD_EXPIRES
+    policy = await storage_backend.presign_upload(key, content_type, MAX_UPLOAD_BYTES, expires_in)
+
+    upload_token = jwt.encode(
+        {
+            "sub": str(user_id),
+            "type": "upload",
+            "key": key,
+            "filename": filename,
+            "content_type": content_type,
+            "exp": int(time.time()) + expires_in + COMPLETION_GRACE_SECONDS
+        },
+        settings.SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+
+    return {
+        "upload_token": upload_token,
+        "key": key,
+        "url": policy["url"],
+        "fields": policy["fields"],
+        "expires_in": expires_in,
+        "max_bytes": MAX_UPLOAD_BYTES
+    }
+
+
+def decode_upload_token(upload_token: str, user_id: int) -> Dict[str, Any]:
+    """Claims of an upload token issued to this user"""
+    try:
+        claims = jwt.decode(upload_token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=400, detail="Invalid or expired upload token")
+
+    if claims.get("type") != "upload" or claims.get("sub") != str(user_id):
+        raise HTTPException(status_code=400, detail="Invalid or expired upload token")
+    return claims
+
+
+async def complete_upload(upload_token: str, user_id: int) -> Dict[str, Any]:
+    """
+    Validate a directly uploaded object from its header bytes
+
+    Reads at most MAX_IMAGE_HEADER_BYTES of the object; nothing is decoded.
+    Objects that fail validation are deleted from storage.
+
+    Returns:
+        Dict with 'url', 'key', 'filename', 'size', 'format', 'dimensions'
+        and 'exif_orientation'
+
+    Raises:
+        HTTPException: 400 if invalid, 404 if nothing was uploaded
+    """
+    claims = decode_upload_token(upload_token, user_id)
+    key = claims["key"]
+
+    try:
+        header, size = await storage_backend.read_range(key, 0, IMAGE_HEADER_BYTES)
+        while needs_more_header(header) and len(header) < size:
+            chunk, _ = await storage_backend.read_range(key, len(header), IMAGE_HEADER_BYTES)
+            if not chunk:
+                break
+            header += chunk
+    except StorageObjectNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found in storage")
+
+    error = None
+    parsed = parse_image_header(header[:MAX_IMAGE_HEADER_BYTES])
+    is_valid, message = prevalidate_image_header(header, key, size)
+
+    if not is_valid:
+        error = message
+    elif parsed is None:
+        # Without a full decode, an unreadable header cannot be accepted
+        error = "File is not a readable JPG, PNG, or WEBP image"
+    elif FORMAT_CONTENT_TYPES[parsed[0]] != claims["content_type"]:
+        error = "File contents do not match the declared content type"
+
+    if error:
+        await storage_backend.delete(key)
+        raise HTTPException(status_code=400, detail=error)
+
+    image_format, width, height = parsed
+    return {
+        "url": storage_backend.url(key),
+        "key": key,
+        "filename": claims.get("filename", os.path.basename(key)),
+        "size": size,
+        "format": image_format,
+        "dimensions": {"width": width, "height": height},
+        "exif_orientation": read_exif_orientation(header)
+    }
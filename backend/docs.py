@@ -174,15 +174,24 @@ def custom_openapi(app: FastAPI) -> Dict[str, Any]:
                         "properties": {
                             "original_url": {
                                 "type": "string",
-                                "description": "URL of the uploaded image"
+                                "description": "URL of the uploaded image (or pass upload_id)"
+                            },
+                            "upload_id": {
+                                "type": "integer",
+                                "description": "ID returned by /photos/upload; already validated, so preferred over original_url"
                             },
                             "style": {
                                 "type": "string",
                                 "enum": ["corporate", "creative", "formal", "casual"],
                                 "description": "Photo generation style"
+                            },
+                            "reuse_existing": {
+                                "type": "boolean",
+                                "default": True,
+                                "description": "Return an earlier result for a near-duplicate upload instead of generating again"
                             }
                         },
-                        "required": ["original_url", "style"]
+                        "required": ["style"]
                     }
                 }
             }
@@ -242,6 +251,7 @@ def add_examples_to_schema():
             "original_url": "https://bucket.s3.amazonaws.com/uploads/1/image.jpg",
             "processed_url": "https://bucket.s3.amazonaws.com/processed/1/result.jpg",
             "thumbnail_url": "https://bucket.s3.amazonaws.com/thumbnails/1/thumb.jpg",
+            "placeholder": "data:image/webp;base64,UklGRjAAAABXRUJQVlA4ICQAAACQAQCdASoQABAAA4BaJaQAAuaKLwAA/vWhMizPiE59ronAAAA=",
             "credits_used": 1,
             "status": "completed",
             "created_at": "2024-01-15T10:35:00Z"
@@ -0,0 +1,156 @@
+"""
+Near-duplicate upload detection for PhotoPro AI.
+Stores perceptual hashes in an indexed table and finds prior uploads within
+a small Hamming distance using multi-index hashing.
+"""
+
+from itertools import combinations
+from typing import List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import GeneratedPhoto, ImageFingerprint
+from utils import hamming_distance
+
+BAND_BITS = 16
+BAND_COUNT = 4
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Bits flipped per band when probing; radius 2 is 137 values per band, and
+# beyond that the IN lists grow too quickly to be useful
+MAX_PROBE_RADIUS = 2
+# Largest distance the band probes are guaranteed to find
+MAX_DISTANCE = BAND_COUNT * (MAX_PROBE_RADIUS + 1) - 1
+
+
+def to_signed64(value: int) -> int:
+    """Map an unsigned 64-bit hash onto a signed BIGINT column"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_signed64(value: int) -> int:
+    """Inverse of to_signed64"""
+    return value + (1 << 64) if value < 0 else value
+
+
+def split_bands(phash: int) -> List[int]:
+    """Split a 64-bit hash into four 16-bit bands"""
+    return [(phash >> (BAND_BITS * i)) & BAND_MASK for i in range(BAND_COUNT)]
+
+
+def band_neighbours(band: int, radius: int) -> List[int]:
+    """All band values within `radius` bits of `band`"""
+    values = [band]
+    for flipped in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), flipped):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            values.append(band ^ mask)
+    return values
+
+
+def record_fingerprint(db: Session, user_id: int, image_url: str, phash: int) -> ImageFingerprint:
+    """Store the perceptual hash of an uploaded image"""
+    bands = split_bands(phash)
+    fingerprint = ImageFingerprint(
+        user_id=user_id,
+        image_url=image_url,
+        phash=to_signed64(phash),
+        band0=bands[0],
+        band1=bands[1],
+        band2=bands[2],
+        band3=bands[3]
+    )
+    db.add(fingerprint)
+    db.commit()
+    return fingerprint
+
+
+def find_near_duplicates(
+    db: Session,
+    user_id: int,
+    phash: int,
+    max_distance: Optional[int] = None
+) -> List[ImageFingerprint]:
+    """
+    Find a user's prior uploads within `max_distance` bits of `phash`
+
+    By pigeonhole, any hash within distance d matches at least one band to
+    within d // 4 bits, so each band is probed through its own index and
+    only that small candidate set is compared in full.
+
+    Args:
+        db: Database session
+        user_id: Owner of the uploads to search
+        phash: Unsigned 64-bit perceptual hash
+        max_distance: Hamming distance limit (defaults to the configured one)
+
+    Returns:
+        list: Matching fingerprints, closest first
+
+    Raises:
+        ValueError: If max_distance is above MAX_DISTANCE
+    """
+    if max_distance is None:
+        max_distance = settings.DUPLICATE_MAX_DISTANCE
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f"max_distance must be between 0 and {MAX_DISTANCE}")
+
+    radius = max_distance // BAND_COUNT
+    band_columns = [
+        ImageFingerprint.band0, ImageFingerprint.band1,
+        ImageFingerprint.band2, ImageFingerprint.band3
+    ]
+
+    candidates = db.query(ImageFingerprint).filter(
+        ImageFingerprint.user_id == user_id,
+        or_(*[
+            column.in_(band_neighbours(band, radius))
+            for column, band in zip(band_columns, split_bands(phash))
+        ])
+    ).all()
+
+    matches = [
+        (hamming_distance(phash, from_signed64(candidate.phash)), candidate)
+        for candidate in candidates
+    ]
+    matches = [match for match in matches if match[0] <= max_distance]
+    matches.sort(key=lambda match: (match[0], -match[1].id))
+    return [candidate for _, candidate in matches]
+
+
+def find_reusable_photo(
+    db: Session,
+    user_id: int,
+    original_url: str,
+    style: str
+) -> Optional[GeneratedPhoto]:
+    """
+    Find a completed generation of a near-duplicate of `original_url`
+
+    Returns:
+        GeneratedPhoto or None if the source was never fingerprinted or no
+        near-duplicate has a completed photo in this style
+    """
+    fingerprint = db.query(ImageFingerprint).filter(
+        ImageFingerprint.user_id == user_id,
+        ImageFingerprint.image_url == original_url
+    ).order_by(ImageFingerprint.id.desc()).first()
+
+    if not fingerprint:
+        return None
+
+    duplicates = find_near_duplicates(db, user_id, from_signed64(fingerprint.phash))
+    duplicate_urls = {duplicate.image_url for duplicate in duplicates}
+    if not duplicate_urls:
+        return None
+
+    return db.query(GeneratedPhoto).filter(
+        GeneratedPhoto.user_id == user_id,
+        GeneratedPhoto.style == style,
+        GeneratedPhoto.status == "completed",
+        GeneratedPhoto.original_url.in_(duplicate_urls)
+    ).order_by(GeneratedPhoto.created_at.desc()).first()
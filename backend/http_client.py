@@ -0,0 +1,182 @@
+"""
+Shared outbound HTTP client for PhotoPro AI.
+One pooled, keep-alive, HTTP/2-capable client per process for downloading
+model outputs and source images, with per-host concurrency limits.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import settings
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Per-host limits kept for hosts with no request in flight; the least
+# recently used idle ones are dropped beyond this
+MAX_TRACKED_HOSTS = 1024
+
+
+class DownloadTooLarge(Exception):
+    """Raised when a response body exceeds the caller's byte limit"""
+
+
+class PooledHTTPClient:
+    """
+    Process-wide async HTTP client with connection reuse
+
+    The pool and per-host limits belong to one event loop, so they are
+    created by start() and dropped by close() on the application's own
+    startup and shutdown.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        # host -> (limit, requests in flight), least recently used first
+        self._host_limits: "OrderedDict[str, list]" = OrderedDict()
+        self.downloads = 0
+        self.failures = 0
+        self.bytes_downloaded = 0
+        self.total_latency = 0.0
+        self.tcp_connects = 0
+        self.tls_handshakes = 0
+
+    async def start(self):
+        """Open the connection pool on the running event loop (application startup)"""
+        await self.close()
+        self._client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("HTTP client is not started")
+        return self._client
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """Hold one of the host's HTTP_MAX_PER_HOST request slots"""
+        host = urlsplit(url).netloc
+        entry = self._host_limits.get(host)
+        if entry is None:
+            entry = self._host_limits[host] = [asyncio.Semaphore(settings.HTTP_MAX_PER_HOST), 0]
+            self._evict_idle_hosts()
+        self._host_limits.move_to_end(host)
+
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+
+    def _evict_idle_hosts(self):
+        # Hosts with requests in flight keep their limit however many there are
+        excess = len(self._host_limits) - MAX_TRACKED_HOSTS
+        for host in list(self._host_limits):
+            if excess <= 0:
+                break
+            if not self._host_limits[host][1]:
+                del self._host_limits[host]
+                excess -= 1
+
+    async def _trace(self, event: str, info: Dict[str, Any]):
+        # httpcore connection events; lets us see how often the pool misses
+        if event == "connection.connect_tcp.complete":
+            self.tcp_connects += 1
+        elif event == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    async def stream(
+        self,
+        url: str,
+        max_bytes: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream a response body in chunks
+
+        Args:
+            url: URL to download
+            max_bytes: Abort if the body grows beyond this many bytes
+                (defaults to HTTP_MAX_DOWNLOAD_BYTES)
+            headers: Extra request headers (e.g. Range)
+
+        Raises:
+            httpx.HTTPError: On connection errors or non-2xx responses
+            DownloadTooLarge: If max_bytes is exceeded
+        """
+        if max_bytes is None:
+            max_bytes = settings.HTTP_MAX_DOWNLOAD_BYTES
+        started = time.perf_counter()
+        received = 0
+
+        try:
+            async with self._host_slot(url):
+                async with self._get_client().stream(
+                    "GET", url, headers=headers, extensions={"trace": self._trace}
+                ) as response:
+                    response.raise_for_status()
+
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        received += len(chunk)
+                        if received > max_bytes:
+                            raise DownloadTooLarge(f"Response from {url} exceeds {max_bytes} bytes")
+                        yield chunk
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.bytes_downloaded += received
+
+        self.downloads += 1
+        self.total_latency += time.perf_counter() - started
+
+    async def fetch_bytes(
+        self,
+        url: str,
+        max_bytes: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> bytes:
+        """Download a whole response body into memory"""
+        chunks = [chunk async for chunk in self.stream(url, max_bytes, headers)]
+        return b"".join(chunks)
+
+    async def close(self):
+        """Close pooled connections (application shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._host_limits.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Download counters for the metrics endpoint"""
+        return {
+            "downloads": self.downloads,
+            "failures": self.failures,
+            "bytes_downloaded": self.bytes_downloaded,
+            "avg_latency_ms": round(self.total_latency / self.downloads * 1000, 2) if self.downloads else 0,
+            "tcp_connects": self.tcp_connects,
+            "tls_handshakes": self.tls_handshakes,
+            "tracked_hosts": len(self._host_limits),
+            # Failed downloads also connect, so this can otherwise go negative
+            "connection_reuse_rate": round(
+                max(0.0, 1 - self.tcp_connects / self.downloads) * 100, 2
+            ) if self.downloads else 0
+        }
+
+
+# Global HTTP client instance
+http_client = PooledHTTPClient()
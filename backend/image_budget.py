@@ -0,0 +1,150 @@
+"""
+Decoded-pixel admission control for PhotoPro AI.
+Bounds how many megapixels are decoded at once across concurrent uploads,
+optimizations and thumbnails, and runs the decode work off the event loop.
+"""
+
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from PIL import Image
+
+from config import settings
+from image_headers import MAX_IMAGE_HEADER_BYTES, parse_image_header
+
+Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+
+
+def open_image(image_content: bytes) -> Image.Image:
+    """
+    Lazily open an image, refusing it before decode if it exceeds MAX_IMAGE_PIXELS
+
+    Pillow itself only warns until twice the limit.
+
+    Raises:
+        Image.DecompressionBombError: If width * height exceeds MAX_IMAGE_PIXELS
+    """
+    image = Image.open(io.BytesIO(image_content))
+    if Image.MAX_IMAGE_PIXELS and image.width * image.height > Image.MAX_IMAGE_PIXELS:
+        raise Image.DecompressionBombError(
+            f"Image size ({image.width * image.height} pixels) exceeds limit of "
+            f"{Image.MAX_IMAGE_PIXELS} pixels"
+        )
+    return image
+
+
+class PixelBudget:
+    """Async semaphore measured in decoded pixels rather than requests"""
+
+    def __init__(self, capacity: int, timeout: float):
+        self.capacity = capacity
+        self.timeout = timeout
+        self.in_use = 0
+        self.peak = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def reserve(self, pixels: int):
+        """
+        Hold part of the budget while an image is decoded
+
+        Args:
+            pixels: Decoded pixel count (width * height) of the image
+
+        Raises:
+            HTTPException: 503 if the budget does not free up in time
+        """
+        # A single image larger than the budget runs on its own
+        pixels = min(max(pixels, 1), self.capacity)
+        condition = self._get_condition()
+
+        async with condition:
+            if self.in_use + pixels > self.capacity:
+                self.delayed += 1
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: self.in_use + pixels <= self.capacity),
+                        timeout=self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Server is busy processing images. Please try again shortly.",
+                        headers={"Retry-After": "5"}
+                    )
+                finally:
+                    self.waiting -= 1
+
+            self.in_use += pixels
+            self.admitted += 1
+            self.peak = max(self.peak, self.in_use)
+
+        try:
+            yield
+        finally:
+            async with condition:
+                self.in_use -= pixels
+                condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Current budget usage for the metrics endpoint"""
+        return {
+            "capacity_pixels": self.capacity,
+            "in_use_pixels": self.in_use,
+            "in_use_percent": round(self.in_use / self.capacity * 100, 2) if self.capacity else 0,
+            "peak_pixels": self.peak,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected
+        }
+
+
+def header_pixels(image_content: bytes) -> int:
+    """Decoded pixel count from the image header, or the maximum if unknown"""
+    parsed = parse_image_header(image_content[:MAX_IMAGE_HEADER_BYTES])
+    if parsed is None:
+        return settings.MAX_IMAGE_PIXELS
+    _, width, height = parsed
+    return width * height
+
+
+async def run_image_task(func: Callable, *args) -> Any:
+    """Run blocking Pillow work on the image executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(image_executor, func, *args)
+
+
+async def run_decode(image_content: bytes, func: Callable, *args, output_pixels: int = 0) -> Any:
+    """
+    Admit a decode against the pixel budget and run it on the image executor
+
+    output_pixels reserves room for an output image allocated alongside the
+    decoded source, e.g. a resize larger than the JPEG draft.
+    """
+    async with pixel_budget.reserve(header_pixels(image_content) + output_pixels):
+        return await run_image_task(func, image_content, *args)
+
+
+# Global image executor and pixel budget
+image_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix="image"
+)
+pixel_budget = PixelBudget(settings.IMAGE_PIXEL_BUDGET, settings.IMAGE_BUDGET_TIMEOUT)
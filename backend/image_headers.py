@@ -0,0 +1,159 @@
+"""
+Header-only image inspection for PhotoPro AI.
+Sniffs the container format and reads dimensions from the first bytes of a
+JPEG, PNG or WebP file without decoding any pixel data.
+"""
+
+import struct
+from typing import Optional, Tuple
+
+# First read used to sniff an upload; PNG and WebP need far less than this
+IMAGE_HEADER_BYTES = 8 * 1024
+
+# JPEG APP segments (EXIF thumbnails, ICC profiles) can push the SOF marker
+# past the first read, so allow up to one maximum-size segment plus slack
+MAX_IMAGE_HEADER_BYTES = 72 * 1024
+
+# File extension and MIME type for each sniffed format
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+FORMAT_CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8"
+
+# Start-of-frame markers carrying the frame dimensions (excludes DHT, JPG, DAC)
+JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3,
+    0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB,
+    0xCD, 0xCE, 0xCF,
+}
+
+# Markers that stand alone without a length field
+JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+
+def sniff_image_format(data: bytes) -> Optional[str]:
+    """Identify the image format from its magic bytes (PIL naming)"""
+    if data.startswith(JPEG_SIGNATURE):
+        return "JPEG"
+    if data.startswith(PNG_SIGNATURE):
+        return "PNG"
+    if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _parse_jpeg(data: bytes) -> Optional[Tuple[int, int]]:
+    """Walk JPEG segments until the first SOF marker"""
+    offset = 2
+    length = len(data)
+
+    while offset < length:
+        # Every segment starts with one or more 0xFF fill bytes
+        if data[offset] != 0xFF:
+            return None
+        while offset < length and data[offset] == 0xFF:
+            offset += 1
+        if offset >= length:
+            return None
+
+        marker = data[offset]
+        offset += 1
+
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD8, 0xD9, 0xDA):
+            # Second SOI, EOI or start of scan before any frame header
+            return None
+
+        if offset + 2 > length:
+            return None
+        segment_length = struct.unpack(">H", data[offset:offset + 2])[0]
+        if segment_length < 2:
+            return None
+
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 7 > length or segment_length < 7:
+                return None
+            height, width = struct.unpack(">HH", data[offset + 3:offset + 7])
+            return width, height
+
+        offset += segment_length
+
+    return None
+
+
+def _parse_png(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read dimensions from the IHDR chunk that must follow the signature"""
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", data[16:24])
+    return width, height
+
+
+def _parse_webp(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read dimensions from the first VP8, VP8L or VP8X chunk"""
+    if len(data) < 30:
+        return None
+
+    chunk = data[12:16]
+
+    if chunk == b"VP8 ":
+        # Lossy bitstream: 3-byte frame tag, start code, then 14-bit sizes
+        if data[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+
+    if chunk == b"VP8L":
+        # Lossless bitstream: signature byte then packed 14-bit (size - 1)
+        if data[20] != 0x2F:
+            return None
+        bits = struct.unpack("<I", data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+
+    if chunk == b"VP8X":
+        # Extended format: 24-bit (canvas size - 1) after the flags
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+
+    return None
+
+
+def parse_image_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Read format and dimensions from the leading bytes of an image
+
+    Args:
+        data: The first bytes of the file (see IMAGE_HEADER_BYTES)
+
+    Returns:
+        (format, width, height), or None if the format is unknown or the
+        header is incomplete or malformed
+    """
+    image_format = sniff_image_format(data)
+
+    if image_format == "JPEG":
+        size = _parse_jpeg(data)
+    elif image_format == "PNG":
+        size = _parse_png(data)
+    elif image_format == "WEBP":
+        size = _parse_webp(data)
+    else:
+        return None
+
+    if size is None:
+        return None
+
+    return image_format, size[0], size[1]
+
+
+def needs_more_header(data: bytes) -> bool:
+    """Whether a longer prefix could still yield the image dimensions"""
+    return (
+        sniff_image_format(data) == "JPEG"
+        and _parse_jpeg(data) is None
+        and len(data) < MAX_IMAGE_HEADER_BYTES
+    )
@@ -0,0 +1,170 @@
+"""
+Pre-flight image quality gate for PhotoPro AI.
+Scores blur, exposure and (optionally) face presence on a downscaled copy of
+an upload so unusable inputs are caught before a credit or model call is spent.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import settings
+from image_budget import open_image
+
+try:
+    import cv2
+except ImportError:  # Face check is optional
+    cv2 = None
+
+# Longest side of the analysis copy
+ANALYSIS_SIZE = 256
+
+_face_detector = None
+
+
+def _get_face_detector():
+    """Load the OpenCV Haar cascade once, if OpenCV is installed"""
+    global _face_detector
+    if _face_detector is None and cv2 is not None:
+        _face_detector = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+    return _face_detector
+
+
+def locate_faces(gray: np.ndarray) -> Optional[List[Tuple[int, int, int, int]]]:
+    """Frontal face boxes (x, y, w, h), or None if OpenCV is unavailable"""
+    detector = _get_face_detector()
+    if detector is None:
+        return None
+    faces = detector.detectMultiScale(
+        gray.astype(np.uint8), scaleFactor=1.1, minNeighbors=5, minSize=(24, 24)
+    )
+    return [tuple(int(v) for v in face) for face in faces]
+
+
+def _detect_face(gray: np.ndarray) -> Optional[bool]:
+    """Whether a frontal face is visible, or None if the check is unavailable"""
+    faces = locate_faces(gray)
+    if faces is None:
+        return None
+    return len(faces) > 0
+
+
+def assess_image_quality(image_content: bytes) -> Dict[str, Any]:
+    """
+    Measure sharpness and exposure of an image
+
+    Args:
+        image_content: Encoded image bytes
+
+    Returns:
+        Dict with sharpness (variance of the Laplacian), brightness (mean
+        luma 0-255), fractions of crushed shadows and blown highlights, and
+        face_detected (None when the face check is disabled or unavailable)
+    """
+    image = open_image(image_content)
+    image.draft('L', (ANALYSIS_SIZE, ANALYSIS_SIZE))
+    image = ImageOps.exif_transpose(image).convert('L')
+    image.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.Resampling.BILINEAR)
+
+    gray = np.asarray(image, dtype=np.float32)
+
+    # 4-neighbour Laplacian over the interior, computed with array slices
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    total = histogram.sum()
+
+    return {
+        "sharpness": round(float(laplacian.var()), 2),
+        "brightness": round(float(gray.mean()), 2),
+        "dark_fraction": round(float(histogram[:16].sum() / total), 4),
+        "bright_fraction": round(float(histogram[240:].sum() / total), 4),
+        "face_detected": _detect_face(gray) if settings.QUALITY_FACE_CHECK else None
+    }
+
+
+class QualityGate:
+    """Applies quality thresholds and tracks how often inputs fail them"""
+
+    def __init__(self):
+        self.checked = 0
+        self.warned = 0
+        self.rejected = 0
+        self.issue_counts: Dict[str, int] = {}
+
+    @property
+    def thresholds(self) -> Dict[str, Any]:
+        return {
+            "mode": settings.QUALITY_GATE_MODE,
+            "min_sharpness": settings.QUALITY_MIN_SHARPNESS,
+            "min_brightness": settings.QUALITY_MIN_BRIGHTNESS,
+            "max_brightness": settings.QUALITY_MAX_BRIGHTNESS,
+            "max_clipped_fraction": settings.QUALITY_MAX_CLIPPED_FRACTION,
+            "face_check": settings.QUALITY_FACE_CHECK and cv2 is not None
+        }
+
+    def find_issues(self, report: Dict[str, Any]) -> List[str]:
+        """List the thresholds a quality report fails"""
+        issues = []
+
+        if report["sharpness"] < settings.QUALITY_MIN_SHARPNESS:
+            issues.append("Image is too blurry")
+
+        if report["brightness"] < settings.QUALITY_MIN_BRIGHTNESS:
+            issues.append("Image is too dark")
+        elif report["brightness"] > settings.QUALITY_MAX_BRIGHTNESS:
+            issues.append("Image is overexposed")
+
+        clipped = report["dark_fraction"] + report["bright_fraction"]
+        if clipped > settings.QUALITY_MAX_CLIPPED_FRACTION:
+            issues.append("Too much of the image is pure black or white")
+
+        if report["face_detected"] is False:
+            issues.append("No face detected")
+
+        return issues
+
+    def evaluate(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Decide whether an input may proceed
+
+        Returns:
+            The report plus 'issues' and 'passed'; 'passed' is only False
+            when the gate runs in reject mode
+        """
+        issues = self.find_issues(report)
+
+        self.checked += 1
+        for issue in issues:
+            self.issue_counts[issue] = self.issue_counts.get(issue, 0) + 1
+
+        passed = True
+        if issues:
+            if settings.QUALITY_GATE_MODE == "reject":
+                self.rejected += 1
+                passed = False
+            else:
+                self.warned += 1
+
+        return {**report, "issues": issues, "passed": passed}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thresholds and outcome counts for the metrics endpoint"""
+        return {
+            "thresholds": self.thresholds,
+            "checked": self.checked,
+            "warned": self.warned,
+            "rejected": self.rejected,
+            "rejection_rate": round(self.rejected / self.checked * 100, 2) if self.checked else 0,
+            "issues": dict(self.issue_counts)
+        }
+
+
+# Global quality gate instance
+quality_gate = QualityGate()
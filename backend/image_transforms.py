@@ -0,0 +1,307 @@
+"""
+Local image transformation service for PhotoPro AI.
+Resizes, crops and re-encodes cached originals on the image executor so
+derivatives no longer depend on provider-side URL transforms, and the same
+parameters give the same bytes whichever storage backend holds the source.
+"""
+
+import asyncio
+import io
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from PIL import Image, ImageOps
+
+from config import settings
+from image_budget import header_pixels, open_image, run_decode
+from image_headers import FORMAT_CONTENT_TYPES
+from image_quality import locate_faces
+from media_cache import media_cache
+
+# cover: crop to fill the box, contain: fit inside it, scale: stretch to it;
+# none of them enlarges the source
+FIT_MODES = ("cover", "contain", "scale")
+GRAVITIES = ("center", "face")
+OUTPUT_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+# Longest side of the grayscale copy used to find a face for gravity=face
+FACE_SEARCH_SIZE = 512
+
+
+def build_transform(
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    fit: str = "cover",
+    gravity: str = "center",
+    output_format: str = "jpeg",
+    quality: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Validate and normalise transformation parameters
+
+    Raises:
+        HTTPException: 400 if any parameter is out of range
+    """
+    if width is None and height is None:
+        raise HTTPException(status_code=400, detail="Specify a width, a height, or both")
+
+    # The endpoint is public: a fixed set of sizes bounds how many variants
+    # (and renders) one original can be made to produce
+    for name, value in (("width", width), ("height", height)):
+        if value is not None and value not in settings.TRANSFORM_DIMENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{name} must be one of: {', '.join(map(str, settings.TRANSFORM_DIMENSIONS))}"
+            )
+
+    if fit not in FIT_MODES:
+        raise HTTPException(status_code=400, detail=f"fit must be one of: {', '.join(FIT_MODES)}")
+    if gravity not in GRAVITIES:
+        raise HTTPException(status_code=400, detail=f"gravity must be one of: {', '.join(GRAVITIES)}")
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format must be one of: {', '.join(OUTPUT_FORMATS)}"
+        )
+
+    if quality is None:
+        quality = settings.TRANSFORM_DEFAULT_QUALITY
+    if not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be between 1 and 100")
+
+    # With a single dimension every fit mode is a proportional resize
+    if width is None or height is None:
+        fit, gravity = "contain", "center"
+    if fit != "cover":
+        gravity = "center"
+    if output_format == "png":
+        quality = 100
+
+    return {
+        "width": width,
+        "height": height,
+        "fit": fit,
+        "gravity": gravity,
+        "format": output_format,
+        "quality": quality
+    }
+
+
+def transform_variant(params: Dict[str, Any]) -> str:
+    """Media cache variant name for a normalised transformation"""
+    return (
+        f"t_w{params['width'] or 0}_h{params['height'] or 0}"
+        f"_{params['fit']}_{params['gravity']}_q{params['quality']}.{params['format']}"
+    )
+
+
+def _focal_point(image: Image.Image, gravity: str) -> Tuple[float, float]:
+    """Point (in image coordinates) a cover crop is centred on"""
+    width, height = image.size
+    centre = (width / 2, height / 2)
+    if gravity != "face":
+        return centre
+
+    search = image.convert('L')
+    search.thumbnail((FACE_SEARCH_SIZE, FACE_SEARCH_SIZE), Image.Resampling.BILINEAR)
+    faces = locate_faces(np.asarray(search))
+    if not faces:
+        # No OpenCV or no face found: behave like gravity=center
+        return centre
+
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    scale = width / search.size[0]
+    return (x + w / 2) * scale, (y + h / 2) * scale
+
+
+def output_pixels(params: Dict[str, Any], source_pixels: int) -> int:
+    """Upper bound on a derivative's pixel count; no fit enlarges the source"""
+    width, height = params["width"], params["height"]
+    if width is not None and height is not None:
+        return min(width * height, source_pixels)
+    return min(max(width or 0, height or 0) ** 2, source_pixels)
+
+
+def _output_size(source: Tuple[int, int], params: Dict[str, Any]) -> Tuple[int, int]:
+    """Final pixel size for contain and scale fits"""
+    source_width, source_height = source
+    width, height = params["width"], params["height"]
+
+    if params["fit"] == "scale":
+        # Stretches, but never beyond the source on either axis
+        return min(width, source_width), min(height, source_height)
+
+    ratios = []
+    if width is not None:
+        ratios.append(width / source_width)
+    if height is not None:
+        ratios.append(height / source_height)
+    # contain never enlarges the source
+    ratio = min(ratios + [1.0])
+    return max(1, round(source_width * ratio)), max(1, round(source_height * ratio))
+
+
+def apply_transform(image_content: bytes, params: Dict[str, Any]) -> bytes:
+    """
+    Resize, crop and encode an image according to normalised parameters
+
+    Args:
+        image_content: Encoded source image
+        params: Output of build_transform
+
+    Returns:
+        bytes: Encoded derivative (metadata stripped apart from the ICC profile)
+    """
+    image = open_image(image_content)
+
+    # Let the JPEG decoder downscale by 1/2-1/8 while staying above the
+    # target; orientation is not known yet, so use the longest side for both
+    longest = max(params["width"] or 0, params["height"] or 0)
+    image.draft('RGB', (longest, longest))
+
+    icc_profile = image.info.get("icc_profile")
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode == 'P':
+        image = image.convert('RGBA' if "transparency" in image.info else 'RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+
+    if params["fit"] == "cover":
+        width, height = params["width"], params["height"]
+        source_width, source_height = image.size
+        ratio = max(width / source_width, height / source_height)
+        crop_width, crop_height = width / ratio, height / ratio
+        if ratio > 1:
+            # Too small to fill the box: keep the crop at source resolution
+            width, height = max(1, round(crop_width)), max(1, round(crop_height))
+
+        focus_x, focus_y = _focal_point(image, params["gravity"])
+        left = min(max(focus_x - crop_width / 2, 0), source_width - crop_width)
+        top = min(max(focus_y - crop_height / 2, 0), source_height - crop_height)
+
+        image = image.resize(
+            (width, height),
+            Image.Resampling.LANCZOS,
+            box=(left, top, left + crop_width, top + crop_height)
+        )
+    else:
+        size = _output_size(image.size, params)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS)
+
+    output_format = OUTPUT_FORMATS[params["format"]]
+    save_kwargs: Dict[str, Any] = {}
+    if icc_profile:
+        save_kwargs["icc_profile"] = icc_profile
+
+    if output_format == "JPEG":
+        # JPEG has no alpha channel
+        if image.mode == 'RGBA':
+            image = image.convert('RGB')
+        save_kwargs.update(quality=params["quality"], optimize=True)
+    elif output_format == "WEBP":
+        save_kwargs.update(quality=params["quality"], method=4)
+    else:
+        save_kwargs.update(optimize=True)
+
+    output = io.BytesIO()
+    image.save(output, format=output_format, **save_kwargs)
+    return output.getvalue()
+
+
+class TransformService:
+    """Cached, single-flight rendering of transformation variants"""
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.requests = 0
+        self.cache_hits = 0
+        self.renders = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.render_time = 0.0
+
+    async def get(
+        self,
+        content_hash: str,
+        params: Dict[str, Any],
+        load_source: Callable[[], Awaitable[bytes]]
+    ) -> Tuple[str, int, str]:
+        """
+        Return a cached derivative, rendering it once if missing
+
+        Args:
+            content_hash: Hash of the original in the media cache
+            params: Output of build_transform
+            load_source: Coroutine function returning the original bytes
+
+        Returns:
+            (path, size, content_type) of the derivative on local disk
+        """
+        self.requests += 1
+        variant = transform_variant(params)
+
+        entry = await media_cache.lookup(content_hash, variant)
+        if entry is not None:
+            self.cache_hits += 1
+            return entry
+
+        # Concurrent requests for the same variant share one render
+        key = (content_hash, variant)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(content_hash, variant, params, load_source))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one client disconnecting does not cancel the others' render
+        return await asyncio.shield(task)
+
+    async def _render(
+        self,
+        content_hash: str,
+        variant: str,
+        params: Dict[str, Any],
+        load_source: Callable[[], Awaitable[bytes]]
+    ) -> Tuple[str, int, str]:
+        try:
+            source = await load_source()
+            started = time.perf_counter()
+            data = await run_decode(
+                source, apply_transform, params,
+                output_pixels=output_pixels(params, header_pixels(source))
+            )
+            self.render_time += time.perf_counter() - started
+        except HTTPException:
+            self.failures += 1
+            raise
+        except Exception as e:
+            self.failures += 1
+            print(f"Image transform failed: {str(e)}")
+            raise HTTPException(status_code=422, detail="Image could not be transformed")
+
+        self.renders += 1
+        content_type = FORMAT_CONTENT_TYPES[OUTPUT_FORMATS[params["format"]]]
+        path = await media_cache.put(content_hash, variant, data, content_type)
+        return path, len(data), content_type
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Transformation counters for the metrics endpoint"""
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "renders": self.renders,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "in_flight": len(self._inflight),
+            "avg_render_ms": round(self.render_time / self.renders * 1000, 2) if self.renders else 0
+        }
+
+
+# Global transform service instance
+transform_service = TransformService()
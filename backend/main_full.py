@@ -3,25 +3,31 @@ PhotoPro AI - FastAPI Backend
 Main application entry point with all routes and middleware configuration.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, WebSocket
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, WebSocket, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import List, Optional
 import os
-import boto3
 import replicate
 from PIL import Image
 import io
-import uuid
+import base64
+import hmac
+import json
+import time
 import asyncio
+import mimetypes
 
-from database import get_db, engine, Base
-from models import User, GeneratedPhoto, CreditTransaction
+from database import get_db, engine, Base, SessionLocal
+from models import User, GeneratedPhoto, CreditTransaction, Upload
 from schemas import (
     UserCreate, UserResponse, UserLogin, Token, PhotoGenerate, 
-    PhotoResponse, CreditPurchase, CreditHistoryResponse
+    PhotoResponse, CreditPurchase, CreditHistoryResponse, GallerySpriteResponse,
+    UploadIntentRequest, UploadCompleteRequest, ResumableUploadCreate, UploadResponse,
+    DeletionJobResponse
 )
 from auth import (
     get_password_hash, verify_password, create_access_token, 
@@ -30,10 +36,39 @@ from auth import (
 from config import settings
 from middleware import RateLimitMiddleware, LoggingMiddleware, ErrorHandlingMiddleware
 from websocket import websocket_endpoint, notify_photo_status_update, notify_photo_completed, notify_photo_failed, notify_credits_updated
-from utils import validate_image_file, optimize_image_for_upload, generate_thumbnail, validate_style
+from utils import (
+    validate_image_file, prevalidate_image_header, read_image_header,
+    optimize_image_for_upload, create_thumbnail_with_placeholder, validate_style,
+    compute_perceptual_hash, calculate_file_hash, format_file_size, read_exif_orientation
+)
+from duplicates import record_fingerprint, find_near_duplicates, find_reusable_photo
 from admin import admin_router
 from docs import custom_openapi
-from monitoring import get_system_metrics, get_application_metrics, get_health_status, get_detailed_health
+from monitoring import (
+    get_system_metrics, get_application_metrics, get_health_status,
+    get_detailed_health, get_pipeline_metrics
+)
+from image_budget import pixel_budget, header_pixels, run_image_task, run_decode
+from image_quality import assess_image_quality, quality_gate
+from http_client import http_client
+from output_pipeline import output_fan_out
+from image_headers import sniff_image_format, FORMAT_CONTENT_TYPES
+from media_cache import media_cache, serve_media_file, is_valid_key
+from image_transforms import transform_service, build_transform, transform_variant
+from zip_stream import ZipSource, stream_zip
+from storage_backends import storage_backend, sign_local_key, sign_local_upload
+from direct_uploads import create_upload_intent, complete_upload, decode_upload_token
+from resumable_uploads import resumable_uploads, parse_upload_checksum
+from object_catalog import object_catalog, is_content_addressed
+from url_signing import url_signer, PHOTO_URL_FIELDS, UPLOAD_URL_FIELDS
+from bulk_deletion import bulk_deleter, delete_account_data
+from storage_gc import garbage_collector
+from upload_expiry import upload_expiry
+from write_spool import write_spool
+from sprites import (
+    sprite_key, sprite_pixels, compose_sprite, SPRITE_DEFAULT_TILES, SPRITE_MAX_TILES,
+    SPRITE_DEFAULT_TILE_SIZE, SPRITE_TILE_SIZES, SPRITE_IMAGE_VARIANT, SPRITE_MAP_VARIANT
+)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -70,18 +105,46 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 # Include admin router
 app.include_router(admin_router)
 
-# AWS S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    region_name=settings.AWS_REGION
-)
-
 # Replicate client
 replicate_client = replicate.Client(api_token=settings.REPLICATE_API_TOKEN)
 
 
+@app.on_event("startup")
+async def start_http_client():
+    """Open the outbound connection pool on the server's event loop"""
+    await http_client.start()
+
+
+@app.on_event("startup")
+async def resume_deletion_jobs():
+    """Finish bulk deletions interrupted by a restart"""
+    asyncio.ensure_future(bulk_deleter.resume_unfinished())
+
+
+@app.on_event("startup")
+async def resume_storage_gc():
+    """Continue garbage collection runs interrupted by a restart"""
+    asyncio.ensure_future(garbage_collector.resume_interrupted())
+
+
+@app.on_event("startup")
+async def schedule_upload_expiry():
+    """Remove uploads past their plan's retention on an interval"""
+    asyncio.ensure_future(upload_expiry.run_periodically())
+
+
+@app.on_event("startup")
+async def flush_write_spool():
+    """Flush storage writes spooled while the provider was unavailable"""
+    asyncio.ensure_future(write_spool.run())
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Release pooled outbound connections"""
+    await http_client.close()
+
+
 @app.get("/")
 async def root():
     """API information endpoint"""
@@ -116,6 +179,12 @@ async def application_metrics(db: Session = Depends(get_db)):
     return get_application_metrics(db)
 
 
+@app.get("/metrics/pipeline")
+async def pipeline_metrics():
+    """Get image pipeline metrics"""
+    return get_pipeline_metrics()
+
+
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws/{user_id}")
 async def websocket_route(websocket: WebSocket, user_id: int):
@@ -191,6 +260,23 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+@app.delete("/users/me", response_model=DeletionJobResponse, status_code=202)
+async def delete_current_user(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Delete the current account and all its data
+    
+    Account rows go immediately; stored objects are removed by a bulk
+    deletion job whose progress is returned.
+    """
+    job = delete_account_data(db, current_user)
+    background_tasks.add_task(bulk_deleter.run, job.id)
+    return job
+
+
 @app.get("/users/me/credits")
 async def get_user_credits(current_user: User = Depends(get_current_user)):
     """Get user's current credit balance"""
@@ -201,69 +287,505 @@ async def get_user_credits(current_user: User = Depends(get_current_user)):
 @app.post("/photos/upload")
 async def upload_photo(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Upload and validate image file with enhanced validation"""
+    file_content = await read_upload(file)
+    return await ingest_upload(file_content, file.filename, file.content_type, current_user, db)
+
+
+def limit_request_body(request: Request, max_bytes: int) -> Request:
+    """
+    The request with its body refused (413) beyond max_bytes
+
+    A declared Content-Length is checked before anything is read; bodies
+    without one are counted as they stream in, so at most max_bytes are
+    ever spooled by the form parser.
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"Request body exceeds the limit of {format_file_size(max_bytes)} per request"
+    )
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+    
+    received = 0
+    
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise too_large
+        return message
     
-    # Read file content
-    file_content = await file.read()
+    return Request(request.scope, receive)
+
+
+@app.post(
+    "/photos/upload-many",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                        },
+                        "required": ["files"]
+                    }
+                }
+            }
+        }
+    }
+)
+async def upload_many_photos(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload several photos in one request
+    
+    Files are validated, optimized and stored concurrently. Each file gets
+    its own result, so some can fail while the rest succeed. The body is
+    size-checked before it is parsed, so oversized requests are refused
+    without being spooled.
+    """
+    body = limit_request_body(request, settings.UPLOAD_MANY_MAX_BYTES)
+    # Starlette refuses (400) forms with more than max_files files
+    form = await body.form(max_files=settings.UPLOAD_MANY_MAX_FILES)
+    try:
+        files = [item for item in form.getlist("files") if not isinstance(item, str)]
+        if not files:
+            raise HTTPException(status_code=400, detail="No files uploaded")
+        
+        # Keep as many files decoding as there are image workers, so later files
+        # wait here instead of timing out on the pixel budget
+        slots = asyncio.Semaphore(settings.IMAGE_WORKERS)
+        
+        async def upload_one(file: UploadFile) -> dict:
+            async with slots:
+                # Files run concurrently, so each gets its own session; a failed
+                # commit then cannot poison its siblings' transactions
+                db = SessionLocal()
+                try:
+                    file_content = await read_upload(file)
+                    result = await ingest_upload(file_content, file.filename, file.content_type, current_user, db)
+                    return {"filename": file.filename, "status_code": 200, **result}
+                except HTTPException as e:
+                    return {"filename": file.filename, "status_code": e.status_code, "error": e.detail}
+                except Exception as e:
+                    return {"filename": file.filename, "status_code": 500, "error": f"Failed to upload file: {str(e)}"}
+                finally:
+                    db.close()
+        
+        results = await asyncio.gather(*(upload_one(file) for file in files))
+    finally:
+        await form.close()
+    uploaded = sum(result["status_code"] == 200 for result in results)
     
-    # Validate image file
-    is_valid, error_message = validate_image_file(file_content, file.filename)
+    return {
+        "message": f"Uploaded {uploaded} of {len(results)} files",
+        "uploaded": uploaded,
+        "failed": len(results) - uploaded,
+        "results": results
+    }
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Read an upload after rejecting bad format or dimensions from its header"""
+    header = await read_image_header(file)
+    is_valid, error_message = prevalidate_image_header(header, file.filename, file.size)
     if not is_valid:
         raise HTTPException(status_code=400, detail=error_message)
     
-    # Optimize image for upload
-    optimized_content = optimize_image_for_upload(file_content)
+    # Read the rest of the file content
+    return header + await file.read()
+
+
+async def ingest_upload(
+    file_content: bytes,
+    filename: str,
+    content_type: str,
+    current_user: User,
+    db: Session
+) -> dict:
+    """
+    Validate, optimize and store a fully received upload
+    
+    Shared by the multipart and resumable upload endpoints; the caller has
+    already pre-validated the header.
+    """
+    
+    # Decode within the shared pixel budget, off the event loop
+    async with pixel_budget.reserve(header_pixels(file_content)):
+        # Validate image file
+        is_valid, error_message = await run_image_task(validate_image_file, file_content, filename)
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=error_message)
+        
+        # Orientation is lost when the optimized copy is re-encoded, so keep it
+        exif_orientation = await run_image_task(read_exif_orientation, file_content)
+        
+        # Optimize image for upload
+        optimized_content = await run_image_task(optimize_image_for_upload, file_content)
+        
+        # Fingerprint for near-duplicate detection
+        phash = await run_image_task(compute_perceptual_hash, optimized_content)
+        
+        # Pre-flight quality check, before any credits are spent on this image
+        quality = None
+        if settings.QUALITY_GATE_MODE != "off":
+            report = await run_image_task(assess_image_quality, optimized_content)
+            quality = quality_gate.evaluate(report)
+            if not quality["passed"]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Image quality too low: {'; '.join(quality['issues'])}"
+                )
     
-    # Generate unique filename
-    file_extension = file.filename.split('.')[-1].lower()
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_key = f"uploads/{current_user.id}/{unique_filename}"
+    content_hash = calculate_file_hash(optimized_content)
+    referenced = False
     
     try:
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=settings.AWS_BUCKET_NAME,
-            Key=file_key,
-            Body=optimized_content,
-            ContentType=file.content_type,
-            Metadata={
+        # Store under the content hash; repeat uploads reuse the stored copy
+        stored, deduplicated = await object_catalog.store(
+            db,
+            "uploads",
+            content_hash,
+            optimized_content,
+            metadata={
                 'user_id': str(current_user.id),
-                'original_filename': file.filename,
+                'original_filename': filename,
                 'upload_timestamp': datetime.utcnow().isoformat()
             }
         )
-        
-        # Generate S3 URL
-        s3_url = f"https://{settings.AWS_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{file_key}"
+        referenced = True
+        file_url = stored.url
         
         # Get image dimensions for response
         image = Image.open(io.BytesIO(optimized_content))
         width, height = image.size
         
+        # Keep a local copy so hot reads skip object storage
+        await media_cache.put(content_hash, "original", optimized_content, stored.content_type, source_url=file_url)
+        
+        # Look up earlier near-identical uploads before recording this one
+        duplicates = find_near_duplicates(db, current_user.id, phash)
+        record_fingerprint(db, current_user.id, file_url, phash)
+        
+        # Record what later steps need so they never re-fetch or re-decode
+        upload = Upload(
+            user_id=current_user.id,
+            key=stored.key,
+            url=file_url,
+            content_hash=content_hash,
+            filename=filename,
+            format=sniff_image_format(optimized_content) or "JPEG",
+            width=width,
+            height=height,
+            size=len(optimized_content),
+            original_size=len(file_content),
+            exif_orientation=exif_orientation
+        )
+        db.add(upload)
+        db.commit()
+        db.refresh(upload)
+        
         return {
             "message": "File uploaded successfully",
-            "url": s3_url,
-            "filename": file.filename,
+            "upload_id": upload.id,
+            "url": file_url,
+            "content_hash": content_hash,
+            "filename": filename,
             "size": len(optimized_content),
             "original_size": len(file_content),
             "dimensions": {"width": width, "height": height},
-            "optimized": len(optimized_content) < len(file_content)
+            "optimized": len(optimized_content) < len(file_content),
+            "deduplicated": deduplicated,
+            "near_duplicates": [
+                {"url": duplicate.image_url, "uploaded_at": duplicate.created_at}
+                for duplicate in duplicates
+            ],
+            "quality": quality
         }
         
     except Exception as e:
+        if referenced:
+            # No upload row holds the reference the store took
+            object_catalog.release_abandoned(db, [content_hash])
+        else:
+            db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
 
+@app.post("/photos/upload-intent")
+async def create_photo_upload_intent(
+    intent: UploadIntentRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a presigned policy to upload a photo straight to storage
+    
+    POST the returned fields plus the file (last) to the returned URL, then
+    call /photos/upload-complete with the upload token.
+    """
+    return await create_upload_intent(current_user.id, intent.filename, intent.content_type, intent.size)
+
+
+def direct_upload_result(upload: Upload) -> dict:
+    """Completion response for a recorded direct upload"""
+    return {
+        "message": "File uploaded successfully",
+        "upload_id": upload.id,
+        "url": upload.url,
+        "key": upload.key,
+        "filename": upload.filename,
+        "size": upload.original_size,
+        "format": upload.format,
+        "dimensions": {"width": upload.width, "height": upload.height},
+        "exif_orientation": upload.exif_orientation
+    }
+
+
+def find_direct_upload(db: Session, user_id: int, key: str) -> Optional[Upload]:
+    """Upload row already recorded for a direct upload's key"""
+    return db.query(Upload).filter(Upload.user_id == user_id, Upload.key == key).first()
+
+
+@app.post("/photos/upload-complete")
+async def complete_photo_upload(
+    completion: UploadCompleteRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Validate a direct upload from its header bytes and return its URL
+
+    Completing the same upload token again returns the upload recorded the
+    first time.
+    """
+    key = decode_upload_token(completion.upload_token, current_user.id)["key"]
+    upload = find_direct_upload(db, current_user.id, key)
+    if upload:
+        return direct_upload_result(upload)
+
+    result = await complete_upload(completion.upload_token, current_user.id)
+
+    # Lock the user's row so concurrent completions of one token insert once
+    db.query(User).filter(User.id == current_user.id).with_for_update().first()
+    upload = find_direct_upload(db, current_user.id, key)
+    if upload:
+        db.commit()
+        return direct_upload_result(upload)
+
+    upload = Upload(
+        user_id=current_user.id,
+        key=result["key"],
+        url=result["url"],
+        filename=result["filename"],
+        format=result["format"],
+        width=result["dimensions"]["width"],
+        height=result["dimensions"]["height"],
+        size=result["size"],
+        original_size=result["size"],
+        exif_orientation=result["exif_orientation"]
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    
+    return {"message": "File uploaded successfully", "upload_id": upload.id, **result}
+
+
+@app.get("/photos/uploads", response_model=List[UploadResponse])
+async def list_uploads(
+    skip: int = 0,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get user's uploaded source images, newest first"""
+    uploads = db.query(Upload).filter(
+        Upload.user_id == current_user.id,
+        Upload.expired_at.is_(None)
+    ).order_by(Upload.created_at.desc()).offset(skip).limit(min(limit, 100)).all()
+    
+    return url_signer.sign_models(uploads, UploadResponse, UPLOAD_URL_FIELDS)
+
+
+def set_upload_pinned(db: Session, user: User, upload_id: int, pinned: bool) -> UploadResponse:
+    """Pin or unpin one of a user's live uploads"""
+    upload = db.query(Upload).filter(
+        Upload.id == upload_id,
+        Upload.user_id == user.id
+    ).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.expired_at is not None:
+        raise HTTPException(status_code=410, detail="Upload has expired")
+    
+    upload.pinned = pinned
+    db.commit()
+    return url_signer.sign_models([upload], UploadResponse, UPLOAD_URL_FIELDS)[0]
+
+
+@app.post("/photos/uploads/{upload_id}/pin", response_model=UploadResponse)
+async def pin_upload(
+    upload_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Keep an upload past its plan's retention period"""
+    return set_upload_pinned(db, current_user, upload_id, True)
+
+
+@app.delete("/photos/uploads/{upload_id}/pin", response_model=UploadResponse)
+async def unpin_upload(
+    upload_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Let an upload expire with its plan's retention period"""
+    return set_upload_pinned(db, current_user, upload_id, False)
+
+
+def resumable_upload_headers(session) -> dict:
+    """tus headers describing an upload's progress"""
+    return {
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.length),
+        "Upload-Expires": datetime.utcfromtimestamp(session.expires_at).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "Cache-Control": "no-store"
+    }
+
+
+@app.post("/photos/uploads", status_code=201)
+async def create_resumable_upload(
+    upload: ResumableUploadCreate,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start a resumable upload
+    
+    PATCH the file to the returned location in one or more chunks
+    (Content-Type: application/offset+octet-stream, Upload-Offset set to the
+    current offset). After a dropped connection, HEAD the location to get
+    the offset to resume from. Finalize once all bytes are received.
+    """
+    session = await resumable_uploads.create(
+        current_user.id, upload.filename, upload.content_type, upload.size, upload.checksum
+    )
+    response.headers.update(resumable_upload_headers(session))
+    response.headers["Location"] = f"/photos/uploads/{session.upload_id}"
+    return {"upload_id": session.upload_id, "offset": session.offset, "size": session.length}
+
+
+@app.head("/photos/uploads/{upload_id}")
+async def get_resumable_upload_offset(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Report how many bytes of a resumable upload have been received"""
+    session = await resumable_uploads.get(upload_id, current_user.id)
+    return Response(status_code=200, headers=resumable_upload_headers(session))
+
+
+@app.patch("/photos/uploads/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Append a chunk at the offset given in the Upload-Offset header"""
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required")
+    
+    session = await resumable_uploads.get(upload_id, current_user.id)
+    chunk_checksum = parse_upload_checksum(request.headers.get("upload-checksum"))
+    await resumable_uploads.append(session, offset, request.stream(), chunk_checksum)
+    return Response(status_code=204, headers=resumable_upload_headers(session))
+
+
+@app.post("/photos/uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Validate, optimize and store a fully received resumable upload"""
+    session = await resumable_uploads.get(upload_id, current_user.id)
+    if session.lock.locked():
+        raise HTTPException(status_code=409, detail="Upload is already being written")
+    
+    async with session.lock:
+        file_content = await resumable_uploads.read_completed(session)
+        try:
+            result = await ingest_upload(file_content, session.filename, session.content_type, current_user, db)
+        except HTTPException as e:
+            # Invalid content will not improve on retry; server errors may
+            if e.status_code == 400:
+                await resumable_uploads.discard(session)
+            raise
+        checksum = session.hasher.hexdigest()
+    
+    await resumable_uploads.finish(session)
+    return {**result, "checksum": checksum}
+
+
+@app.delete("/photos/uploads/{upload_id}", status_code=204)
+async def cancel_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Abandon a resumable upload and free its spooled bytes"""
+    session = await resumable_uploads.get(upload_id, current_user.id)
+    if session.lock.locked():
+        raise HTTPException(status_code=409, detail="Upload is already being written")
+    await resumable_uploads.discard(session)
+    return Response(status_code=204)
+
+
 @app.post("/photos/generate", response_model=PhotoResponse)
 async def generate_photo(
-    original_url: str = Form(...),
+    original_url: Optional[str] = Form(None),
+    upload_id: Optional[int] = Form(None),
     style: str = Form(...),
+    reuse_existing: bool = Form(True),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate professional photo using AI with real-time updates"""
+    """
+    Generate professional photo using AI with real-time updates
+    
+    The source is either an upload_id from /photos/upload, which was
+    validated at ingest, or an original_url.
+    """
+    
+    if (original_url is None) == (upload_id is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of original_url or upload_id")
+    
+    upload = None
+    if upload_id is not None:
+        upload = db.query(Upload).filter(
+            Upload.id == upload_id,
+            Upload.user_id == current_user.id
+        ).first()
+        if not upload:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if upload.expired_at is not None:
+            raise HTTPException(status_code=410, detail="Upload has expired")
+        original_url = upload.url
     
     # Check if user has enough credits
     if current_user.credits < 1:
@@ -273,11 +795,18 @@ async def generate_photo(
     if not validate_style(style):
         raise HTTPException(status_code=400, detail="Invalid style. Must be one of: corporate, creative, formal, casual")
     
+    # Offer the existing result for a near-duplicate upload instead of a new prediction
+    if reuse_existing:
+        existing_photo = find_reusable_photo(db, current_user.id, original_url, style)
+        if existing_photo:
+            return url_signer.sign_models([existing_photo], PhotoResponse, PHOTO_URL_FIELDS)[0]
+    
     # Create photo record
     photo = GeneratedPhoto(
         user_id=current_user.id,
         style=style,
         original_url=original_url,
+        upload_id=upload.id if upload else None,
         status="processing"
     )
     db.add(photo)
@@ -287,14 +816,24 @@ async def generate_photo(
     # Notify user that processing has started
     await notify_photo_status_update(current_user.id, photo.id, "processing", "Starting photo generation...")
     
+    # Catalog references taken for the output until the photo records them
+    abandoned: List[str] = []
+    
     try:
         # Process with Replicate API
         await notify_photo_status_update(current_user.id, photo.id, "processing", "Processing with AI model...")
         
+        input_image = url_signer.sign_urls([original_url])[0]
+        spooled = await write_spool.read_url(original_url)
+        if spooled is not None:
+            # Not in storage yet, so the model could not fetch it; send the bytes
+            content_type = FORMAT_CONTENT_TYPES.get(sniff_image_format(spooled), "image/jpeg")
+            input_image = f"data:{content_type};base64,{base64.b64encode(spooled).decode()}"
+        
         output = replicate_client.run(
             "tencentarc/photomaker:ddfc2b08d209f9fa8c1eca692712918bd449f695dabb4a958da31802a9570fe4",
             input={
-                "input_image": original_url,
+                "input_image": input_image,
                 "style": style,
                 "num_outputs": 1,
                 "style_strength_ratio": 20,
@@ -311,30 +850,40 @@ async def generate_photo(
         # Notify user that processing is complete
         await notify_photo_status_update(current_user.id, photo.id, "processing", "Generating thumbnail...")
         
-        # Generate thumbnail
-        thumbnail_data = generate_thumbnail(processed_url)
-        thumbnail_url = processed_url  # Fallback to original if thumbnail fails
+        # Download the output once; thumbnail and storage copy share the buffer.
+        # The consumers run concurrently, so each stores through its own session
+        fan_out = await output_fan_out.run(processed_url, {
+            "thumbnail": store_thumbnail,
+            "storage": store_generated_output,
+            "cache": lambda data, content_hash: media_cache.put(
+                content_hash, "original", data, FORMAT_CONTENT_TYPES[sniff_image_format(data)]
+            )
+        })
         
-        if thumbnail_data:
-            # Upload thumbnail to S3
-            thumbnail_key = f"thumbnails/{current_user.id}/{uuid.uuid4()}.jpg"
-            try:
-                s3_client.put_object(
-                    Bucket=settings.AWS_BUCKET_NAME,
-                    Key=thumbnail_key,
-                    Body=thumbnail_data,
-                    ContentType='image/jpeg'
-                )
-                thumbnail_url = f"https://{settings.AWS_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{thumbnail_key}"
-            except Exception as e:
-                print(f"Thumbnail upload failed: {e}")
+        if fan_out["results"]["thumbnail"]:
+            abandoned.append(fan_out["results"]["thumbnail"]["content_hash"])
+        if fan_out["results"]["storage"]:
+            abandoned.append(fan_out["hash"])
+        
+        # Fall back to the model URL for anything that could not be stored
+        thumbnail = fan_out["results"]["thumbnail"] or {"url": processed_url, "placeholder": None}
+        thumbnail_url = thumbnail["url"]
+        processed_url = fan_out["results"]["storage"] or processed_url
+        
+        # Cached copy can be re-fetched from storage once evicted
+        if fan_out["results"]["storage"]:
+            await media_cache.register_source(fan_out["hash"], "original", processed_url, FORMAT_CONTENT_TYPES[fan_out["format"]])
         
         # Update photo record
         photo.processed_url = processed_url
         photo.thumbnail_url = thumbnail_url
+        photo.placeholder = thumbnail["placeholder"]
+        photo.content_hash = fan_out["hash"]
         photo.status = "completed"
         photo.credits_used = 1
+        current_user.gallery_version += 1
         db.commit()
+        abandoned.clear()
         
         # Deduct credits
         current_user.credits -= 1
@@ -354,9 +903,12 @@ async def generate_photo(
         await notify_photo_completed(current_user.id, photo.id, processed_url, thumbnail_url)
         await notify_credits_updated(current_user.id, current_user.credits, "photo_generation")
         
-        return photo
+        return url_signer.sign_models([photo], PhotoResponse, PHOTO_URL_FIELDS)[0]
         
     except Exception as e:
+        if abandoned:
+            object_catalog.release_abandoned(db, abandoned)
+        
         # Update photo status to failed
         photo.status = "failed"
         db.commit()
@@ -367,36 +919,200 @@ async def generate_photo(
         raise HTTPException(status_code=500, detail=f"Photo generation failed: {str(e)}")
 
 
-async def generate_thumbnail(image_url: str) -> str:
-    """Generate thumbnail for processed image"""
+async def store_thumbnail(image_content: bytes, content_hash: str) -> dict:
+    """
+    Create a thumbnail and inline placeholder from image bytes, store the
+    thumbnail and cache it locally
+    
+    Returns:
+        dict with 'url', 'placeholder' (data URI) and the thumbnail's 'content_hash'
+    """
+    thumbnail_data, placeholder = await run_decode(image_content, create_thumbnail_with_placeholder)
+    thumbnail_hash = calculate_file_hash(thumbnail_data)
+    db = SessionLocal()
     try:
-        # Download image
-        import requests
-        response = requests.get(image_url)
-        image = Image.open(io.BytesIO(response.content))
-        
-        # Create thumbnail
-        image.thumbnail((300, 300), Image.Resampling.LANCZOS)
-        
-        # Upload thumbnail to S3
-        thumbnail_key = f"thumbnails/{uuid.uuid4()}.jpg"
-        
-        # Convert to bytes
-        thumbnail_buffer = io.BytesIO()
-        image.save(thumbnail_buffer, format='JPEG', quality=85)
-        thumbnail_buffer.seek(0)
-        
-        s3_client.put_object(
-            Bucket=settings.AWS_BUCKET_NAME,
-            Key=thumbnail_key,
-            Body=thumbnail_buffer.getvalue(),
-            ContentType='image/jpeg'
-        )
-        
-        return f"https://{settings.AWS_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{thumbnail_key}"
-        
-    except Exception:
-        return image_url  # Return original if thumbnail generation fails
+        stored, _ = await object_catalog.store(db, "thumbnails", thumbnail_hash, thumbnail_data)
+        thumbnail_url = stored.url
+        try:
+            await media_cache.put(content_hash, "thumb", thumbnail_data, "image/jpeg", source_url=thumbnail_url)
+        except Exception:
+            object_catalog.release_abandoned(db, [thumbnail_hash])
+            raise
+    finally:
+        db.close()
+    
+    return {"url": thumbnail_url, "placeholder": placeholder, "content_hash": thumbnail_hash}
+
+
+async def store_generated_output(image_content: bytes, content_hash: str) -> str:
+    """Mirror a model output to storage before the provider's URL expires"""
+    db = SessionLocal()
+    try:
+        stored, _ = await object_catalog.store(db, "generated", content_hash, image_content)
+        return stored.url
+    finally:
+        db.close()
+
+
+async def load_media_entry(content_hash: str, variant: str):
+    """
+    Find a media cache entry, re-fetching it once from storage (or the
+    write spool, until the object is flushed) if evicted
+    
+    Returns:
+        (path, size, content_type) of the entry on local disk
+    """
+    entry = await media_cache.lookup(content_hash, variant)
+    if entry is not None:
+        return entry
+    
+    source = await media_cache.source(content_hash, variant)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    source_url, content_type = source
+    data = await write_spool.read_url(source_url)
+    if data is None:
+        try:
+            data = await http_client.fetch_bytes(url_signer.sign_urls([source_url])[0])
+        except Exception:
+            raise HTTPException(status_code=502, detail="Media source unavailable")
+    
+    # Originals are content-addressed, so refuse anything that does not match
+    if variant == "original" and calculate_file_hash(data) != content_hash:
+        raise HTTPException(status_code=502, detail="Media source content mismatch")
+    
+    path = await media_cache.put(content_hash, variant, data, content_type)
+    return path, len(data), content_type
+
+
+def read_media_file(path: str) -> bytes:
+    """Read a cached media file (run off the event loop)"""
+    with open(path, "rb") as media_file:
+        return media_file.read()
+
+
+@app.get("/media/{content_hash}/transform")
+async def transform_media(
+    content_hash: str,
+    request: Request,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fit: str = "cover",
+    gravity: str = "center",
+    format: str = "auto",
+    q: Optional[int] = None
+):
+    """
+    Serve a resized/cropped/re-encoded derivative of a cached original
+    
+    Derivatives are rendered locally once per (hash, parameters), cached
+    alongside the original, and shared by concurrent identical requests.
+    w and h must be one of TRANSFORM_DIMENSIONS, and no fit enlarges the
+    original. format=auto picks WebP for clients that accept it, otherwise JPEG.
+    """
+    if not is_valid_key(content_hash, "original"):
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    output_format = format
+    if format == "auto":
+        output_format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    
+    params = build_transform(w, h, fit, gravity, output_format, q)
+    
+    async def load_original() -> bytes:
+        path, _, _ = await load_media_entry(content_hash, "original")
+        return await asyncio.to_thread(read_media_file, path)
+    
+    path, size, content_type = await transform_service.get(content_hash, params, load_original)
+    response = serve_media_file(
+        request, path, size, content_type, f'"{content_hash}-{transform_variant(params)}"'
+    )
+    if format == "auto":
+        response.headers["Vary"] = "Accept"
+    return response
+
+
+@app.get("/media/{content_hash}/{variant}")
+async def get_media(content_hash: str, variant: str, request: Request):
+    """
+    Serve an original or derivative from the local media cache
+    
+    Entries are immutable (keyed by content hash), so responses carry a
+    long-lived Cache-Control and an ETag, and honour Range requests.
+    Evicted entries are re-fetched once from their storage URL.
+    """
+    path, size, content_type = await load_media_entry(content_hash, variant)
+    return serve_media_file(request, path, size, content_type, f'"{content_hash}-{variant}"')
+
+
+@app.post("/files")
+async def upload_local_file(
+    key: str = Form(...),
+    content_type: str = Form(..., alias="Content-Type"),
+    max_bytes: int = Form(...),
+    expires: int = Form(...),
+    signature: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """
+    Accept a presigned form upload for the local storage backend
+    
+    Stands in for S3's POST policy endpoint so direct uploads work offline.
+    """
+    if storage_backend.name != "local":
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    if expires < time.time() or not hmac.compare_digest(
+        signature, sign_local_upload(key, content_type, max_bytes, expires)
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload policy")
+    
+    content = await file.read(max_bytes + 1)
+    if not content or len(content) > max_bytes:
+        raise HTTPException(status_code=400, detail="File size outside the allowed range")
+    
+    await storage_backend.put(key, content, content_type)
+    return Response(status_code=204)
+
+
+@app.get("/files/{key:path}")
+async def get_local_file(
+    key: str,
+    request: Request,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None
+):
+    """
+    Serve objects of the local storage backend
+    
+    Only active with STORAGE_BACKEND=local. Presigned URLs carry an expiry
+    and signature that are checked here; with STORAGE_PRIVATE every request
+    must be signed. Content-addressed keys are served as immutable, like S3
+    objects written through the object catalog.
+    """
+    if storage_backend.name != "local":
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    if signature is not None or settings.STORAGE_PRIVATE:
+        if signature is None or expires is None or expires < time.time() or not hmac.compare_digest(
+            signature, sign_local_key(key, expires)
+        ):
+            raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    
+    try:
+        path = storage_backend.path(key)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    if is_content_addressed(key):
+        content_hash = os.path.splitext(os.path.basename(key))[0]
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        return serve_media_file(request, path, os.path.getsize(path), content_type, f'"{content_hash}"')
+    
+    return FileResponse(path)
 
 
 @app.get("/photos/history", response_model=List[PhotoResponse])
@@ -410,7 +1126,123 @@ async def get_photo_history(
         GeneratedPhoto.user_id == current_user.id
     ).order_by(GeneratedPhoto.created_at.desc()).limit(20).all()
     
-    return photos
+    return url_signer.sign_models(photos, PhotoResponse, PHOTO_URL_FIELDS)
+
+
+async def load_thumbnail_bytes(photo: GeneratedPhoto) -> Optional[bytes]:
+    """Thumbnail bytes of a photo from the media cache, else the write spool or its stored URL"""
+    try:
+        if photo.content_hash:
+            try:
+                path, _, _ = await load_media_entry(photo.content_hash, "thumb")
+                return await asyncio.to_thread(read_media_file, path)
+            except HTTPException:
+                pass
+        if photo.thumbnail_url:
+            spooled = await write_spool.read_url(photo.thumbnail_url)
+            if spooled is not None:
+                return spooled
+            return await http_client.fetch_bytes(url_signer.sign_urls([photo.thumbnail_url])[0])
+    except Exception as e:
+        print(f"Thumbnail load failed for photo {photo.id}: {str(e)}")
+    return None
+
+
+@app.get("/photos/sprite", response_model=GallerySpriteResponse)
+async def get_history_sprite(
+    limit: int = SPRITE_DEFAULT_TILES,
+    tile_size: int = SPRITE_DEFAULT_TILE_SIZE,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the user's most recent thumbnails as one contact sheet
+    
+    Returns the sheet URL and each photo's tile offset. Sheets are cached
+    per gallery version, which bumps whenever a photo completes.
+    """
+    if not 1 <= limit <= SPRITE_MAX_TILES:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SPRITE_MAX_TILES}")
+    if tile_size not in SPRITE_TILE_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"tile_size must be one of: {', '.join(str(size) for size in SPRITE_TILE_SIZES)}"
+        )
+    
+    key = sprite_key(current_user.id, current_user.gallery_version, limit, tile_size)
+    cached_map = await media_cache.lookup(key, SPRITE_MAP_VARIANT)
+    cached_sheet = await media_cache.lookup(key, SPRITE_IMAGE_VARIANT)
+    if cached_map and cached_sheet:
+        return json.loads(await asyncio.to_thread(read_media_file, cached_map[0]))
+    
+    photos = db.query(GeneratedPhoto).filter(
+        GeneratedPhoto.user_id == current_user.id,
+        GeneratedPhoto.status == "completed"
+    ).order_by(GeneratedPhoto.created_at.desc()).limit(limit).all()
+    
+    thumbnails = await asyncio.gather(*(load_thumbnail_bytes(photo) for photo in photos))
+    
+    pixels = sprite_pixels(len(photos), tile_size) + sum(
+        header_pixels(thumbnail) for thumbnail in thumbnails if thumbnail
+    )
+    async with pixel_budget.reserve(pixels):
+        sheet_data, (width, height), offsets = await run_image_task(compose_sprite, thumbnails, tile_size)
+    
+    sprite_map = {
+        "version": current_user.gallery_version,
+        "sprite_url": f"/media/{key}/{SPRITE_IMAGE_VARIANT}",
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "tiles": [
+            {"photo_id": photo.id, "x": offset[0], "y": offset[1]}
+            for photo, offset in zip(photos, offsets) if offset is not None
+        ]
+    }
+    
+    # Sheet first, so a cached map never points at a missing sheet
+    await media_cache.put(key, SPRITE_IMAGE_VARIANT, sheet_data, "image/jpeg")
+    await media_cache.put(key, SPRITE_MAP_VARIANT, json.dumps(sprite_map).encode(), "application/json")
+    return sprite_map
+
+
+@app.get("/batches/{batch_id}/download")
+async def download_batch(
+    batch_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Download a batch's completed results as a ZIP archive
+    
+    The archive is streamed while the outputs are still being fetched, in
+    the order downloads finish.
+    """
+    photos = db.query(GeneratedPhoto).filter(
+        GeneratedPhoto.batch_id == batch_id,
+        GeneratedPhoto.user_id == current_user.id,
+        GeneratedPhoto.status == "completed",
+        GeneratedPhoto.processed_url.isnot(None)
+    ).order_by(GeneratedPhoto.id).all()
+    
+    if not photos:
+        raise HTTPException(status_code=404, detail="Batch not found or has no completed photos")
+    
+    urls = url_signer.sign_urls([photo.processed_url for photo in photos])
+    sources = [
+        ZipSource(
+            name=f"{index:03d}_{photo.style}_{photo.id}",
+            url=url,
+            modified=photo.created_at
+        )
+        for index, (photo, url) in enumerate(zip(photos, urls), start=1)
+    ]
+    
+    return StreamingResponse(
+        stream_zip(sources),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.zip"'}
+    )
 
 
 @app.get("/photos/{photo_id}", response_model=PhotoResponse)
@@ -429,7 +1261,7 @@ async def get_photo_details(
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
     
-    return photo
+    return url_signer.sign_models([photo], PhotoResponse, PHOTO_URL_FIELDS)[0]
 
 
 # Credit endpoints
@@ -0,0 +1,407 @@
+"""
+Local content-addressed media cache for PhotoPro AI.
+Keeps originals and derivatives on local disk under their SHA-256 hash with
+a size cap and LRU eviction, so hot photos are served without a round trip
+to object storage.
+"""
+
+import asyncio
+import mmap
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from config import settings
+from image_headers import FORMAT_CONTENT_TYPES, sniff_image_format
+
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+VARIANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_.-]{0,63}$")
+
+# Skip rewriting the access time for entries touched this recently
+ACCESS_RESOLUTION_SECONDS = 60
+
+# Evict down to this fraction of the cap so eviction does not run on every put
+EVICTION_TARGET = 0.9
+
+
+def is_valid_key(content_hash: str, variant: str) -> bool:
+    """Whether a hash/variant pair is safe to map onto the filesystem"""
+    return bool(HASH_PATTERN.match(content_hash) and VARIANT_PATTERN.match(variant))
+
+
+class MediaCache:
+    """
+    Size-capped disk cache keyed by (content hash, variant)
+
+    Files are written to a temporary name, fsynced and renamed into place
+    before the SQLite index (WAL mode) records them, so a crash can leave at
+    most an unindexed file or a stale temp file; both are repaired on start.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    # Index --------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+            db = sqlite3.connect(
+                os.path.join(self.root, "index.db"),
+                check_same_thread=False,
+                isolation_level=None
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " hash TEXT NOT NULL, variant TEXT NOT NULL, size INTEGER NOT NULL,"
+                " content_type TEXT NOT NULL, last_access REAL NOT NULL,"
+                " PRIMARY KEY (hash, variant))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_entries_access ON entries (last_access)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                " hash TEXT NOT NULL, variant TEXT NOT NULL, url TEXT NOT NULL,"
+                " content_type TEXT NOT NULL, PRIMARY KEY (hash, variant))"
+            )
+            self._db = db
+            self._recover()
+        return self._db
+
+    def _recover(self):
+        """Reconcile the index with the files actually on disk"""
+        indexed = {
+            (row[0], row[1])
+            for row in self._db.execute("SELECT hash, variant FROM entries")
+        }
+        on_disk = set()
+
+        objects_dir = os.path.join(self.root, "objects")
+        for dirpath, _, filenames in os.walk(objects_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                content_hash = os.path.basename(dirpath)
+                if not is_valid_key(content_hash, filename):
+                    continue
+                on_disk.add((content_hash, filename))
+                if (content_hash, filename) not in indexed:
+                    # Renamed into place but never indexed before a crash
+                    with open(path, "rb") as media_file:
+                        image_format = sniff_image_format(media_file.read(16))
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                        (content_hash, filename, os.path.getsize(path),
+                         FORMAT_CONTENT_TYPES.get(image_format, "application/octet-stream"),
+                         time.time())
+                    )
+
+        for content_hash, variant in indexed - on_disk:
+            self._db.execute(
+                "DELETE FROM entries WHERE hash = ? AND variant = ?",
+                (content_hash, variant)
+            )
+
+    def _path(self, content_hash: str, variant: str) -> str:
+        return os.path.join(self.root, "objects", content_hash[:2], content_hash, variant)
+
+    # Synchronous operations (run on a worker thread) -------------------
+
+    def put_sync(
+        self,
+        content_hash: str,
+        variant: str,
+        data: bytes,
+        content_type: str,
+        source_url: Optional[str] = None
+    ) -> str:
+        """Atomically write an entry and evict least-recently-used entries"""
+        if not is_valid_key(content_hash, variant):
+            raise ValueError("Invalid media cache key")
+
+        path = self._path(content_hash, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (content_hash, variant, len(data), content_type, time.time())
+            )
+            if source_url:
+                db.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                    (content_hash, variant, source_url, content_type)
+                )
+            self._evict()
+
+        return path
+
+    def register_source_sync(self, content_hash: str, variant: str, url: str, content_type: str):
+        """Remember where an entry can be re-fetched from after eviction"""
+        if not is_valid_key(content_hash, variant):
+            raise ValueError("Invalid media cache key")
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                (content_hash, variant, url, content_type)
+            )
+
+    def lookup_sync(self, content_hash: str, variant: str) -> Optional[Tuple[str, int, str]]:
+        """Return (path, size, content_type) for a cached entry and mark it used"""
+        if not is_valid_key(content_hash, variant):
+            return None
+
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT size, content_type, last_access FROM entries WHERE hash = ? AND variant = ?",
+                (content_hash, variant)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            path = self._path(content_hash, variant)
+            if not os.path.exists(path):
+                db.execute(
+                    "DELETE FROM entries WHERE hash = ? AND variant = ?",
+                    (content_hash, variant)
+                )
+                self.misses += 1
+                return None
+
+            now = time.time()
+            if now - row[2] > ACCESS_RESOLUTION_SECONDS:
+                db.execute(
+                    "UPDATE entries SET last_access = ? WHERE hash = ? AND variant = ?",
+                    (now, content_hash, variant)
+                )
+            self.hits += 1
+            return path, row[0], row[1]
+
+    def source_sync(self, content_hash: str, variant: str) -> Optional[Tuple[str, str]]:
+        """Return (url, content_type) an entry can be re-fetched from"""
+        if not is_valid_key(content_hash, variant):
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT url, content_type FROM sources WHERE hash = ? AND variant = ?",
+                (content_hash, variant)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def delete_sync(self, content_hash: str, variant: Optional[str] = None):
+        """Remove one variant, or every variant of a hash"""
+        with self._lock:
+            db = self._connect()
+            if variant is None:
+                variants = [
+                    row[0] for row in db.execute(
+                        "SELECT variant FROM entries WHERE hash = ?", (content_hash,)
+                    )
+                ]
+            else:
+                variants = [variant]
+
+            for name in variants:
+                self._remove_entry(content_hash, name)
+            db.execute(
+                "DELETE FROM sources WHERE hash = ?" + ("" if variant is None else " AND variant = ?"),
+                (content_hash,) if variant is None else (content_hash, variant)
+            )
+
+    def _remove_entry(self, content_hash: str, variant: str):
+        path = self._path(content_hash, variant)
+        if os.path.exists(path):
+            os.remove(path)
+        self._db.execute(
+            "DELETE FROM entries WHERE hash = ? AND variant = ?",
+            (content_hash, variant)
+        )
+
+    def _evict(self):
+        """Drop least-recently-used entries until under the size cap"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * EVICTION_TARGET
+        victims: List[Tuple[str, str, int]] = self._db.execute(
+            "SELECT hash, variant, size FROM entries ORDER BY last_access"
+        ).fetchall()
+
+        for content_hash, variant, size in victims:
+            if total <= target:
+                break
+            self._remove_entry(content_hash, variant)
+            total -= size
+            self.evictions += 1
+
+    def usage_sync(self) -> Tuple[int, int]:
+        """(entry count, total bytes)"""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+
+    # Async wrappers -----------------------------------------------------
+
+    async def put(
+        self,
+        content_hash: str,
+        variant: str,
+        data: bytes,
+        content_type: str,
+        source_url: Optional[str] = None
+    ) -> str:
+        """Store an entry without blocking the event loop"""
+        return await asyncio.to_thread(
+            self.put_sync, content_hash, variant, data, content_type, source_url
+        )
+
+    async def register_source(self, content_hash: str, variant: str, url: str, content_type: str):
+        """Record a re-fetch URL without storing the bytes"""
+        await asyncio.to_thread(self.register_source_sync, content_hash, variant, url, content_type)
+
+    async def lookup(self, content_hash: str, variant: str) -> Optional[Tuple[str, int, str]]:
+        """Find a cached entry without blocking the event loop"""
+        return await asyncio.to_thread(self.lookup_sync, content_hash, variant)
+
+    async def source(self, content_hash: str, variant: str) -> Optional[Tuple[str, str]]:
+        """Find the re-fetch URL of an entry"""
+        return await asyncio.to_thread(self.source_sync, content_hash, variant)
+
+    async def delete(self, content_hash: str, variant: Optional[str] = None):
+        """Remove entries without blocking the event loop"""
+        await asyncio.to_thread(self.delete_sync, content_hash, variant)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache counters for the metrics endpoint"""
+        entries, total_bytes = self.usage_sync()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0,
+            "evictions": self.evictions
+        }
+
+
+def parse_range_header(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" header into inclusive (start, end)
+
+    Returns None for headers we do not honour (other units, multiple
+    ranges), which means serving the whole file.
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    start_text, _, end_text = ranges.strip().partition("-")
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    else:
+        # Suffix range: the last N bytes
+        suffix = int(end_text)
+        if suffix <= 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(size - suffix, 0), size - 1
+
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _iter_mapped_range(path: str, start: int, end: int, chunk_size: int = 256 * 1024):
+    """Yield a byte range of a file straight out of a memory map"""
+    with open(path, "rb") as media_file:
+        with mmap.mmap(media_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, end + 1, chunk_size):
+                yield mapped[offset:min(offset + chunk_size, end + 1)]
+
+
+def serve_media_file(
+    request: Request,
+    path: str,
+    size: int,
+    content_type: str,
+    etag: str
+) -> Response:
+    """
+    Build a cacheable response for a local media file
+
+    Whole files go through FileResponse (which uses the server's sendfile
+    path where available); byte ranges are sliced from a memory map.
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if range_header and size > 0:
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_mapped_range(path, start, end),
+                status_code=206,
+                media_type=content_type,
+                headers=headers
+            )
+
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+
+# Global media cache instance
+media_cache = MediaCache(settings.MEDIA_CACHE_DIR, settings.MEDIA_CACHE_MAX_BYTES)
@@ -2,7 +2,7 @@
 SQLAlchemy database models for PhotoPro AI.
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -19,6 +19,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     plan = Column(String(20), default="free", nullable=False)  # free, pro, enterprise
     credits = Column(Integer, default=0, nullable=False)
+    gallery_version = Column(Integer, default=0, nullable=False)  # Bumped when a photo completes; keys gallery sprites
     is_active = Column(Boolean, default=True, nullable=False)
     is_verified = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -26,6 +27,7 @@ class User(Base):
     
     # Relationships
     generated_photos = relationship("GeneratedPhoto", back_populates="user")
+    uploads = relationship("Upload", back_populates="user")
     credit_transactions = relationship("CreditTransaction", back_populates="user")
 
 
@@ -42,12 +44,46 @@ class GeneratedPhoto(Base):
     processed_public_id = Column(String(255), nullable=True)  # Cloudinary public ID for processed
     thumbnail_url = Column(Text, nullable=True)
     thumbnail_public_id = Column(String(255), nullable=True)  # Cloudinary public ID for thumbnail
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the output, key for /media
+    placeholder = Column(Text, nullable=True)  # Tiny WebP data URI shown until the thumbnail loads
+    batch_id = Column(String(36), nullable=True, index=True)  # Set for photos created by BatchProcessor
+    upload_id = Column(Integer, ForeignKey("uploads.id"), nullable=True, index=True)  # Source upload, when generated from one
     credits_used = Column(Integer, default=1, nullable=False)
     status = Column(String(20), default="processing", nullable=False)  # processing, completed, failed
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
     user = relationship("User", back_populates="generated_photos")
+    upload = relationship("Upload")
+
+
+class Upload(Base):
+    """Uploaded source image, with metadata recorded once at ingest"""
+    __tablename__ = "uploads"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(Text, nullable=False, index=True)  # Storage key
+    url = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the stored bytes; unknown for direct uploads
+    filename = Column(String(255), nullable=False)  # Client file name
+    format = Column(String(10), nullable=False)  # JPEG, PNG, WEBP
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    size = Column(BigInteger, nullable=False)  # Stored bytes
+    original_size = Column(BigInteger, nullable=True)  # Bytes received, before optimization
+    exif_orientation = Column(Integer, default=1, nullable=False)  # EXIF Orientation tag of the original, 1-8
+    pinned = Column(Boolean, default=False, nullable=False)  # Exempt from plan retention
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expired_at = Column(DateTime, nullable=True)  # Set when retention removed the stored object
+    
+    # Relationships
+    user = relationship("User", back_populates="uploads")
+    
+    __table_args__ = (
+        Index("ix_uploads_user_created", "user_id", "created_at"),
+        Index("ix_uploads_expiry", "expired_at", "created_at"),
+    )
 
 
 class CreditTransaction(Base):
@@ -63,3 +99,117 @@ class CreditTransaction(Base):
     
     # Relationships
     user = relationship("User", back_populates="credit_transactions")
+
+
+class ImageFingerprint(Base):
+    """Perceptual hash of an uploaded image for near-duplicate detection"""
+    __tablename__ = "image_fingerprints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    image_url = Column(Text, nullable=False)
+    phash = Column(BigInteger, nullable=False)  # 64-bit dHash stored as signed
+    # 16-bit slices of the hash for multi-index Hamming search
+    band0 = Column(Integer, nullable=False)
+    band1 = Column(Integer, nullable=False)
+    band2 = Column(Integer, nullable=False)
+    band3 = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_image_fingerprints_user_band0", "user_id", "band0"),
+        Index("ix_image_fingerprints_user_band1", "user_id", "band1"),
+        Index("ix_image_fingerprints_user_band2", "user_id", "band2"),
+        Index("ix_image_fingerprints_user_band3", "user_id", "band3"),
+    )
+
+
+class StoredObject(Base):
+    """Content-addressed object in storage, shared by every upload of the same bytes"""
+    __tablename__ = "stored_objects"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 of the stored bytes
+    key = Column(Text, nullable=False, index=True)
+    url = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(50), nullable=False)
+    etag = Column(String(100), nullable=True)  # As returned by the storage backend on write
+    ref_count = Column(Integer, default=1, nullable=False)  # Uploads pointing at this object; -1 while GC deletes it
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_referenced_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class CloudinaryAsset(Base):
+    """Local index of a Cloudinary asset, kept in sync on upload and delete"""
+    __tablename__ = "cloudinary_assets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    public_id = Column(String(255), unique=True, index=True, nullable=False)
+    user_id = Column(Integer, nullable=True)  # From the photopro/user_<id>/ folder, if any
+    folder = Column(String(255), nullable=False)  # Folder of the public ID, e.g. photopro/user_1/originals
+    url = Column(Text, nullable=False)
+    format = Column(String(10), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    bytes = Column(BigInteger, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # Cloudinary upload time
+    reconciled_at = Column(DateTime, nullable=True)  # Start of the last reconcile that saw the asset
+    
+    __table_args__ = (
+        Index("ix_cloudinary_assets_user_folder_created", "user_id", "folder", "created_at"),
+    )
+
+
+class DeletionJob(Base):
+    """Bulk deletion of storage objects, resumable from its pending items"""
+    __tablename__ = "deletion_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=True, index=True)  # Whose data; kept after the account is gone
+    reason = Column(String(50), nullable=False)  # account_deletion, failed_generations
+    status = Column(String(20), default="pending", nullable=False)  # pending, running, completed, completed_with_errors
+    total = Column(Integer, default=0, nullable=False)
+    deleted = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    released = Column(Integer, default=0, nullable=False)  # Shared objects dereferenced instead of deleted
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class DeletionJobItem(Base):
+    """One storage key of a deletion job"""
+    __tablename__ = "deletion_job_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("deletion_jobs.id"), nullable=False)
+    key = Column(Text, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)  # pending, deleted, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_deletion_job_items_job_status", "job_id", "status"),
+    )
+
+
+class GcRun(Base):
+    """Orphan-object garbage collection pass, resumable from its checkpoint"""
+    __tablename__ = "gc_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), default="pending", nullable=False)  # pending, running, completed, failed
+    dry_run = Column(Boolean, default=True, nullable=False)
+    cutoff = Column(DateTime, nullable=False)  # Only objects last modified before this are collected
+    checkpoint = Column(Text, nullable=True)  # Last storage key fully processed
+    scanned = Column(Integer, default=0, nullable=False)
+    orphans = Column(Integer, default=0, nullable=False)
+    orphan_bytes = Column(BigInteger, default=0, nullable=False)
+    deleted = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    missing = Column(Integer, default=0, nullable=False)  # Referenced keys with no object in storage
+    report = Column(Text, nullable=True)  # JSON sample of orphan keys
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,218 @@
+"""
+Content-addressed object catalog for PhotoPro AI.
+Stores objects under a key derived from their SHA-256 and reference-counts
+them in a table, so uploading bytes that are already stored skips the
+storage write and reuses the existing URL. Since a key's bytes never change,
+objects are written with an immutable Cache-Control.
+"""
+
+import asyncio
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from image_headers import FORMAT_CONTENT_TYPES, FORMAT_EXTENSIONS, sniff_image_format
+from models import StoredObject
+from storage_backends import IMMUTABLE_CACHE_CONTROL
+from write_spool import write_spool
+
+CONTENT_KEY_PATTERN = re.compile(r"^[a-z]+/([0-9a-f]{2})/\1[0-9a-f]{62}\.[a-z0-9]+$")
+
+# ref_count of a row whose object garbage collection is deleting
+TOMBSTONE = -1
+
+# How long a store waits for garbage collection to finish deleting the same
+# bytes before treating the tombstone as left by a crashed run
+COLLECTION_WAIT_SECONDS = 30.0
+
+
+def is_content_addressed(key: str) -> bool:
+    """Whether a storage key was produced by content_key"""
+    return bool(CONTENT_KEY_PATTERN.match(key))
+
+
+def content_key(prefix: str, content_hash: str, extension: str) -> str:
+    """Storage key of content-addressed bytes, fanned out by hash prefix"""
+    return f"{prefix}/{content_hash[:2]}/{content_hash}.{extension}"
+
+
+class ObjectCatalog:
+    """Writes content-addressed objects once and counts their references"""
+
+    def __init__(self):
+        self.writes = 0
+        self.dedup_hits = 0
+        self.bytes_written = 0
+        self.bytes_saved = 0
+        self.releases = 0
+        # Same-hash stores in this process wait for the first one to finish
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def _add_reference(self, db: Session, content_hash: str) -> Optional[StoredObject]:
+        # Increment in SQL so concurrent workers cannot lose a reference; a
+        # tombstoned object is being deleted and must not be revived
+        updated = db.query(StoredObject).filter(
+            StoredObject.content_hash == content_hash,
+            StoredObject.ref_count >= 0
+        ).update(
+            {
+                StoredObject.ref_count: StoredObject.ref_count + 1,
+                StoredObject.last_referenced_at: datetime.utcnow()
+            },
+            synchronize_session=False
+        )
+        # Committed either way, so no transaction stays open across the
+        # storage write that follows a miss
+        db.commit()
+        if not updated:
+            return None
+        return db.query(StoredObject).filter(StoredObject.content_hash == content_hash).first()
+
+    async def _await_collection(self, db: Session, content_hash: str):
+        """Wait until garbage collection has dropped a tombstoned row"""
+        deadline = time.monotonic() + COLLECTION_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            if not db.query(StoredObject.id).filter(
+                StoredObject.content_hash == content_hash,
+                StoredObject.ref_count == TOMBSTONE
+            ).first():
+                return
+            await asyncio.sleep(0.1)
+        # The collecting run died; its object may or may not be gone
+        db.query(StoredObject).filter(
+            StoredObject.content_hash == content_hash,
+            StoredObject.ref_count == TOMBSTONE
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    async def store(
+        self,
+        db: Session,
+        prefix: str,
+        content_hash: str,
+        content: bytes,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> Tuple[StoredObject, bool]:
+        """
+        Store bytes under their content hash, or reference the existing copy
+
+        Args:
+            db: Database session
+            prefix: Key prefix, e.g. "uploads"
+            content_hash: SHA-256 hex digest of content
+            content: Bytes to store
+            metadata: Storage metadata, kept from the first write only
+
+        Returns:
+            (catalog entry, whether the storage write was skipped)
+        """
+        lock = self._locks.setdefault(content_hash, asyncio.Lock())
+        self._waiters[content_hash] = self._waiters.get(content_hash, 0) + 1
+        try:
+            async with lock:
+                while True:
+                    stored = self._add_reference(db, content_hash)
+                    if stored is not None:
+                        self.dedup_hits += 1
+                        self.bytes_saved += stored.size
+                        return stored, True
+
+                    image_format = sniff_image_format(content)
+                    extension = FORMAT_EXTENSIONS.get(image_format, "bin")
+                    content_type = FORMAT_CONTENT_TYPES.get(image_format, "application/octet-stream")
+                    key = content_key(prefix, content_hash, extension)
+                    written = await write_spool.put_object(
+                        key, content, content_type, metadata, cache_control=IMMUTABLE_CACHE_CONTROL
+                    )
+
+                    stored = StoredObject(
+                        content_hash=content_hash,
+                        key=key,
+                        url=written["url"],
+                        etag=written["etag"],
+                        size=len(content),
+                        content_type=content_type
+                    )
+                    db.add(stored)
+                    try:
+                        db.commit()
+                    except IntegrityError:
+                        # Another worker catalogued the same bytes first; its write
+                        # went to the same key, so just take a reference
+                        db.rollback()
+                        stored = self._add_reference(db, content_hash)
+                        if stored is not None:
+                            self.dedup_hits += 1
+                            self.bytes_saved += stored.size
+                            return stored, True
+                        # Garbage collection is deleting these bytes, maybe after
+                        # our write landed; write them again once it is done
+                        await self._await_collection(db, content_hash)
+                        continue
+
+                    self.writes += 1
+                    self.bytes_written += len(content)
+                    return stored, False
+        finally:
+            self._waiters[content_hash] -= 1
+            if not self._waiters[content_hash]:
+                del self._waiters[content_hash]
+                del self._locks[content_hash]
+
+    def release(self, db: Session, content_hash: str) -> Optional[int]:
+        """
+        Drop one reference to an object
+
+        Objects are not deleted here; ones left at zero references are
+        removed by garbage collection. The decrement is not committed, so it
+        commits or rolls back with the removal of the row that held the
+        reference.
+
+        Returns:
+            Remaining reference count, or None if the hash is not catalogued
+        """
+        db.query(StoredObject).filter(
+            StoredObject.content_hash == content_hash,
+            StoredObject.ref_count > 0
+        ).update({StoredObject.ref_count: StoredObject.ref_count - 1}, synchronize_session=False)
+        self.releases += 1
+        return db.query(StoredObject.ref_count).filter(StoredObject.content_hash == content_hash).scalar()
+
+    def release_abandoned(self, db: Session, content_hashes: List[str]):
+        """
+        Give back references taken by store() for a caller that then failed
+
+        store() commits its reference before the caller records the row that
+        holds it, so rolling back the caller's transaction does not undo it.
+        The caller's transaction is rolled back and the releases committed
+        on their own; errors are logged so they do not mask the caller's.
+        """
+        try:
+            db.rollback()
+            for content_hash in content_hashes:
+                self.release(db, content_hash)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Releasing abandoned references failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get deduplication statistics since startup"""
+        stores = self.writes + self.dedup_hits
+        return {
+            "writes": self.writes,
+            "dedup_hits": self.dedup_hits,
+            "dedup_ratio": round(self.dedup_hits / stores, 3) if stores else 0,
+            "bytes_written": self.bytes_written,
+            "bytes_saved": self.bytes_saved,
+            "releases": self.releases
+        }
+
+
+# Global object catalog
+object_catalog = ObjectCatalog()
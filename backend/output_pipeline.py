@@ -0,0 +1,93 @@
+"""
+Download-once fan-out of model outputs for PhotoPro AI.
+A finished prediction's image is fetched a single time, hashed, and the same
+buffer is handed to every consumer (thumbnailing, derivatives, storage).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from http_client import http_client
+from image_headers import sniff_image_format
+from utils import calculate_file_hash
+
+# Consumers receive the image bytes and their SHA-256 hex digest
+OutputConsumer = Callable[[bytes, str], Awaitable[Any]]
+
+
+class OutputFanOut:
+    """Feeds one output, downloaded in full, to several consumers"""
+
+    def __init__(self):
+        self.outputs = 0
+        self.download_failures = 0
+        self.consumer_failures = 0
+        self.bytes_downloaded = 0
+
+    async def run(self, url: str, consumers: Dict[str, OutputConsumer]) -> Dict[str, Any]:
+        """
+        Download an output once and run all consumers on it concurrently
+
+        Args:
+            url: Model output URL
+            consumers: Named coroutine functions taking (bytes, hash)
+
+        Returns:
+            Dict with 'hash', 'bytes', 'format', and 'results' mapping each
+            consumer name to its return value (None if it failed or the
+            download failed)
+
+        Raises:
+            asyncio.CancelledError: If a consumer was cancelled
+        """
+        results: Dict[str, Any] = {name: None for name in consumers}
+
+        try:
+            image_content = await http_client.fetch_bytes(url)
+            image_format = sniff_image_format(image_content)
+            if image_format is None:
+                raise ValueError("Model output is not a JPEG, PNG or WEBP image")
+        except Exception as e:
+            self.download_failures += 1
+            print(f"Output download failed: {str(e)}")
+            return {"hash": None, "bytes": 0, "format": None, "results": results}
+
+        self.outputs += 1
+        self.bytes_downloaded += len(image_content)
+        content_hash = calculate_file_hash(image_content)
+
+        names = list(consumers)
+        outcomes = await asyncio.gather(
+            *(consumers[name](image_content, content_hash) for name in names),
+            return_exceptions=True
+        )
+
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, BaseException):
+                self.consumer_failures += 1
+                print(f"Output consumer '{name}' failed: {str(outcome)}")
+            else:
+                results[name] = outcome
+
+        return {
+            "hash": content_hash,
+            "bytes": len(image_content),
+            "format": image_format,
+            "results": results
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Fan-out counters for the metrics endpoint"""
+        return {
+            "outputs": self.outputs,
+            "download_failures": self.download_failures,
+            "consumer_failures": self.consumer_failures,
+            "bytes_downloaded": self.bytes_downloaded,
+            "avg_bytes_per_output": round(self.bytes_downloaded / self.outputs) if self.outputs else 0
+        }
+
+
+# Global fan-out instance
+output_fan_out = OutputFanOut()
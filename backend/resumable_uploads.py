@@ -0,0 +1,405 @@
+"""
+Resumable uploads for PhotoPro AI.
+A tus-style protocol: create an upload, PATCH chunks at the current offset
+(resuming from the offset HEAD reports after a dropped connection), then
+finalize. Chunks are appended to a spool file on local disk and hashed as
+they arrive, so finalizing never re-reads them to verify the upload.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+
+from config import settings
+from direct_uploads import EXTENSION_CONTENT_TYPES
+from image_headers import FORMAT_CONTENT_TYPES, MAX_IMAGE_HEADER_BYTES, parse_image_header
+from utils import ALLOWED_IMAGE_EXTENSIONS, MAX_UPLOAD_BYTES, prevalidate_image_header
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Received bytes are buffered up to this size before each disk write
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+# Minimum seconds between sweeps for expired uploads
+CLEANUP_INTERVAL_SECONDS = 60
+
+# tus status for a chunk whose Upload-Checksum does not match
+CHECKSUM_MISMATCH_STATUS = 460
+
+
+class UploadSession:
+    """One in-progress upload and its running hash"""
+
+    def __init__(self, upload_id: str, user_id: int, filename: str, content_type: str,
+                 length: int, checksum: Optional[str], expires_at: float):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.filename = filename
+        self.content_type = content_type
+        self.length = length
+        self.checksum = checksum
+        self.expires_at = expires_at
+        self.offset = 0
+        self.header_checked = False
+        self.hasher = None  # Rebuilt from the spool file if the process restarted
+        self.lock = asyncio.Lock()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.upload_id,
+            "user_id": self.user_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "length": self.length,
+            "checksum": self.checksum,
+            "expires_at": self.expires_at,
+            "header_checked": self.header_checked
+        }
+
+
+def parse_upload_checksum(header: Optional[str]) -> Optional[bytes]:
+    """
+    Digest from a tus 'Upload-Checksum: sha256 <base64>' header
+
+    Raises:
+        HTTPException: 400 for another algorithm or a malformed value
+    """
+    if not header:
+        return None
+    try:
+        algorithm, encoded = header.split(" ", 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed Upload-Checksum header")
+    if algorithm.lower() != "sha256" or len(digest) != hashlib.sha256().digest_size:
+        raise HTTPException(status_code=400, detail="Upload-Checksum must be a sha256 digest")
+    return digest
+
+
+class ResumableUploadManager:
+    """
+    Spools resumable uploads to disk
+
+    Each upload is a '<id>.part' data file plus a '<id>.json' metadata file.
+    The data file's size is the upload offset, so uploads survive a restart;
+    only the running hash is in memory and is rebuilt from disk if lost.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.sessions: Dict[str, UploadSession] = {}
+        self.created = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.patches = 0
+        self.bytes_received = 0
+        self.checksum_failures = 0
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    # Spool files --------------------------------------------------------
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.json")
+
+    def _load(self):
+        """Pick up uploads spooled before a restart"""
+        with self._load_lock:
+            if self._loaded:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            for filename in os.listdir(self.root):
+                upload_id, extension = os.path.splitext(filename)
+                if extension != ".json" or not UPLOAD_ID_PATTERN.match(upload_id):
+                    continue
+                try:
+                    with open(self._meta_path(upload_id)) as meta_file:
+                        meta = json.load(meta_file)
+                    session = UploadSession(
+                        upload_id, meta["user_id"], meta["filename"], meta["content_type"],
+                        meta["length"], meta["checksum"], meta["expires_at"]
+                    )
+                    session.header_checked = meta.get("header_checked", False)
+                    session.offset = os.path.getsize(self._data_path(upload_id))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Discarding unreadable upload {upload_id}: {str(e)}")
+                    self._remove_files(upload_id)
+                    continue
+                self.sessions[upload_id] = session
+            self._loaded = True
+
+    def _save_meta(self, session: UploadSession):
+        tmp_path = self._meta_path(session.upload_id) + ".tmp"
+        with open(tmp_path, "w") as meta_file:
+            json.dump(session.to_dict(), meta_file)
+        os.replace(tmp_path, self._meta_path(session.upload_id))
+
+    def _remove_files(self, upload_id: str):
+        for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _create_sync(self, session: UploadSession):
+        self._load()
+        open(self._data_path(session.upload_id), "wb").close()
+        self._save_meta(session)
+
+    def _rebuild_hasher(self, session: UploadSession):
+        hasher = hashlib.sha256()
+        with open(self._data_path(session.upload_id), "rb") as data_file:
+            for block in iter(lambda: data_file.read(WRITE_BUFFER_BYTES), b""):
+                hasher.update(block)
+        session.hasher = hasher
+
+    def _append_sync(self, session: UploadSession, data: bytes, hashers: list):
+        with open(self._data_path(session.upload_id), "ab") as data_file:
+            data_file.write(data)
+        for hasher in hashers:
+            hasher.update(data)
+
+    def _truncate_sync(self, session: UploadSession, offset: int):
+        with open(self._data_path(session.upload_id), "r+b") as data_file:
+            data_file.truncate(offset)
+
+    def _read_sync(self, session: UploadSession, length: int) -> bytes:
+        with open(self._data_path(session.upload_id), "rb") as data_file:
+            return data_file.read(length)
+
+    # Sessions -----------------------------------------------------------
+
+    async def _discard(self, session: UploadSession):
+        self.sessions.pop(session.upload_id, None)
+        await asyncio.to_thread(self._remove_files, session.upload_id)
+
+    async def purge_expired(self):
+        """Remove uploads not touched before their expiry"""
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = now
+        for session in list(self.sessions.values()):
+            if session.expires_at < now and not session.lock.locked():
+                self.expired += 1
+                await self._discard(session)
+
+    async def get(self, upload_id: str, user_id: int) -> UploadSession:
+        """
+        Look up one of the user's uploads
+
+        Raises:
+            HTTPException: 404 if it does not exist, expired or is not theirs
+        """
+        await asyncio.to_thread(self._load)
+        session = self.sessions.get(upload_id) if UPLOAD_ID_PATTERN.match(upload_id) else None
+        if session is None or session.user_id != user_id or session.expires_at < time.time():
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return session
+
+    async def create(self, user_id: int, filename: str, content_type: str, length: int,
+                     checksum: Optional[str] = None) -> UploadSession:
+        """
+        Start a resumable upload
+
+        Args:
+            user_id: Owner of the upload
+            filename: Client file name
+            content_type: MIME type of the file
+            length: Total size in bytes
+            checksum: Optional hex SHA-256 of the whole file, checked on finalize
+
+        Raises:
+            HTTPException: 400 if the declared file is not acceptable, 429 if
+            the user has too many uploads in progress
+        """
+        extension = os.path.splitext(filename.lower())[1]
+        if extension not in ALLOWED_IMAGE_EXTENSIONS:
+            raise HTTPException(status_code=400, detail="File must be JPG, PNG, or WEBP format")
+        if EXTENSION_CONTENT_TYPES[extension] != content_type:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Content type for {extension} files must be {EXTENSION_CONTENT_TYPES[extension]}"
+            )
+        if not 0 < length <= MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=400, detail="File size must be less than 10MB")
+        if checksum is not None and not re.match(r"^[0-9a-f]{64}$", checksum.lower()):
+            raise HTTPException(status_code=400, detail="Checksum must be a hex SHA-256 digest")
+
+        await asyncio.to_thread(self._load)
+        await self.purge_expired()
+        active = sum(session.user_id == user_id for session in self.sessions.values())
+        if active >= settings.RESUMABLE_MAX_ACTIVE_PER_USER:
+            raise HTTPException(status_code=429, detail="Too many uploads in progress")
+
+        session = UploadSession(
+            uuid.uuid4().hex, user_id, filename, content_type, length,
+            checksum.lower() if checksum else None,
+            time.time() + settings.RESUMABLE_UPLOAD_EXPIRES
+        )
+        session.hasher = hashlib.sha256()
+        await asyncio.to_thread(self._create_sync, session)
+        self.sessions[session.upload_id] = session
+        self.created += 1
+        return session
+
+    async def append(self, session: UploadSession, offset: int, chunks: AsyncIterator[bytes],
+                     chunk_checksum: Optional[bytes] = None) -> int:
+        """
+        Append a request body at the given offset
+
+        Without a chunk checksum, bytes received before a dropped connection
+        are kept so the client can resume after them. With one, the chunk is
+        applied all-or-nothing.
+
+        Returns:
+            New upload offset
+
+        Raises:
+            HTTPException: 409 if the offset is stale or the upload is busy,
+            400 if the body overruns the declared length or the header is
+            invalid, 460 if the chunk checksum does not match
+        """
+        if session.lock.locked():
+            raise HTTPException(status_code=409, detail="Upload is already being written")
+
+        async with session.lock:
+            if offset != session.offset:
+                raise HTTPException(status_code=409, detail=f"Upload offset is {session.offset}")
+            if session.hasher is None:
+                await asyncio.to_thread(self._rebuild_hasher, session)
+
+            start = session.offset
+            running = session.hasher.copy()
+            hashers = [running]
+            chunk_hasher = None
+            if chunk_checksum is not None:
+                chunk_hasher = hashlib.sha256()
+                hashers.append(chunk_hasher)
+
+            buffer = bytearray()
+            received = 0
+            complete = False
+            self.patches += 1
+            try:
+                async for chunk in chunks:
+                    received += len(chunk)
+                    if start + received > session.length:
+                        raise HTTPException(status_code=400, detail="Upload exceeds its declared length")
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_BYTES:
+                        await asyncio.to_thread(self._append_sync, session, bytes(buffer), hashers)
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(self._append_sync, session, bytes(buffer), hashers)
+                complete = True
+            except HTTPException:
+                await asyncio.to_thread(self._truncate_sync, session, start)
+                raise
+            except Exception:
+                # Connection dropped: keep what arrived unless the chunk is checksummed
+                if chunk_hasher is not None:
+                    await asyncio.to_thread(self._truncate_sync, session, start)
+                    raise
+                if buffer:
+                    await asyncio.to_thread(self._append_sync, session, bytes(buffer), hashers)
+                session.offset = start + received
+                session.hasher = running
+                self.bytes_received += received
+                raise
+
+            if complete and chunk_hasher is not None and chunk_hasher.digest() != chunk_checksum:
+                self.checksum_failures += 1
+                await asyncio.to_thread(self._truncate_sync, session, start)
+                raise HTTPException(status_code=CHECKSUM_MISMATCH_STATUS, detail="Chunk checksum mismatch")
+
+            session.offset = start + received
+            session.hasher = running
+            session.expires_at = time.time() + settings.RESUMABLE_UPLOAD_EXPIRES
+            self.bytes_received += received
+
+            await self._check_header(session)
+            await asyncio.to_thread(self._save_meta, session)
+            return session.offset
+
+    async def _check_header(self, session: UploadSession):
+        """Reject a bad upload as soon as its header has arrived"""
+        if session.header_checked:
+            return
+        header = await asyncio.to_thread(self._read_sync, session, MAX_IMAGE_HEADER_BYTES)
+        parsed = parse_image_header(header)
+        if parsed is None and session.offset < min(session.length, MAX_IMAGE_HEADER_BYTES):
+            return
+
+        # An unparseable header is left to the full decode on finalize
+        is_valid, error = prevalidate_image_header(header, session.filename, session.length)
+        if is_valid and parsed is not None and FORMAT_CONTENT_TYPES[parsed[0]] != session.content_type:
+            is_valid, error = False, "File contents do not match the declared content type"
+        if not is_valid:
+            self.rejected += 1
+            await self._discard(session)
+            raise HTTPException(status_code=400, detail=error)
+        session.header_checked = True
+
+    async def read_completed(self, session: UploadSession) -> bytes:
+        """
+        Contents of a fully received upload, verified against its checksum
+
+        The caller must hold the session lock.
+
+        Raises:
+            HTTPException: 409 if bytes are still missing, 400 (and the
+            upload is discarded) if the whole-file checksum does not match
+        """
+        if session.offset != session.length:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {session.offset} of {session.length} bytes received"
+            )
+        if session.hasher is None:
+            await asyncio.to_thread(self._rebuild_hasher, session)
+        if session.checksum is not None and session.hasher.hexdigest() != session.checksum:
+            self.checksum_failures += 1
+            await self.discard(session)
+            raise HTTPException(status_code=400, detail="Upload checksum mismatch")
+        return await asyncio.to_thread(self._read_sync, session, session.length)
+
+    async def finish(self, session: UploadSession):
+        """Drop the spool files of a finalized upload"""
+        self.completed += 1
+        await self._discard(session)
+
+    async def discard(self, session: UploadSession):
+        """Drop an upload that will not be finalized"""
+        self.rejected += 1
+        await self._discard(session)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get resumable upload statistics"""
+        return {
+            "active": len(self.sessions),
+            "spooled_bytes": sum(session.offset for session in self.sessions.values()),
+            "created": self.created,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "patches": self.patches,
+            "bytes_received": self.bytes_received,
+            "checksum_failures": self.checksum_failures
+        }
+
+
+# Global resumable upload manager
+resumable_uploads = ResumableUploadManager(settings.RESUMABLE_UPLOAD_DIR)
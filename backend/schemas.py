@@ -2,8 +2,9 @@
 Pydantic schemas for request/response validation in PhotoPro AI.
 """
 
+import json
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -73,6 +74,44 @@ class PhotoGenerate(BaseModel):
         return v
 
 
+class UploadIntentRequest(BaseModel):
+    """Schema for requesting a direct-to-storage upload"""
+    filename: str
+    content_type: str
+    size: int
+
+
+class UploadCompleteRequest(BaseModel):
+    """Schema for confirming a direct-to-storage upload"""
+    upload_token: str
+
+
+class ResumableUploadCreate(BaseModel):
+    """Schema for starting a resumable upload"""
+    filename: str
+    content_type: str
+    size: int
+    checksum: Optional[str] = None  # Hex SHA-256 of the whole file
+
+
+class UploadResponse(BaseModel):
+    """Schema for an uploaded source image"""
+    id: int
+    url: str
+    content_hash: Optional[str] = None
+    filename: str
+    format: str
+    width: int
+    height: int
+    size: int
+    exif_orientation: int
+    pinned: bool = False
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
 class PhotoResponse(BaseModel):
     """Schema for photo response"""
     id: int
@@ -81,6 +120,9 @@ class PhotoResponse(BaseModel):
     original_url: str
     processed_url: Optional[str]
     thumbnail_url: Optional[str]
+    content_hash: Optional[str] = None
+    placeholder: Optional[str] = None
+    upload_id: Optional[int] = None
     credits_used: int
     status: str
     created_at: datetime
@@ -89,6 +131,23 @@ class PhotoResponse(BaseModel):
         from_attributes = True
 
 
+class SpriteTile(BaseModel):
+    """Position of one photo within a gallery sprite"""
+    photo_id: int
+    x: int
+    y: int
+
+
+class GallerySpriteResponse(BaseModel):
+    """Schema for a gallery contact sheet and its offset map"""
+    version: int
+    sprite_url: str
+    width: int
+    height: int
+    tile_size: int
+    tiles: List[SpriteTile]
+
+
 class CreditPurchase(BaseModel):
     """Schema for credit purchase request"""
     plan: str
@@ -112,3 +171,50 @@ class CreditHistoryResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+
+class DeletionJobResponse(BaseModel):
+    """Schema for bulk deletion job progress"""
+    id: int
+    user_id: Optional[int] = None
+    reason: str
+    status: str
+    total: int
+    deleted: int
+    failed: int
+    released: int
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class GcRunResponse(BaseModel):
+    """Schema for orphan-object garbage collection progress"""
+    id: int
+    status: str
+    dry_run: bool
+    cutoff: datetime
+    checkpoint: Optional[str] = None
+    scanned: int
+    orphans: int
+    orphan_bytes: int
+    deleted: int
+    failed: int
+    missing: int
+    report: List[str] = []
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    @validator('report', pre=True)
+    def parse_report(cls, v):
+        if v is None:
+            return []
+        if isinstance(v, str):
+            return json.loads(v)
+        return v
+    
+    class Config:
+        from_attributes = True
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Storage upload benchmark for PhotoPro AI backend.
+Compares the old inline put_object path against the pooled, multipart
+S3Backend under concurrent load, using a local S3-compatible stand-in.
+
+Usage:
+    pip install "moto[server]"
+    python scripts/benchmark_storage.py --requests 64 --concurrency 32
+
+By default a moto server is started in a subprocess behind a small proxy that
+adds a per-connection round trip and bandwidth cap, so connection reuse and
+parallel parts matter the way they do against a remote region. Pass
+--endpoint http://localhost:9000 to run against MinIO (or anything else)
+directly instead.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MB = 1024 * 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"S3 stand-in did not start on port {port}")
+
+
+async def _pipe(reader, writer, bytes_per_second):
+    try:
+        while True:
+            chunk = await reader.read(64 * 1024)
+            if not chunk:
+                break
+            if bytes_per_second:
+                await asyncio.sleep(len(chunk) / bytes_per_second)
+            writer.write(chunk)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def run_link_proxy(listen_port, target_port, rtt_ms, link_mbps):
+    """
+    TCP proxy giving every connection a round-trip delay and an upload
+    bandwidth cap, like a single TCP stream to a remote region
+    """
+    bytes_per_second = link_mbps * MB / 8
+
+    async def handle(client_reader, client_writer):
+        await asyncio.sleep(rtt_ms / 1000)
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        await asyncio.gather(
+            _pipe(client_reader, server_writer, bytes_per_second),
+            _pipe(server_reader, client_writer, 0)
+        )
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", listen_port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def report(name, latencies, elapsed, total_bytes, max_lag):
+    print(
+        f"{name:<10} p50 {percentile(latencies, 0.50) * 1000:8.1f} ms"
+        f"  p95 {percentile(latencies, 0.95) * 1000:8.1f} ms"
+        f"  p99 {percentile(latencies, 0.99) * 1000:8.1f} ms"
+        f"  mean {statistics.mean(latencies) * 1000:8.1f} ms"
+        f"  {total_bytes / MB / elapsed:7.1f} MB/s"
+        f"  max loop lag {max_lag * 1000:7.1f} ms"
+    )
+
+
+async def run_load(upload, payloads, concurrency):
+    """
+    Upload every payload with at most `concurrency` in flight
+
+    Latency is measured from when a request arrives (all arrive at once),
+    so time spent waiting behind a blocked event loop is included. Loop lag
+    is how late a 10 ms ticker wakes up, i.e. how long other requests would
+    stall.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    lags = [0.0]
+    running = True
+
+    async def ticker():
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+
+    async def one(index, data):
+        async with limit:
+            await upload(f"benchmark/{index}.bin", data)
+        latencies.append(time.perf_counter() - started)
+
+    ticker_task = asyncio.ensure_future(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index, data) for index, data in enumerate(payloads)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await ticker_task
+    return latencies, elapsed, max(lags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--endpoint", help="S3-compatible endpoint (default: start moto)")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--small-mb", type=float, default=2, help="Size of typical uploads")
+    parser.add_argument("--large-mb", type=float, default=24, help="Size of large uploads (multipart)")
+    parser.add_argument("--large-every", type=int, default=8, help="Every Nth upload is large")
+    parser.add_argument("--rtt-ms", type=float, default=20, help="Simulated round trip per connection")
+    parser.add_argument("--link-mbps", type=float, default=200, help="Simulated bandwidth per connection (0: unlimited)")
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        # Separate process so the stand-in does not compete for our GIL
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "moto.server", "-p", str(port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        wait_for_port(port)
+
+        proxy_port = free_port()
+        proxy = multiprocessing.Process(
+            target=run_link_proxy,
+            args=(proxy_port, port, args.rtt_ms, args.link_mbps),
+            daemon=True
+        )
+        proxy.start()
+        wait_for_port(proxy_port)
+        endpoint = f"http://127.0.0.1:{proxy_port}"
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ["AWS_BUCKET_NAME"] = "photopro-benchmark"
+    os.environ["S3_ENDPOINT_URL"] = endpoint
+    os.environ["STORAGE_BACKEND"] = "s3"
+
+    import boto3
+    from storage_backends import storage_backend
+
+    baseline_client = boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        region_name="us-east-1",
+        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"]
+    )
+    try:
+        baseline_client.create_bucket(Bucket="photopro-benchmark")
+    except baseline_client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    payloads = [
+        os.urandom(int((args.large_mb if index % args.large_every == 0 else args.small_mb) * MB))
+        for index in range(args.requests)
+    ]
+    total_bytes = sum(len(data) for data in payloads)
+
+    async def inline_put(key, data):
+        # Previous behaviour: one blocking put_object on the event loop,
+        # default botocore pool of 10 connections
+        baseline_client.put_object(Bucket="photopro-benchmark", Key=key, Body=data)
+
+    async def backend_put(key, data):
+        await storage_backend.put(key, data, "application/octet-stream")
+
+    print(
+        f"{args.requests} uploads, {args.concurrency} concurrent, {total_bytes / MB:.0f} MB total, "
+        f"endpoint {endpoint}" + ("" if args.endpoint else f" ({args.rtt_ms:g} ms RTT, {args.link_mbps:g} Mbit/s per connection)")
+    )
+    for name, upload in (("inline", inline_put), ("backend", backend_put)):
+        latencies, elapsed, max_lag = asyncio.run(run_load(upload, payloads, args.concurrency))
+        report(name, latencies, elapsed, total_bytes, max_lag)
+    print(f"multipart uploads: {storage_backend.get_stats()['multipart_uploads']}")
+
+    if server is not None:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Gallery contact sheets for PhotoPro AI.
+Packs a user's recent thumbnails into one sprite image plus an offset map so
+a history page needs a single image request instead of one per photo.
+"""
+
+import hashlib
+import hmac
+import io
+import math
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from config import settings
+
+SPRITE_DEFAULT_TILES = 50
+SPRITE_MAX_TILES = 100
+SPRITE_DEFAULT_TILE_SIZE = 128
+SPRITE_TILE_SIZES = (64, 96, 128, 160, 192, 256)
+SPRITE_COLUMNS = 10
+SPRITE_QUALITY = 80
+
+# Media cache variants holding the sheet and its offset map
+SPRITE_IMAGE_VARIANT = "sprite.jpg"
+SPRITE_MAP_VARIANT = "sprite.json"
+
+
+def sprite_key(user_id: int, gallery_version: int, limit: int, tile_size: int) -> str:
+    """
+    Media cache key of a contact sheet
+
+    Keyed by the gallery version, so a completed photo (which bumps the
+    version) makes the next request build a fresh sheet. Signed with the
+    app secret so sheet URLs cannot be guessed from a user ID.
+    """
+    message = f"sprite:{user_id}:{gallery_version}:{limit}:{tile_size}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sprite_pixels(count: int, tile_size: int) -> int:
+    """Decoded pixel count of a sheet with count tiles"""
+    columns = min(count, SPRITE_COLUMNS)
+    rows = math.ceil(count / SPRITE_COLUMNS)
+    return columns * rows * tile_size * tile_size
+
+
+def compose_sprite(
+    thumbnails: List[Optional[bytes]],
+    tile_size: int
+) -> Tuple[bytes, Tuple[int, int], List[Optional[Tuple[int, int]]]]:
+    """
+    Lay thumbnails out on a grid, centre-cropped to square tiles
+
+    Args:
+        thumbnails: Encoded thumbnails; None or undecodable entries are skipped
+        tile_size: Edge length of each tile in pixels
+
+    Returns:
+        (JPEG bytes, (width, height) of the sheet, (x, y) offset of each
+        input or None if it was skipped)
+    """
+    tiles = []
+    for content in thumbnails:
+        if content is None:
+            tiles.append(None)
+            continue
+        try:
+            image = Image.open(io.BytesIO(content))
+            image.draft('RGB', (tile_size, tile_size))
+            tile = ImageOps.fit(image.convert('RGB'), (tile_size, tile_size), Image.Resampling.LANCZOS)
+        except Exception as e:
+            print(f"Sprite tile skipped: {str(e)}")
+            tile = None
+        tiles.append(tile)
+
+    count = max(sum(tile is not None for tile in tiles), 1)
+    columns = min(count, SPRITE_COLUMNS)
+    rows = math.ceil(count / SPRITE_COLUMNS)
+    sheet = Image.new('RGB', (columns * tile_size, rows * tile_size), (240, 240, 240))
+
+    offsets: List[Optional[Tuple[int, int]]] = []
+    index = 0
+    for tile in tiles:
+        if tile is None:
+            offsets.append(None)
+            continue
+        offset = ((index % SPRITE_COLUMNS) * tile_size, (index // SPRITE_COLUMNS) * tile_size)
+        sheet.paste(tile, offset)
+        offsets.append(offset)
+        index += 1
+
+    output = io.BytesIO()
+    sheet.save(output, format='JPEG', quality=SPRITE_QUALITY, optimize=True, progressive=True)
+    return output.getvalue(), sheet.size, offsets
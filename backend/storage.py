@@ -7,12 +7,19 @@ import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 from fastapi import UploadFile, HTTPException
-from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
 import os
 import io
 from PIL import Image
 import uuid
 
+from asset_index import asset_index, index_session
+from storage_backends import run_storage_call
+
+# Most public IDs one delete_resources call accepts
+DELETE_RESOURCES_LIMIT = 100
+
 # Configure Cloudinary
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -21,6 +28,20 @@ cloudinary.config(
     secure=True
 )
 
+def index_upload(result: Dict[str, Any], db: Optional[Session] = None):
+    """
+    Record an uploaded asset in the local index
+    
+    The asset already exists at this point, so an index failure is logged
+    rather than failing the upload; reconciliation picks it up later.
+    """
+    try:
+        with index_session(db) as session:
+            asset_index.record(session, result)
+    except Exception as e:
+        print(f"Asset index update failed for {result.get('public_id')}: {e}")
+
+
 class CloudinaryStorage:
     """Cloudinary storage service for PhotoPro AI"""
     
@@ -29,7 +50,8 @@ class CloudinaryStorage:
         file: UploadFile, 
         user_id: int, 
         folder: str = "originals",
-        optimize: bool = True
+        optimize: bool = True,
+        db: Optional[Session] = None
     ) -> Dict[str, str]:
         """
         Upload photo to Cloudinary with optimization
@@ -39,6 +61,7 @@ class CloudinaryStorage:
             user_id: User ID for folder organization
             folder: Subfolder within user directory
             optimize: Whether to apply automatic optimization
+            db: Session for the asset index update (optional)
             
         Returns:
             Dict with 'url' and 'public_id'
@@ -71,11 +94,14 @@ class CloudinaryStorage:
                 ]
             
             # Upload to Cloudinary
-            result = cloudinary.uploader.upload(
+            result = await run_storage_call(
+                cloudinary.uploader.upload,
                 file_content,
                 **upload_params
             )
             
+            index_upload(result, db)
+            
             return {
                 "url": result['secure_url'],
                 "public_id": result['public_id'],
@@ -96,7 +122,8 @@ class CloudinaryStorage:
         url: str, 
         user_id: int, 
         folder: str = "generated",
-        public_id: Optional[str] = None
+        public_id: Optional[str] = None,
+        db: Optional[Session] = None
     ) -> Dict[str, str]:
         """
         Upload image from URL to Cloudinary
@@ -106,6 +133,7 @@ class CloudinaryStorage:
             user_id: User ID for folder organization
             folder: Subfolder within user directory
             public_id: Custom public ID (optional)
+            db: Session for the asset index update (optional)
             
         Returns:
             Dict with 'url' and 'public_id'
@@ -123,11 +151,14 @@ class CloudinaryStorage:
                 ]
             }
             
-            result = cloudinary.uploader.upload(
+            result = await run_storage_call(
+                cloudinary.uploader.upload,
                 url,
                 **upload_params
             )
             
+            index_upload(result, db)
+            
             return {
                 "url": result['secure_url'],
                 "public_id": result['public_id'],
@@ -144,12 +175,13 @@ class CloudinaryStorage:
             )
     
     @staticmethod
-    async def delete_photo(public_id: str) -> bool:
+    async def delete_photo(public_id: str, db: Optional[Session] = None) -> bool:
         """
-        Delete photo from Cloudinary
+        Delete photo from Cloudinary and the asset index
         
         Args:
             public_id: Cloudinary public ID
+            db: Session for the asset index update (optional)
             
         Returns:
             bool: True if successful
@@ -158,8 +190,11 @@ class CloudinaryStorage:
             HTTPException: If deletion fails
         """
         try:
-            result = cloudinary.uploader.destroy(public_id)
+            result = await run_storage_call(cloudinary.uploader.destroy, public_id)
             
+            if result.get('result') in ('ok', 'not found'):
+                with index_session(db) as session:
+                    asset_index.remove(session, public_id)
             if result.get('result') == 'ok':
                 return True
             else:
@@ -171,6 +206,35 @@ class CloudinaryStorage:
                 detail=f"Photo deletion failed: {str(e)}"
             )
     
+    @staticmethod
+    async def delete_photos(public_ids: List[str], db: Optional[Session] = None) -> List[str]:
+        """
+        Delete many photos, up to 100 public IDs per Admin API call
+        
+        Args:
+            public_ids: Cloudinary public IDs
+            db: Session for the asset index update (optional)
+            
+        Returns:
+            list: Public IDs that could not be deleted
+        """
+        failed = []
+        for start in range(0, len(public_ids), DELETE_RESOURCES_LIMIT):
+            batch = public_ids[start:start + DELETE_RESOURCES_LIMIT]
+            try:
+                result = await run_storage_call(cloudinary.api.delete_resources, batch, invalidate=True)
+            except Exception as e:
+                print(f"Bulk photo deletion failed: {e}")
+                failed.extend(batch)
+                continue
+            deleted = result.get('deleted', {})
+            gone = [public_id for public_id in batch if deleted.get(public_id) in ('deleted', 'not_found')]
+            failed.extend(public_id for public_id in batch if public_id not in gone)
+            if gone:
+                with index_session(db) as session:
+                    asset_index.remove_many(session, gone)
+        return failed
+    
     @staticmethod
     async def get_photo_url(public_id: str, transformations: Optional[Dict] = None) -> str:
         """
@@ -237,25 +301,45 @@ class CloudinaryStorage:
             )
     
     @staticmethod
-    async def list_user_photos(user_id: int, folder: str = "originals") -> list:
+    async def list_user_photos(
+        user_id: int,
+        folder: str = "originals",
+        limit: int = 100,
+        offset: int = 0,
+        db: Optional[Session] = None
+    ) -> list:
         """
-        List all photos for a user
+        List photos for a user, newest first
+        
+        Served from the local asset index, not the Admin API, so it is not
+        rate limited or truncated at one page.
         
         Args:
             user_id: User ID
             folder: Folder to list (originals, generated, etc.)
+            limit: Maximum number of photos
+            offset: Number of photos to skip
+            db: Session to query (optional)
             
         Returns:
-            list: List of photo information
+            list: Photo information in the shape of Admin API resources
         """
         try:
-            result = cloudinary.api.resources(
-                type="upload",
-                prefix=f"photopro/user_{user_id}/{folder}",
-                max_results=100
-            )
+            with index_session(db) as session:
+                assets = asset_index.list(session, f"photopro/user_{user_id}/{folder}", limit, offset)
             
-            return result.get('resources', [])
+            return [
+                {
+                    "public_id": asset.public_id,
+                    "secure_url": asset.url,
+                    "format": asset.format,
+                    "width": asset.width,
+                    "height": asset.height,
+                    "bytes": asset.bytes,
+                    "created_at": asset.created_at.isoformat() + "Z"
+                }
+                for asset in assets
+            ]
             
         except Exception as e:
             raise HTTPException(
@@ -263,6 +347,21 @@ class CloudinaryStorage:
                 detail=f"Photo listing failed: {str(e)}"
             )
     
+    @staticmethod
+    async def reconcile_user_photos(user_id: int, db: Optional[Session] = None) -> Dict:
+        """
+        Re-sync a user's asset index entries with Cloudinary
+        
+        Pages through the Admin API with next_cursor; use for repairs and
+        backfills, not on the request path.
+        
+        Returns:
+            Dict with 'seen', 'added' and 'removed' counts
+        """
+        prefix = f"photopro/user_{user_id}/"
+        with index_session(db) as session:
+            return await asset_index.reconcile(session, prefix)
+    
     @staticmethod
     async def test_connection() -> bool:
         """
@@ -273,7 +372,7 @@ class CloudinaryStorage:
         """
         try:
             # Test with a simple API call
-            cloudinary.api.ping()
+            await run_storage_call(cloudinary.api.ping)
             return True
         except Exception as e:
             print(f"Cloudinary connection test failed: {e}")
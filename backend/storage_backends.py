@@ -0,0 +1,733 @@
+"""
+Pluggable object storage for PhotoPro AI.
+One async interface over S3, Cloudinary and the local filesystem; blocking
+SDK calls run on a bounded storage executor instead of the event loop.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import io
+import itertools
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlencode
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+from config import settings
+from http_client import http_client
+
+try:
+    import cloudinary
+    import cloudinary.api
+    import cloudinary.exceptions
+    import cloudinary.uploader
+    import cloudinary.utils
+except ImportError:  # Only needed for STORAGE_BACKEND=cloudinary
+    cloudinary = None
+
+
+# Cache-Control for objects whose key is derived from their content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageObjectNotFound(Exception):
+    """Raised when a key does not exist in the backend"""
+
+
+async def run_storage_call(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking storage SDK call on the storage executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor, partial(func, *args, **kwargs))
+
+
+class StorageBackend(ABC):
+    """
+    Async object storage keyed by slash-separated paths
+
+    Keys look like "uploads/{user_id}/{name}.jpg"; each backend maps them
+    onto its own namespace.
+    """
+
+    name = "base"
+    # Most keys one delete_batch call may take (the provider's bulk limit)
+    delete_batch_size = 100
+
+    def __init__(self):
+        self.operations: Dict[str, int] = {}
+        self.failures = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.total_latency = 0.0
+
+    async def _call(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        started = time.perf_counter()
+        try:
+            return await run_storage_call(func, *args, **kwargs)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.operations[operation] = self.operations.get(operation, 0) + 1
+            self.total_latency += time.perf_counter() - started
+
+    async def put(
+        self,
+        key: str,
+        data: bytes,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None,
+        cache_control: Optional[str] = None
+    ) -> str:
+        """
+        Store an object
+
+        Returns:
+            str: Public URL of the stored object
+        """
+        stored = await self.put_object(key, data, content_type, metadata, cache_control)
+        return stored["url"]
+
+    @abstractmethod
+    async def put_object(
+        self,
+        key: str,
+        data: bytes,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None,
+        cache_control: Optional[str] = None
+    ) -> Dict[str, Optional[str]]:
+        """
+        Store an object
+
+        Args:
+            cache_control: Cache-Control sent when the object is served; use
+                IMMUTABLE_CACHE_CONTROL for content-addressed keys
+
+        Returns:
+            Dict with the public 'url' and the backend's 'etag' (or None)
+        """
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """
+        Read an object
+
+        Raises:
+            StorageObjectNotFound: If the key does not exist
+        """
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Delete an object; missing keys are ignored"""
+
+    async def delete_batch(self, keys: List[str]) -> List[str]:
+        """
+        Delete up to delete_batch_size objects in as few calls as possible
+
+        Missing keys count as deleted.
+
+        Returns:
+            Keys that could not be deleted
+        """
+        failed = []
+        for key in keys:
+            try:
+                await self.delete(key)
+            except Exception:
+                failed.append(key)
+        return failed
+
+    @abstractmethod
+    async def list(self, prefix: str = "", limit: int = 1000) -> List[Dict[str, Any]]:
+        """List objects under a prefix as dicts with key, size and last_modified"""
+
+    async def iter_objects(self, prefix: str = "", start_after: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream objects under a prefix in ascending key order, a page at a time
+
+        Keys are in plain string (UTF-8 byte) order, like an S3 listing.
+
+        Args:
+            prefix: Only keys starting with this
+            start_after: Only keys sorting after this one
+
+        Raises:
+            NotImplementedError: If the backend cannot list in key order
+        """
+        raise NotImplementedError(f"{self.name} storage cannot list objects in key order")
+        yield
+
+    @abstractmethod
+    async def presign(self, key: str, expires_in: int = 3600) -> str:
+        """Time-limited URL granting read access to a private object"""
+
+    @abstractmethod
+    async def presign_upload(
+        self,
+        key: str,
+        content_type: str,
+        max_bytes: int,
+        expires_in: int = 900
+    ) -> Dict[str, Any]:
+        """
+        Form POST policy letting a client upload one object directly
+
+        Returns:
+            Dict with 'url' to POST to and form 'fields' to send before the
+            file field
+        """
+
+    @abstractmethod
+    async def read_range(self, key: str, start: int, length: int) -> Tuple[bytes, int]:
+        """
+        Read part of an object
+
+        Returns:
+            (bytes from start, at most length of them; total object size)
+
+        Raises:
+            StorageObjectNotFound: If the key does not exist
+        """
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """Public URL of an object (no I/O)"""
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Key of an object from its public URL, or None if not ours (no I/O)"""
+        base = self.url("")
+        if not url.startswith(base) or "?" in url:
+            return None
+        return unquote(url[len(base):]) or None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Storage counters for the metrics endpoint"""
+        calls = sum(self.operations.values())
+        return {
+            "backend": self.name,
+            "operations": dict(self.operations),
+            "failures": self.failures,
+            "bytes_written": self.bytes_written,
+            "bytes_read": self.bytes_read,
+            "avg_latency_ms": round(self.total_latency / calls * 1000, 2) if calls else 0
+        }
+
+
+class S3Backend(StorageBackend):
+    """
+    Amazon S3 (or compatible) bucket
+
+    Small objects go up in a single PUT; objects at or above
+    S3_MULTIPART_THRESHOLD are split into parts uploaded concurrently.
+    """
+
+    name = "s3"
+    delete_batch_size = 1000  # DeleteObjects limit
+
+    def __init__(self):
+        super().__init__()
+        self.bucket = settings.AWS_BUCKET_NAME
+        # One client shared by all storage threads. Its urllib3 pool must
+        # cover every storage worker times the parts each may have in flight,
+        # otherwise calls queue for a connection (botocore's default is 10)
+        self.client = boto3.client(
+            's3',
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_REGION,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            config=Config(
+                max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                connect_timeout=settings.S3_CONNECT_TIMEOUT,
+                read_timeout=settings.S3_READ_TIMEOUT,
+                retries={"max_attempts": settings.S3_MAX_ATTEMPTS, "mode": "standard"},
+                tcp_keepalive=True
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_MULTIPART_CONCURRENCY,
+            use_threads=True
+        )
+        self.multipart_uploads = 0
+
+    async def put_object(self, key, data, content_type, metadata=None, cache_control=None):
+        extra = {"ContentType": content_type}
+        if metadata:
+            extra["Metadata"] = metadata
+        if cache_control:
+            extra["CacheControl"] = cache_control
+
+        if len(data) >= settings.S3_MULTIPART_THRESHOLD:
+            await self._call(
+                "put", self.client.upload_fileobj,
+                io.BytesIO(data), self.bucket, key,
+                ExtraArgs=extra, Config=self.transfer_config
+            )
+            self.multipart_uploads += 1
+            # The transfer manager does not return the completed upload's ETag
+            response = await self._call("head", self.client.head_object, Bucket=self.bucket, Key=key)
+        else:
+            response = await self._call(
+                "put", self.client.put_object, Bucket=self.bucket, Key=key, Body=data, **extra
+            )
+
+        self.bytes_written += len(data)
+        return {"url": self.url(key), "etag": response.get("ETag")}
+
+    async def get(self, key):
+        try:
+            response = await self._call("get", self.client.get_object, Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            raise StorageObjectNotFound(key)
+        data = await run_storage_call(response["Body"].read)
+        self.bytes_read += len(data)
+        return data
+
+    async def delete(self, key):
+        await self._call("delete", self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def delete_batch(self, keys):
+        # One DeleteObjects request; Quiet mode only reports failures
+        response = await self._call(
+            "delete_batch", self.client.delete_objects,
+            Bucket=self.bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+        )
+        return [error["Key"] for error in response.get("Errors", [])]
+
+    async def iter_objects(self, prefix="", start_after=None):
+        # list_objects_v2 pages come back in UTF-8 binary key order
+        options = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            options["StartAfter"] = start_after
+        while True:
+            page = await self._call("list", self.client.list_objects_v2, **options)
+            for item in page.get("Contents", []):
+                yield {"key": item["Key"], "size": item["Size"], "last_modified": item["LastModified"]}
+            if not page.get("IsTruncated"):
+                return
+            options["ContinuationToken"] = page["NextContinuationToken"]
+
+    async def list(self, prefix="", limit=1000):
+        def list_keys():
+            objects = []
+            paginator = self.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                for item in page.get("Contents", []):
+                    objects.append({
+                        "key": item["Key"],
+                        "size": item["Size"],
+                        "last_modified": item["LastModified"]
+                    })
+                    if len(objects) >= limit:
+                        return objects
+            return objects
+
+        return await self._call("list", list_keys)
+
+    async def presign(self, key, expires_in=3600):
+        return await self._call(
+            "presign", self.client.generate_presigned_url,
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in
+        )
+
+    async def presign_upload(self, key, content_type, max_bytes, expires_in=900):
+        return await self._call(
+            "presign_upload", self.client.generate_presigned_post,
+            Bucket=self.bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, max_bytes]
+            ],
+            ExpiresIn=expires_in
+        )
+
+    async def read_range(self, key, start, length):
+        try:
+            response = await self._call(
+                "read_range", self.client.get_object,
+                Bucket=self.bucket, Key=key, Range=f"bytes={start}-{start + length - 1}"
+            )
+        except self.client.exceptions.NoSuchKey:
+            raise StorageObjectNotFound(key)
+        data = await run_storage_call(response["Body"].read)
+        self.bytes_read += len(data)
+        # "bytes 0-8191/123456"; absent when the whole object was returned
+        content_range = response.get("ContentRange")
+        total = int(content_range.rsplit("/", 1)[1]) if content_range else len(data)
+        return data, total
+
+    def url(self, key):
+        if settings.S3_ENDPOINT_URL:
+            return f"{settings.S3_ENDPOINT_URL.rstrip('/')}/{self.bucket}/{quote(key)}"
+        return f"https://{self.bucket}.s3.{settings.AWS_REGION}.amazonaws.com/{quote(key)}"
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["multipart_uploads"] = self.multipart_uploads
+        stats["max_pool_connections"] = settings.S3_MAX_POOL_CONNECTIONS
+        return stats
+
+
+class CloudinaryBackend(StorageBackend):
+    """
+    Cloudinary media library
+
+    Keys map to public IDs under CLOUDINARY_FOLDER with the extension
+    stripped (Cloudinary tracks the format separately).
+    """
+
+    name = "cloudinary"
+    delete_batch_size = 100  # delete_resources limit
+
+    def __init__(self):
+        super().__init__()
+        if cloudinary is None:
+            raise RuntimeError("STORAGE_BACKEND=cloudinary requires the cloudinary package")
+        cloudinary.config(
+            cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+            api_key=os.getenv("CLOUDINARY_API_KEY"),
+            api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+            secure=True
+        )
+        self.folder = settings.CLOUDINARY_FOLDER
+
+    def _update_index(self, update: Callable[[Any, Any], Any]):
+        """
+        Apply an asset index update on a short-lived session
+
+        The storage call has already happened, so a failed update is logged
+        rather than raised; reconciliation repairs the index later.
+        """
+        # Imported here: asset_index runs its Admin API calls through this module
+        from asset_index import asset_index, index_session
+        try:
+            with index_session() as session:
+                update(asset_index, session)
+        except Exception as e:
+            print(f"Asset index update failed: {e}")
+
+    def public_id(self, key: str) -> str:
+        """Cloudinary public ID for a storage key"""
+        return f"{self.folder}/{os.path.splitext(key)[0]}"
+
+    def _key(self, resource: Dict[str, Any]) -> str:
+        public_id = resource["public_id"][len(self.folder) + 1:]
+        return f"{public_id}.{resource['format']}" if resource.get("format") else public_id
+
+    async def put_object(self, key, data, content_type, metadata=None, cache_control=None):
+        # Cloudinary sets delivery caching itself; its URLs are versioned, so
+        # cache_control has no per-object equivalent here
+        options = {"context": metadata} if metadata else {}
+        result = await self._call(
+            "put", cloudinary.uploader.upload,
+            io.BytesIO(data),
+            public_id=self.public_id(key),
+            resource_type="image",
+            overwrite=True,
+            invalidate=True,
+            **options
+        )
+        self.bytes_written += len(data)
+        self._update_index(lambda index, session: index.record(session, result))
+        return {"url": result["secure_url"], "etag": result.get("etag")}
+
+    async def get(self, key):
+        # Delivery URLs are served by the CDN; no SDK call needed
+        try:
+            data = await http_client.fetch_bytes(self.url(key))
+        except Exception as e:
+            if getattr(getattr(e, "response", None), "status_code", None) == 404:
+                raise StorageObjectNotFound(key)
+            raise
+        self.operations["get"] = self.operations.get("get", 0) + 1
+        self.bytes_read += len(data)
+        return data
+
+    async def delete(self, key):
+        public_id = self.public_id(key)
+        await self._call("delete", cloudinary.uploader.destroy, public_id, invalidate=True)
+        self._update_index(lambda index, session: index.remove(session, public_id))
+
+    async def delete_batch(self, keys):
+        public_ids = {self.public_id(key): key for key in keys}
+        response = await self._call(
+            "delete_batch", cloudinary.api.delete_resources, list(public_ids), invalidate=True
+        )
+        deleted = response.get("deleted", {})
+        gone = [public_id for public_id in public_ids if deleted.get(public_id) in ("deleted", "not_found")]
+        if gone:
+            self._update_index(lambda index, session: index.remove_many(session, gone))
+        return [key for public_id, key in public_ids.items() if public_id not in gone]
+
+    async def list(self, prefix="", limit=1000):
+        # Served from the local asset index: the Admin API is rate limited
+        # and pages at most 500 resources per call
+        from asset_index import asset_index, index_session
+
+        self.operations["list"] = self.operations.get("list", 0) + 1
+        with index_session() as session:
+            assets = asset_index.list_prefix(session, f"{self.folder}/{prefix}", limit)
+            return [
+                {
+                    "key": self._key({"public_id": asset.public_id, "format": asset.format}),
+                    "size": asset.bytes,
+                    "last_modified": asset.created_at
+                }
+                for asset in assets
+            ]
+
+    async def presign(self, key, expires_in=3600):
+        return self.private_url(key, int(time.time()) + expires_in)
+
+    def private_url(self, key: str, expires_at: int, attachment: bool = False) -> str:
+        """Expiring download URL for a private asset (signed locally, no I/O)"""
+        extension = os.path.splitext(key)[1].lstrip(".") or "jpg"
+        return cloudinary.utils.private_download_url(
+            self.public_id(key), extension, expires_at=expires_at, attachment=attachment
+        )
+
+    def key_for_url(self, url):
+        # Stored URLs are upload delivery URLs with a version segment and the
+        # format as extension: .../image/upload/v123/<folder>/<key>
+        match = re.match(
+            rf"https://res\.cloudinary\.com/[^/?]+/image/upload/(?:v\d+/)?{re.escape(self.folder)}/([^?]+)$", url
+        )
+        return unquote(match.group(1)) if match else None
+
+    async def presign_upload(self, key, content_type, max_bytes, expires_in=900):
+        # Signed upload parameters; Cloudinary has no size condition, so the
+        # completion check enforces max_bytes
+        params = {"public_id": self.public_id(key), "timestamp": int(time.time())}
+        params["signature"] = cloudinary.utils.api_sign_request(params, cloudinary.config().api_secret)
+        params["api_key"] = cloudinary.config().api_key
+        return {
+            "url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"),
+            "fields": params
+        }
+
+    async def read_range(self, key, start, length):
+        try:
+            resource = await self._call("read_range", cloudinary.api.resource, self.public_id(key))
+        except cloudinary.exceptions.NotFound:
+            raise StorageObjectNotFound(key)
+        # The CDN honours Range; slice in case a full body comes back
+        data = (await http_client.fetch_bytes(
+            self.url(key),
+            headers={"Range": f"bytes={start}-{start + length - 1}"}
+        ))[:length]
+        self.bytes_read += len(data)
+        return data, resource.get("bytes", len(data))
+
+    def url(self, key):
+        return cloudinary.utils.cloudinary_url(self.public_id(key), secure=True)[0]
+
+
+class LocalBackend(StorageBackend):
+    """
+    Directory on local disk, served by the /files route
+
+    Lets the whole pipeline run (and be benchmarked) without cloud
+    credentials or network access.
+    """
+
+    name = "local"
+    delete_batch_size = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.root = os.path.abspath(settings.LOCAL_STORAGE_DIR)
+        self.base_url = settings.LOCAL_STORAGE_BASE_URL.rstrip("/")
+
+    def path(self, key: str) -> str:
+        """Filesystem path of a key, refusing keys that escape the root"""
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _write(self, path: str, data: bytes) -> str:
+        """Write atomically; returns an S3-style MD5 ETag"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def _read(self, path: str) -> bytes:
+        try:
+            with open(path, "rb") as stored_file:
+                return stored_file.read()
+        except FileNotFoundError:
+            raise StorageObjectNotFound(path)
+
+    def _remove(self, path: str):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _read_range(self, path: str, start: int, length: int) -> Tuple[bytes, int]:
+        try:
+            with open(path, "rb") as stored_file:
+                stored_file.seek(start)
+                return stored_file.read(length), os.fstat(stored_file.fileno()).st_size
+        except FileNotFoundError:
+            raise StorageObjectNotFound(path)
+
+    def _list(self, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        objects = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not key.startswith(prefix):
+                    continue
+                stat = os.stat(path)
+                objects.append({
+                    "key": key,
+                    "size": stat.st_size,
+                    "last_modified": datetime.utcfromtimestamp(stat.st_mtime)
+                })
+        objects.sort(key=lambda item: item["key"])
+        return objects[:limit]
+
+    def _walk_sorted(self, directory: str, key_prefix: str, start_after: Optional[str]):
+        # Directories sort as "name/", so keys come out in plain string order.
+        # Every key under a directory lies in [name + "/", name + "0")
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name + "/" if entry.is_dir() else entry.name)
+        for entry in entries:
+            key = key_prefix + entry.name
+            if entry.is_dir():
+                if start_after is None or start_after < key + "0":
+                    yield from self._walk_sorted(entry.path, key + "/", start_after)
+            elif not entry.name.endswith(".tmp") and (start_after is None or key > start_after):
+                stat = entry.stat()
+                yield {"key": key, "size": stat.st_size, "last_modified": datetime.utcfromtimestamp(stat.st_mtime)}
+
+    async def iter_objects(self, prefix="", start_after=None):
+        base = prefix[:prefix.rfind("/") + 1]
+        directory = self.path(base) if base else self.root
+        if not os.path.isdir(directory):
+            return
+        walker = (
+            item for item in self._walk_sorted(directory, base, start_after)
+            if item["key"].startswith(prefix)
+        )
+        while True:
+            page = await self._call("list", lambda: list(itertools.islice(walker, 1000)))
+            for item in page:
+                yield item
+            if len(page) < 1000:
+                return
+
+    async def put_object(self, key, data, content_type, metadata=None, cache_control=None):
+        # The /files route derives Cache-Control from the key, so it is not stored
+        etag = await self._call("put", self._write, self.path(key), data)
+        self.bytes_written += len(data)
+        return {"url": self.url(key), "etag": etag}
+
+    async def get(self, key):
+        data = await self._call("get", self._read, self.path(key))
+        self.bytes_read += len(data)
+        return data
+
+    async def delete(self, key):
+        await self._call("delete", self._remove, self.path(key))
+
+    async def delete_batch(self, keys):
+        def remove_all():
+            failed = []
+            for key in keys:
+                try:
+                    self._remove(self.path(key))
+                except (OSError, ValueError):
+                    failed.append(key)
+            return failed
+
+        return await self._call("delete_batch", remove_all)
+
+    async def list(self, prefix="", limit=1000):
+        return await self._call("list", self._list, prefix, limit)
+
+    async def presign(self, key, expires_in=3600):
+        expires = int(time.time()) + expires_in
+        query = urlencode({"expires": expires, "signature": sign_local_key(key, expires)})
+        return f"{self.url(key)}?{query}"
+
+    async def presign_upload(self, key, content_type, max_bytes, expires_in=900):
+        self.path(key)  # Reject keys outside the root before signing them
+        expires = int(time.time()) + expires_in
+        return {
+            "url": self.base_url,
+            "fields": {
+                "key": key,
+                "Content-Type": content_type,
+                "max_bytes": str(max_bytes),
+                "expires": str(expires),
+                "signature": sign_local_upload(key, content_type, max_bytes, expires)
+            }
+        }
+
+    async def read_range(self, key, start, length):
+        data, total = await self._call("read_range", self._read_range, self.path(key), start, length)
+        self.bytes_read += len(data)
+        return data, total
+
+    def url(self, key):
+        return f"{self.base_url}/{quote(key)}"
+
+
+def sign_local_key(key: str, expires: int) -> str:
+    """Signature for a presigned local storage URL"""
+    message = f"{key}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_local_upload(key: str, content_type: str, max_bytes: int, expires: int) -> str:
+    """Signature for a local storage upload policy"""
+    message = f"upload:{key}:{content_type}:{max_bytes}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+STORAGE_BACKENDS = {
+    "s3": S3Backend,
+    "cloudinary": CloudinaryBackend,
+    "local": LocalBackend,
+}
+
+
+def create_storage_backend(name: str) -> StorageBackend:
+    """Instantiate the backend named by STORAGE_BACKEND"""
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}'. Use one of: {', '.join(STORAGE_BACKENDS)}")
+    return STORAGE_BACKENDS[name]()
+
+
+# Global storage executor and backend instance
+storage_executor = ThreadPoolExecutor(
+    max_workers=settings.STORAGE_WORKERS,
+    thread_name_prefix="storage"
+)
+storage_backend = create_storage_backend(settings.STORAGE_BACKEND)
@@ -0,0 +1,320 @@
+"""
+Orphan-object garbage collection for PhotoPro AI.
+Streams the storage listing and the database's referenced keys, both in
+key order, and merge-joins them so memory stays at one page of each side.
+Objects no row points at and older than a grace period are deleted in
+bulk; a dry run only reports them. Progress is checkpointed by key.
+"""
+
+import heapq
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from bulk_deletion import bulk_deleter
+from config import settings
+from database import SessionLocal
+from models import GcRun, GeneratedPhoto, StoredObject, Upload
+from object_catalog import TOMBSTONE, is_content_addressed
+from storage_backends import StorageBackend, storage_backend
+
+# Key prefixes the application writes; anything else in the bucket is left alone
+GC_PREFIXES = ("generated/", "thumbnails/", "uploads/")
+
+# Keys read per database page
+DB_PAGE_SIZE = 1000
+
+# Orphan keys kept in a run's report
+REPORT_SAMPLE_SIZE = 100
+
+
+def _utc(moment: datetime) -> datetime:
+    """Naive UTC datetime from a storage timestamp"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _ordered(db: Session, column):
+    # Postgres sorts text by locale unless told otherwise; the merge join
+    # needs byte order, the same as S3 listings and SQLite
+    if db.bind.dialect.name == "postgresql":
+        return column.collate("C")
+    return column
+
+
+class GarbageCollector:
+    """Finds and deletes storage objects that no database row references"""
+
+    def __init__(self):
+        self.runs = 0
+        self.scanned = 0
+        self.deleted = 0
+        self.bytes_reclaimed = 0
+        self._running: Set[int] = set()
+
+    def _db_keys(self, db: Session, column, prefix: str, after: Optional[str], *criteria) -> Iterator[str]:
+        """Keys from one column in byte order, read a page at a time"""
+        while True:
+            query = db.query(column).filter(column.startswith(prefix, autoescape=True), *criteria)
+            if after is not None:
+                query = query.filter(column > after)
+            page = [key for (key,) in query.order_by(_ordered(db, column)).limit(DB_PAGE_SIZE)]
+            yield from page
+            if len(page) < DB_PAGE_SIZE:
+                return
+            after = page[-1]
+
+    def referenced_keys(self, db: Session, prefix: str, after: Optional[str], cutoff: datetime) -> Iterator[str]:
+        """
+        Every key a row points at, in byte order
+
+        Expired uploads no longer hold their object. Catalogued objects count
+        while referenced, or until the grace period has passed since their
+        last reference was dropped.
+        """
+        return heapq.merge(
+            self._db_keys(
+                db, StoredObject.key, prefix, after,
+                or_(StoredObject.ref_count > 0, StoredObject.last_referenced_at >= cutoff)
+            ),
+            self._db_keys(db, Upload.key, prefix, after, Upload.expired_at.is_(None))
+        )
+
+    def _still_referenced(self, db: Session, keys: List[str], cutoff: datetime) -> Set[str]:
+        """
+        Orphan candidates referenced after all
+
+        Rows written since the listing passed a key, and photos whose URLs
+        are not catalogued (e.g. thumbnails from before the object catalog).
+        """
+        urls = {storage_backend.url(key): key for key in keys}
+        referenced = {
+            key for (key,) in db.query(StoredObject.key).filter(
+                StoredObject.key.in_(keys),
+                or_(StoredObject.ref_count > 0, StoredObject.last_referenced_at >= cutoff)
+            )
+        }
+        referenced.update(
+            key for (key,) in db.query(Upload.key).filter(Upload.key.in_(keys), Upload.expired_at.is_(None))
+        )
+        for column in (GeneratedPhoto.processed_url, GeneratedPhoto.thumbnail_url):
+            referenced.update(urls[url] for (url,) in db.query(column).filter(column.in_(list(urls))))
+        # Photos generated from an Upload row do not own their original
+        referenced.update(
+            urls[url] for (url,) in db.query(GeneratedPhoto.original_url).filter(
+                GeneratedPhoto.original_url.in_(list(urls)),
+                GeneratedPhoto.upload_id.is_(None)
+            )
+        )
+        return referenced
+
+    def _claim(self, db: Session, orphans: List[Dict[str, Any]], cutoff: datetime) -> List[Dict[str, Any]]:
+        """
+        Tombstone the catalog rows of a batch's content-addressed orphans
+
+        The unreferenced and past-cutoff conditions are applied again in the
+        same UPDATE, so a reference taken since the recheck spares its object.
+        Committed before any storage I/O; the catalog does not revive
+        tombstones, so no new reference can appear while the objects go.
+
+        Returns:
+            The orphans that may be deleted
+        """
+        catalogued = [item["key"] for item in orphans if is_content_addressed(item["key"])]
+        if not catalogued:
+            return orphans
+        db.query(StoredObject).filter(
+            StoredObject.key.in_(catalogued),
+            StoredObject.ref_count <= 0,
+            StoredObject.last_referenced_at < cutoff
+        ).update({StoredObject.ref_count: TOMBSTONE}, synchronize_session=False)
+        db.commit()
+
+        spared = {
+            key for (key,) in db.query(StoredObject.key).filter(
+                StoredObject.key.in_(catalogued),
+                StoredObject.ref_count != TOMBSTONE
+            )
+        }
+        return [item for item in orphans if item["key"] not in spared]
+
+    async def _collect(self, db: Session, run: GcRun, orphans: List[Dict[str, Any]], report: List[str]):
+        """Re-check a batch of orphan candidates, then delete (or just count) them"""
+        keys = [item["key"] for item in orphans]
+        referenced = self._still_referenced(db, keys, run.cutoff)
+        orphans = [item for item in orphans if item["key"] not in referenced]
+        if not run.dry_run:
+            orphans = self._claim(db, orphans, run.cutoff)
+        if not orphans:
+            return
+
+        run.orphans += len(orphans)
+        run.orphan_bytes += sum(item["size"] for item in orphans)
+        report.extend(item["key"] for item in orphans[:REPORT_SAMPLE_SIZE - len(report)])
+        if run.dry_run:
+            return
+
+        failed = set(await bulk_deleter.delete_keys([item["key"] for item in orphans]))
+        deleted = [item for item in orphans if item["key"] not in failed]
+        tombstoned = [item["key"] for item in orphans if is_content_addressed(item["key"])]
+        if tombstoned:
+            db.query(StoredObject).filter(
+                StoredObject.key.in_([key for key in tombstoned if key not in failed]),
+                StoredObject.ref_count == TOMBSTONE
+            ).delete(synchronize_session=False)
+            # Objects that could not be deleted can be referenced again
+            db.query(StoredObject).filter(
+                StoredObject.key.in_([key for key in tombstoned if key in failed]),
+                StoredObject.ref_count == TOMBSTONE
+            ).update({StoredObject.ref_count: 0}, synchronize_session=False)
+            db.commit()
+
+        run.deleted += len(deleted)
+        run.failed += len(failed)
+        self.deleted += len(deleted)
+        self.bytes_reclaimed += sum(item["size"] for item in deleted)
+
+    async def _scan(self, db: Session, run: GcRun, prefix: str, report: List[str]):
+        """Merge-join one prefix's listing against the referenced keys"""
+        after = run.checkpoint if run.checkpoint and run.checkpoint >= prefix else None
+        references = self.referenced_keys(db, prefix, after, run.cutoff)
+        reference = next(references, None)
+        last_missing = None
+        batch: List[Dict[str, Any]] = []
+        batch_size = storage_backend.delete_batch_size
+
+        async def flush(checkpoint: str):
+            await self._collect(db, run, batch, report)
+            batch.clear()
+            run.checkpoint = checkpoint
+            run.report = json.dumps(report)
+            db.commit()
+
+        last_key = None
+        async for item in storage_backend.iter_objects(prefix, start_after=after):
+            key = last_key = item["key"]
+            run.scanned += 1
+            self.scanned += 1
+
+            # Referenced keys that sort before this object have no object
+            while reference is not None and reference < key:
+                if reference != last_missing:
+                    run.missing += 1
+                    last_missing = reference
+                reference = next(references, None)
+
+            if reference == key:
+                while reference == key:
+                    reference = next(references, None)
+                continue
+            if _utc(item["last_modified"]) < run.cutoff:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    await flush(key)
+
+        if last_key is not None:
+            await flush(last_key)
+
+        # Referenced keys past the last object have no object either
+        while reference is not None:
+            if reference != last_missing:
+                run.missing += 1
+                last_missing = reference
+            reference = next(references, None)
+        db.commit()
+
+    async def run(self, run_id: int):
+        """
+        Run (or resume) a collection pass
+
+        Prefixes are scanned in key order and the checkpoint is committed
+        after each batch, so a resumed run continues after the last key
+        whose batch was handled.
+        """
+        if run_id in self._running:
+            return
+        self._running.add(run_id)
+        db = SessionLocal()
+        try:
+            run = db.query(GcRun).filter(GcRun.id == run_id).first()
+            if run is None or run.status not in ("pending", "running"):
+                return
+            run.status = "running"
+            db.commit()
+            self.runs += 1
+            report = json.loads(run.report) if run.report else []
+
+            try:
+                for prefix in sorted(GC_PREFIXES):
+                    if run.checkpoint and run.checkpoint >= prefix + "\U0010ffff":
+                        continue
+                    await self._scan(db, run, prefix, report)
+            except Exception as e:
+                db.rollback()
+                run.status = "failed"
+                run.error = str(e)
+                db.commit()
+                print(f"Storage GC run {run_id} failed: {e}")
+                return
+
+            run.status = "completed"
+            run.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            self._running.discard(run_id)
+            db.close()
+
+    def create_run(self, db: Session, dry_run: bool = True, grace_period: Optional[timedelta] = None) -> GcRun:
+        """
+        Record a collection pass; run it with run()
+
+        Raises:
+            NotImplementedError: If the storage backend cannot list in key order
+        """
+        if type(storage_backend).iter_objects is StorageBackend.iter_objects:
+            raise NotImplementedError(f"{storage_backend.name} storage cannot list objects in key order")
+        grace_period = grace_period if grace_period is not None else timedelta(hours=settings.GC_GRACE_PERIOD_HOURS)
+        run = GcRun(dry_run=dry_run, cutoff=datetime.utcnow() - grace_period, status="pending")
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+        return run
+
+    def resume(self, db: Session, run: GcRun):
+        """Make a failed run resumable from its checkpoint"""
+        if run.status == "failed":
+            run.status = "pending"
+            run.error = None
+            db.commit()
+
+    async def resume_interrupted(self):
+        """Continue passes interrupted by a restart"""
+        db = SessionLocal()
+        try:
+            run_ids = [
+                run_id for (run_id,) in db.query(GcRun.id).filter(
+                    GcRun.status.in_(("pending", "running"))
+                ).order_by(GcRun.id)
+            ]
+        finally:
+            db.close()
+        for run_id in run_ids:
+            await self.run(run_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get garbage collection statistics"""
+        return {
+            "runs": self.runs,
+            "running": len(self._running),
+            "scanned": self.scanned,
+            "deleted": self.deleted,
+            "bytes_reclaimed": self.bytes_reclaimed
+        }
+
+
+# Global garbage collector
+garbage_collector = GarbageCollector()
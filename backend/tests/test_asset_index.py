@@ -0,0 +1,193 @@
+"""
+Tests for the local Cloudinary asset index in PhotoPro AI backend.
+Listings come from the database; reconciliation pages the Admin API; the
+Cloudinary storage backend keeps the index up to date.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.uploader
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import asset_index as index_module
+from asset_index import CloudinaryAssetIndex
+from database import Base
+from models import CloudinaryAsset
+from storage_backends import CloudinaryBackend
+
+
+def resource(public_id, minutes_ago=0):
+    created_at = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    return {
+        "public_id": public_id,
+        "secure_url": f"https://res.cloudinary.com/demo/image/upload/v1/{public_id}.jpg",
+        "format": "jpg",
+        "width": 800,
+        "height": 600,
+        "bytes": 1000,
+        "created_at": created_at.isoformat() + "Z"
+    }
+
+
+@pytest.fixture
+def factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/assets.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(index_module, "SessionLocal", factory)
+    return factory
+
+
+@pytest.fixture
+def db(factory):
+    session = factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def admin_api(monkeypatch):
+    """Fake Admin API serving a remote asset list in pages of two"""
+    remote = []
+    calls = []
+
+    def resources(**options):
+        calls.append(options)
+        if len(calls) == 2:
+            raise cloudinary.exceptions.RateLimited("Rate Limit Exceeded")
+        start = int(options.get("next_cursor", 0))
+        matching = [item for item in remote if item["public_id"].startswith(options["prefix"])]
+        page = {"resources": matching[start:start + 2]}
+        if start + 2 < len(matching):
+            page["next_cursor"] = str(start + 2)
+        return page
+
+    monkeypatch.setattr(cloudinary.api, "resources", resources)
+    monkeypatch.setattr(index_module, "RATE_LIMIT_BACKOFF_SECONDS", 0)
+    return remote, calls
+
+
+class TestCloudinaryAssetIndex:
+    """Test index updates, listings and reconciliation"""
+
+    def test_listing_is_per_folder_newest_first(self, db):
+        index = CloudinaryAssetIndex()
+        index.record(db, resource("photopro/uploads/1/originals/a", minutes_ago=5))
+        index.record(db, resource("photopro/uploads/1/originals/b"))
+        index.record(db, resource("photopro/uploads/1/generated/c"))
+        index.record(db, resource("photopro/uploads/2/originals/d"))
+
+        listed = index.list(db, "photopro/uploads/1/originals")
+
+        assert [asset.public_id for asset in listed] == ["photopro/uploads/1/originals/b", "photopro/uploads/1/originals/a"]
+        assert listed[0].user_id == 1
+
+    def test_remove(self, db):
+        index = CloudinaryAssetIndex()
+        index.record(db, resource("photopro/uploads/1/originals/a"))
+
+        assert index.remove(db, "photopro/uploads/1/originals/a")
+        assert not index.remove(db, "photopro/uploads/1/originals/a")
+        assert index.list(db, "photopro/uploads/1/originals") == []
+
+    def test_iter_resources_follows_cursor(self, admin_api):
+        remote, calls = admin_api
+        remote.extend(resource(f"photopro/uploads/1/originals/{name}") for name in "abcde")
+        index = CloudinaryAssetIndex()
+
+        async def collect():
+            return [item["public_id"] async for item in index.iter_resources("photopro/uploads/1/")]
+
+        assert len(asyncio.run(collect())) == 5
+        assert index.pages_fetched == 3
+        assert index.rate_limited == 1
+
+    def test_reconcile_adds_and_removes(self, db, admin_api):
+        remote, _ = admin_api
+        remote.extend(resource(f"photopro/uploads/1/originals/{name}", minutes_ago=1) for name in "abc")
+        index = CloudinaryAssetIndex()
+        index.record(db, resource("photopro/uploads/1/originals/a", minutes_ago=1))
+        index.record(db, resource("photopro/uploads/1/originals/gone", minutes_ago=1))
+        index.record(db, resource("photopro/uploads/2/originals/other", minutes_ago=1))
+
+        result = asyncio.run(index.reconcile(db, "photopro/uploads/1/"))
+
+        assert (result["seen"], result["added"], result["removed"]) == (3, 2, 1)
+        assert {asset.public_id for asset in db.query(CloudinaryAsset)} == {
+            "photopro/uploads/1/originals/a",
+            "photopro/uploads/1/originals/b",
+            "photopro/uploads/1/originals/c",
+            "photopro/uploads/2/originals/other",
+        }
+        assert all(
+            asset.reconciled_at is not None
+            for asset in db.query(CloudinaryAsset) if asset.public_id.startswith("photopro/uploads/1/")
+        )
+
+    def test_reconcile_keeps_entries_marked_by_a_later_run(self, db, admin_api):
+        remote, _ = admin_api
+        remote.append(resource("photopro/uploads/1/originals/a", minutes_ago=1))
+        index = CloudinaryAssetIndex()
+        index.record(db, resource("photopro/uploads/1/originals/gone", minutes_ago=1))
+        index.upsert(
+            db, [resource("photopro/uploads/1/originals/late", minutes_ago=1)],
+            reconciled_at=datetime.utcnow() + timedelta(minutes=1)
+        )
+
+        result = asyncio.run(index.reconcile(db, "photopro/uploads/1/"))
+
+        assert result["removed"] == 1
+        assert {asset.public_id for asset in db.query(CloudinaryAsset)} == {
+            "photopro/uploads/1/originals/a",
+            "photopro/uploads/1/originals/late",
+        }
+
+
+class TestCloudinaryBackendIndex:
+    """Test that backend writes and deletes keep the index current"""
+
+    @pytest.fixture
+    def backend(self, monkeypatch):
+        def upload(file, public_id, **options):
+            return resource(public_id)
+
+        def delete_resources(public_ids, **options):
+            return {"deleted": {public_id: "deleted" for public_id in public_ids}}
+
+        monkeypatch.setattr(cloudinary.uploader, "upload", upload)
+        monkeypatch.setattr(cloudinary.uploader, "destroy", lambda public_id, **options: {"result": "ok"})
+        monkeypatch.setattr(cloudinary.api, "delete_resources", delete_resources)
+        monkeypatch.setattr(cloudinary.api, "resources", lambda **options: pytest.fail("Admin API called"))
+        return CloudinaryBackend()
+
+    def test_writes_and_deletes_are_indexed(self, backend, db):
+        async def run():
+            for name in "abcd":
+                await backend.put(f"uploads/1/{name}.jpg", b"data", "image/jpeg")
+            await backend.put("generated/ab/cd.jpg", b"data", "image/jpeg")
+            await backend.delete("uploads/1/a.jpg")
+            failed = await backend.delete_batch(["uploads/1/b.jpg", "uploads/1/c.jpg"])
+            return failed, await backend.list("uploads/1/")
+
+        failed, listed = asyncio.run(run())
+
+        assert failed == []
+        assert [item["key"] for item in listed] == ["uploads/1/d.jpg"]
+        assert listed[0]["size"] == 1000
+        assets = {asset.public_id: asset.user_id for asset in db.query(CloudinaryAsset)}
+        assert assets == {"photopro/uploads/1/d": 1, "photopro/generated/ab/cd": None}
+
+    def test_index_failure_does_not_fail_the_write(self, backend, monkeypatch):
+        def broken_session():
+            raise RuntimeError("database unavailable")
+
+        monkeypatch.setattr(index_module, "SessionLocal", broken_session)
+
+        url = asyncio.run(backend.put("uploads/1/a.jpg", b"data", "image/jpeg"))
+
+        assert url.endswith("photopro/uploads/1/a.jpg")
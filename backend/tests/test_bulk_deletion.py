@@ -0,0 +1,177 @@
+"""
+Tests for bulk deletion jobs in PhotoPro AI backend.
+Batched deletes against the local backend, progress and resumption.
+"""
+
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import bulk_deletion
+from bulk_deletion import BulkDeleter, delete_account_data
+from config import settings
+from database import Base
+from models import DeletionJob, DeletionJobItem, StoredObject, Upload, User
+from storage_backends import LocalBackend
+from write_spool import WriteSpool
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/jobs.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(bulk_deletion, "SessionLocal", factory)
+    return factory
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(settings, "BULK_DELETE_BATCHES_PER_SECOND", 1000.0)
+    backend = LocalBackend()
+    backend.delete_batch_size = 3
+    monkeypatch.setattr(bulk_deletion, "storage_backend", backend)
+    monkeypatch.setattr(bulk_deletion, "write_spool", WriteSpool(backend, str(tmp_path / "spool")))
+    return backend
+
+
+def store(backend, keys):
+    async def run():
+        for key in keys:
+            await backend.put(key, b"data", "image/jpeg")
+
+    asyncio.run(run())
+
+
+class TestBulkDeleter:
+    """Test job creation, batched runs and resumption"""
+
+    def test_job_deletes_in_batches(self, session_factory, backend):
+        keys = [f"uploads/1/{index}.jpg" for index in range(7)]
+        store(backend, keys)
+        deleter = BulkDeleter()
+        db = session_factory()
+        job = deleter.create_job(db, keys + keys[:2], "account_deletion", user_id=1)
+
+        asyncio.run(deleter.run(job.id))
+
+        db.refresh(job)
+        assert (job.status, job.total, job.deleted, job.failed) == ("completed", 7, 7, 0)
+        assert deleter.batches == 3
+        assert asyncio.run(backend.list("uploads/")) == []
+
+    def test_pending_spooled_write_is_discarded(self, session_factory, backend, monkeypatch):
+        monkeypatch.setattr(settings, "WRITE_SPOOL_ENABLED", True)
+        spool = bulk_deletion.write_spool
+        put_object = backend.put_object
+
+        async def unavailable(*args, **kwargs):
+            raise ConnectionError("provider unavailable")
+
+        monkeypatch.setattr(backend, "put_object", unavailable)
+        asyncio.run(spool.put_object("uploads/1/a.jpg", b"data", "image/jpeg"))
+        assert spool.is_pending("uploads/1/a.jpg")
+
+        deleter = BulkDeleter()
+        db = session_factory()
+        job = deleter.create_job(db, ["uploads/1/a.jpg"], "account_deletion", user_id=1)
+        asyncio.run(deleter.run(job.id))
+        monkeypatch.setattr(backend, "put_object", put_object)
+
+        # The provider is back, but the deleted object is not written again
+        assert asyncio.run(spool.flush()) == 0
+        assert not spool.is_pending("uploads/1/a.jpg")
+        assert asyncio.run(backend.list("uploads/")) == []
+        assert os.listdir(spool.root) == ["journal.jsonl"]
+
+    def test_failed_keys_are_recorded(self, session_factory, backend, monkeypatch):
+        monkeypatch.setattr(settings, "BULK_DELETE_MAX_ATTEMPTS", 1)
+        deleter = BulkDeleter()
+        db = session_factory()
+        job = deleter.create_job(db, ["uploads/1/a.jpg", "../escape.jpg"], "failed_generations")
+
+        asyncio.run(deleter.run(job.id))
+
+        db.refresh(job)
+        assert (job.status, job.deleted, job.failed) == ("completed_with_errors", 1, 1)
+        failed = db.query(DeletionJobItem).filter(DeletionJobItem.status == "failed").one()
+        assert failed.key == "../escape.jpg"
+
+    def test_resume_skips_finished_items(self, session_factory, backend, monkeypatch):
+        keys = [f"uploads/1/{index}.jpg" for index in range(4)]
+        deleter = BulkDeleter()
+        db = session_factory()
+        job = deleter.create_job(db, keys, "account_deletion")
+        # Simulate a crash after the first item was deleted
+        first = db.query(DeletionJobItem).filter(DeletionJobItem.key == keys[0]).one()
+        first.status = "deleted"
+        job.status, job.deleted = "running", 1
+        db.commit()
+
+        sent = []
+        original = backend.delete_batch
+
+        async def recording_delete_batch(batch):
+            sent.extend(batch)
+            return await original(batch)
+
+        monkeypatch.setattr(backend, "delete_batch", recording_delete_batch)
+        asyncio.run(deleter.resume_unfinished())
+
+        db.refresh(job)
+        assert sent == keys[1:]
+        assert (job.status, job.deleted) == ("completed", 4)
+
+    def test_collect_releases_shared_objects(self, session_factory, backend):
+        db = session_factory()
+        content_hash = "ab" * 32
+        db.add(StoredObject(
+            content_hash=content_hash, key=f"uploads/ab/{content_hash}.jpg",
+            url=backend.url(f"uploads/ab/{content_hash}.jpg"), size=4, content_type="image/jpeg", ref_count=2
+        ))
+        db.commit()
+
+        keys, released = BulkDeleter().collect(db, [
+            backend.url(f"uploads/ab/{content_hash}.jpg"),
+            backend.url("uploads/1/direct.jpg"),
+            "https://replicate.delivery/out.png",
+            None,
+        ])
+
+        assert keys == ["uploads/1/direct.jpg"]
+        assert released == 1
+        assert db.query(StoredObject).one().ref_count == 1
+        assert db.query(DeletionJob).count() == 0
+
+    def test_account_deletion_is_one_transaction(self, session_factory, backend, monkeypatch):
+        db = session_factory()
+        content_hash = "cd" * 32
+        key = f"uploads/cd/{content_hash}.jpg"
+        user = User(email="gone@example.com", username="gone", full_name="Gone", hashed_password="x")
+        db.add(user)
+        db.add(StoredObject(
+            content_hash=content_hash, key=key, url=backend.url(key), size=4, content_type="image/jpeg", ref_count=1
+        ))
+        db.flush()
+        db.add(Upload(
+            user_id=user.id, key=key, url=backend.url(key), content_hash=content_hash, filename="a.jpg",
+            format="JPEG", width=1, height=1, size=4
+        ))
+        db.commit()
+
+        def failing_create_job(*args, **kwargs):
+            raise RuntimeError("database went away")
+
+        monkeypatch.setattr(bulk_deletion.bulk_deleter, "create_job", failing_create_job)
+        with pytest.raises(RuntimeError):
+            delete_account_data(db, user)
+        db.rollback()
+
+        # Nothing was committed, so the upload still holds its reference
+        assert db.query(User).count() == 1
+        assert db.query(Upload).count() == 1
+        assert db.query(StoredObject).one().ref_count == 1
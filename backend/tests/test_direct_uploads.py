@@ -0,0 +1,77 @@
+"""
+Tests for direct-to-storage uploads in PhotoPro AI backend.
+Intent checks and header-only completion against the local backend.
+"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import direct_uploads
+from config import settings
+from storage_backends import LocalBackend
+
+
+def encode(size, image_format="JPEG") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (90, 120, 150)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path))
+    backend = LocalBackend()
+    monkeypatch.setattr(direct_uploads, "storage_backend", backend)
+    return backend
+
+
+def upload(backend, content, filename="photo.jpg", content_type="image/jpeg", user_id=1):
+    """Run the intent, store the object as the client would, then complete"""
+    async def run():
+        intent = await direct_uploads.create_upload_intent(user_id, filename, content_type, len(content))
+        await backend.put(intent["key"], content, content_type)
+        return intent, await direct_uploads.complete_upload(intent["upload_token"], user_id)
+
+    return asyncio.run(run())
+
+
+class TestDirectUploads:
+    """Test the intent and completion steps"""
+
+    def test_valid_upload(self, backend):
+        intent, result = upload(backend, encode((800, 600)))
+
+        assert intent["key"].startswith("uploads/1/")
+        assert result["dimensions"] == {"width": 800, "height": 600}
+        assert result["format"] == "JPEG"
+
+    @pytest.mark.parametrize("filename,content_type,size", [
+        ("photo.gif", "image/gif", 100),
+        ("photo.jpg", "image/png", 100),
+        ("photo.jpg", "image/jpeg", 11 * 1024 * 1024),
+    ])
+    def test_rejected_intents(self, backend, filename, content_type, size):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(direct_uploads.create_upload_intent(1, filename, content_type, size))
+        assert exc_info.value.status_code == 400
+
+    @pytest.mark.parametrize("content", [
+        encode((300, 300)),
+        encode((800, 600), "PNG"),
+        b"\xff\xd8" + b"\x00" * 64,
+    ])
+    def test_invalid_objects_are_deleted(self, backend, content):
+        with pytest.raises(HTTPException) as exc_info:
+            upload(backend, content)
+
+        assert exc_info.value.status_code == 400
+        assert asyncio.run(backend.list("uploads/")) == []
+
+    def test_token_bound_to_user(self, backend):
+        intent = asyncio.run(direct_uploads.create_upload_intent(1, "photo.jpg", "image/jpeg", 100))
+        with pytest.raises(HTTPException):
+            direct_uploads.decode_upload_token(intent["upload_token"], 2)
@@ -0,0 +1,66 @@
+"""
+Tests for near-duplicate upload lookup in PhotoPro AI backend.
+Band probing against the fingerprint table, per user, up to MAX_DISTANCE.
+"""
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from config import Settings
+from database import Base
+from duplicates import MAX_DISTANCE, band_neighbours, find_near_duplicates, record_fingerprint
+
+BASE_HASH = 0xF0F0_1234_ABCD_8001
+
+
+def flip(phash: int, bits_per_band) -> int:
+    """Flip the lowest n bits of each 16-bit band"""
+    for band, count in enumerate(bits_per_band):
+        for bit in range(count):
+            phash ^= 1 << (band * 16 + bit)
+    return phash
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/duplicates.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+class TestFindNearDuplicates:
+    """Test that every hash within the distance is found through the band index"""
+
+    def test_band_neighbours(self):
+        assert len(band_neighbours(0xABCD, 0)) == 1
+        assert len(band_neighbours(0xABCD, 1)) == 17
+        assert len(set(band_neighbours(0xABCD, 2))) == 1 + 16 + 120
+
+    def test_finds_hashes_with_no_band_within_one_bit(self, db):
+        record_fingerprint(db, 1, "same", BASE_HASH)
+        record_fingerprint(db, 1, "five", flip(BASE_HASH, (2, 1, 1, 1)))
+        # Every band differs by at least two bits
+        record_fingerprint(db, 1, "nine", flip(BASE_HASH, (3, 2, 2, 2)))
+        record_fingerprint(db, 1, "eleven", flip(BASE_HASH, (3, 3, 3, 2)))
+        record_fingerprint(db, 1, "far", flip(BASE_HASH, (4, 3, 3, 3)))
+        record_fingerprint(db, 2, "other user", BASE_HASH)
+
+        found = find_near_duplicates(db, 1, BASE_HASH, max_distance=MAX_DISTANCE)
+
+        assert [fingerprint.image_url for fingerprint in found] == ["same", "five", "nine", "eleven"]
+        assert [fingerprint.image_url for fingerprint in find_near_duplicates(db, 1, BASE_HASH, 9)] == \
+            ["same", "five", "nine"]
+        assert [fingerprint.image_url for fingerprint in find_near_duplicates(db, 1, BASE_HASH)] == ["same", "five"]
+
+    def test_rejects_unsupported_distance(self, db):
+        with pytest.raises(ValueError):
+            find_near_duplicates(db, 1, BASE_HASH, max_distance=MAX_DISTANCE + 1)
+
+    def test_settings_refuse_unsupported_distance(self):
+        assert Settings(DUPLICATE_MAX_DISTANCE=MAX_DISTANCE).DUPLICATE_MAX_DISTANCE == MAX_DISTANCE
+        with pytest.raises(ValidationError):
+            Settings(DUPLICATE_MAX_DISTANCE=MAX_DISTANCE + 1)
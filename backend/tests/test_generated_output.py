@@ -0,0 +1,76 @@
+"""
+Tests for storing model outputs in PhotoPro AI backend.
+The fan-out's thumbnail and storage consumers run concurrently, each on its
+own database session.
+"""
+
+import asyncio
+import io
+import random
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main_full
+import object_catalog
+from config import settings
+from database import Base
+from main_full import store_generated_output, store_thumbnail
+from media_cache import MediaCache
+from models import StoredObject
+from storage_backends import LocalBackend
+from utils import calculate_file_hash
+from write_spool import WriteSpool
+
+
+def output_png() -> bytes:
+    rng = random.Random(7)
+    noise = Image.frombytes("RGB", (32, 32), bytes(rng.randrange(256) for _ in range(32 * 32 * 3)))
+    buffer = io.BytesIO()
+    noise.resize((512, 512), Image.BICUBIC).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(object_catalog, "write_spool", WriteSpool(LocalBackend(), str(tmp_path / "spool")))
+    monkeypatch.setattr(main_full, "media_cache", MediaCache(str(tmp_path / "cache"), 10 * 1024 * 1024))
+
+    engine = create_engine(f"sqlite:///{tmp_path}/outputs.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(main_full, "SessionLocal", factory)
+    return factory
+
+
+class TestGeneratedOutputConsumers:
+    """Test that the concurrent consumers do not share a session"""
+
+    def test_consumers_use_their_own_sessions(self, factory, monkeypatch):
+        sessions = []
+        store = object_catalog.object_catalog.store
+
+        async def recording_store(db, *args, **kwargs):
+            sessions.append(db)
+            return await store(db, *args, **kwargs)
+
+        monkeypatch.setattr(main_full.object_catalog, "store", recording_store)
+        content = output_png()
+        content_hash = calculate_file_hash(content)
+
+        async def run():
+            return await asyncio.gather(
+                store_thumbnail(content, content_hash),
+                store_generated_output(content, content_hash)
+            )
+
+        thumbnail, url = asyncio.run(run())
+
+        assert len(sessions) == 2 and sessions[0] is not sessions[1]
+        db = factory()
+        assert {row.url for row in db.query(StoredObject)} == {thumbnail["url"], url}
+        assert url.endswith(f"{content_hash}.png")
+        db.close()
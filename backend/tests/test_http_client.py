@@ -0,0 +1,175 @@
+"""
+Tests for the shared outbound HTTP client in PhotoPro AI backend.
+Per-host concurrency limits, connection reuse, size limits and the client's
+lifecycle, against local HTTP servers.
+"""
+
+import asyncio
+
+import pytest
+
+import http_client
+from config import settings
+from http_client import DownloadTooLarge, PooledHTTPClient
+
+BODY = b"x" * 1024
+
+
+class Overlap:
+    """How many requests are in flight at once"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    def enter(self):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+    def leave(self):
+        self.active -= 1
+
+
+class SlowServer:
+    """HTTP/1.1 keep-alive server that records how many requests overlap"""
+
+    def __init__(self, delay: float = 0.05, shared: Overlap = None):
+        self.delay = delay
+        self.overlap = Overlap()
+        self.shared = shared or Overlap()
+        self.requests = 0
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                self.requests += 1
+                self.overlap.enter()
+                self.shared.enter()
+                await asyncio.sleep(self.delay)
+                self.overlap.leave()
+                self.shared.leave()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(BODY) + BODY)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+def per_host(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_MAX_PER_HOST", 2)
+
+
+def run_against(servers, scenario):
+    """Start the servers, run scenario(client, urls), then clean up"""
+    async def run():
+        urls = [await server.start() for server in servers]
+        client = PooledHTTPClient()
+        await client.start()
+        try:
+            return client, await scenario(client, urls)
+        finally:
+            await client.close()
+            for server in servers:
+                await server.stop()
+
+    return asyncio.run(run())
+
+
+class TestPerHostLimits:
+    """Test that concurrency is capped per host, not globally"""
+
+    def test_requests_to_one_host_are_capped(self, per_host):
+        server = SlowServer()
+
+        async def scenario(client, urls):
+            return await asyncio.gather(*(client.fetch_bytes(f"{urls[0]}/{i}") for i in range(6)))
+
+        client, bodies = run_against([server], scenario)
+
+        assert bodies == [BODY] * 6
+        assert (server.requests, server.overlap.peak) == (6, 2)
+        assert client.get_stats()["downloads"] == 6
+
+    def test_hosts_are_limited_independently(self, per_host):
+        both = Overlap()
+        first, second = SlowServer(shared=both), SlowServer(shared=both)
+
+        async def scenario(client, urls):
+            return await asyncio.gather(*(client.fetch_bytes(f"{url}/{i}") for url in urls for i in range(4)))
+
+        run_against([first, second], scenario)
+
+        assert (first.overlap.peak, second.overlap.peak) == (2, 2)
+        # A busy host does not hold back requests to another one
+        assert both.peak == 4
+
+    def test_connections_are_reused(self, per_host):
+        server = SlowServer(delay=0)
+
+        async def scenario(client, urls):
+            for i in range(5):
+                await client.fetch_bytes(f"{urls[0]}/{i}")
+
+        client, _ = run_against([server], scenario)
+
+        assert server.connections == 1
+        assert client.get_stats()["tcp_connects"] == 1
+
+    def test_oversized_download_frees_its_slot(self, monkeypatch):
+        monkeypatch.setattr(settings, "HTTP_MAX_PER_HOST", 1)
+        server = SlowServer(delay=0)
+
+        async def scenario(client, urls):
+            with pytest.raises(DownloadTooLarge):
+                await client.fetch_bytes(f"{urls[0]}/big", max_bytes=100)
+            return await asyncio.wait_for(client.fetch_bytes(f"{urls[0]}/small"), 2)
+
+        client, body = run_against([server], scenario)
+
+        assert body == BODY
+        assert (client.failures, client.downloads) == (1, 1)
+
+
+class TestLifecycle:
+    """Test startup, shutdown and bounded per-host state"""
+
+    def test_requests_need_a_started_client(self):
+        client = PooledHTTPClient()
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(client.fetch_bytes("http://127.0.0.1:1/"))
+
+    def test_idle_hosts_are_evicted(self, per_host, monkeypatch):
+        monkeypatch.setattr(http_client, "MAX_TRACKED_HOSTS", 2)
+        servers = [SlowServer(delay=0) for _ in range(3)]
+
+        async def scenario(client, urls):
+            for url in urls:
+                await client.fetch_bytes(url)
+            return urls, list(client._host_limits)
+
+        client, (urls, hosts) = run_against(servers, scenario)
+
+        assert hosts == [url.split("://")[1] for url in urls[1:]]
+        # Closing the client drops the per-host limits with the pool
+        assert client.get_stats()["tracked_hosts"] == 0
+
+    def test_reuse_rate_is_never_negative(self):
+        client = PooledHTTPClient()
+        client.downloads, client.tcp_connects = 1, 3
+
+        assert client.get_stats()["connection_reuse_rate"] == 0
@@ -0,0 +1,95 @@
+"""
+Tests for decoded-pixel admission control in PhotoPro AI backend.
+Waiting and timing out on the budget, oversized reservations, release on
+errors, and the decompression-bomb check.
+"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from image_budget import PixelBudget, open_image, run_image_task
+
+
+def encode(size) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestPixelBudget:
+    """Test admission, waiting and release"""
+
+    def test_waits_while_over_budget(self):
+        budget = PixelBudget(100, 1.0)
+        order = []
+
+        async def decode(name, pixels, hold):
+            async with budget.reserve(pixels):
+                order.append((name, budget.in_use))
+                await asyncio.sleep(hold)
+
+        async def run():
+            first = asyncio.ensure_future(decode("first", 60, 0.05))
+            await asyncio.sleep(0)
+            await decode("second", 60, 0)
+            await first
+
+        asyncio.run(run())
+
+        assert order == [("first", 60), ("second", 60)]
+        assert (budget.delayed, budget.admitted, budget.peak, budget.in_use) == (1, 2, 60, 0)
+
+    def test_times_out_with_503(self):
+        budget = PixelBudget(100, 0.01)
+
+        async def run():
+            async with budget.reserve(100):
+                async with budget.reserve(1):
+                    pass
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(run())
+        assert exc_info.value.status_code == 503
+        assert (budget.rejected, budget.waiting, budget.in_use) == (1, 0, 0)
+
+    def test_reservation_larger_than_budget_runs_alone(self):
+        budget = PixelBudget(100, 1.0)
+
+        async def run():
+            async with budget.reserve(500):
+                return budget.in_use
+
+        assert asyncio.run(run()) == 100
+        assert budget.in_use == 0
+
+    def test_released_on_exception(self):
+        budget = PixelBudget(100, 1.0)
+
+        async def run():
+            async with budget.reserve(80):
+                raise ValueError("decode failed")
+
+        with pytest.raises(ValueError):
+            asyncio.run(run())
+        assert budget.in_use == 0
+
+
+class TestDecompressionBombGuard:
+    """Test that oversized images are refused before they are decoded"""
+
+    def test_refused_above_the_limit(self, monkeypatch):
+        monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+        # Pillow alone would only warn below twice the limit
+        content = encode((40, 40))
+
+        with pytest.raises(Image.DecompressionBombError):
+            asyncio.run(run_image_task(open_image, content))
+
+    def test_images_within_the_limit_open(self, monkeypatch):
+        monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1600)
+
+        assert open_image(encode((40, 40))).size == (40, 40)
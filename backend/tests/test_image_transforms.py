@@ -0,0 +1,130 @@
+"""
+Tests for the local image transformation service in PhotoPro AI backend.
+Parameter validation, output geometry, and single-flight rendering.
+"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import image_budget
+import image_transforms
+from image_budget import PixelBudget
+from image_transforms import apply_transform, build_transform, transform_variant, TransformService
+
+
+def make_image(size, image_format: str = "JPEG", mode: str = "RGB") -> bytes:
+    image = Image.new(mode, size, color=(200, 120, 40, 255)[:len(mode)])
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def render(source: bytes, **kwargs) -> Image.Image:
+    return Image.open(io.BytesIO(apply_transform(source, build_transform(**kwargs))))
+
+
+class TestBuildTransform:
+    """Test parameter validation and normalisation"""
+
+    @pytest.mark.parametrize("kwargs", [
+        {},
+        {"width": 0},
+        {"width": 100000},
+        {"width": 300},
+        {"width": 10, "fit": "pad"},
+        {"width": 10, "output_format": "gif"},
+        {"width": 10, "quality": 101},
+    ])
+    def test_rejects_invalid(self, kwargs):
+        with pytest.raises(HTTPException) as exc_info:
+            build_transform(**kwargs)
+        assert exc_info.value.status_code == 400
+
+    def test_equivalent_requests_share_a_variant(self):
+        """Parameters that cannot change the output are normalised away"""
+        assert transform_variant(build_transform(width=200, fit="cover", gravity="face")) == \
+            transform_variant(build_transform(width=200, fit="scale"))
+        assert transform_variant(build_transform(width=256, height=128, output_format="png", quality=10)) == \
+            transform_variant(build_transform(width=256, height=128, output_format="png", quality=90))
+
+
+class TestApplyTransform:
+    """Test output geometry and encoding"""
+
+    def test_cover_crops_to_exact_size(self):
+        assert render(make_image((1200, 800)), width=320, height=320).size == (320, 320)
+
+    def test_contain_keeps_aspect_and_never_enlarges(self):
+        assert render(make_image((1200, 800)), width=320, height=320, fit="contain").size == (320, 213)
+        assert render(make_image((100, 50)), width=320, height=320, fit="contain").size == (100, 50)
+
+    def test_cover_and_scale_never_enlarge(self):
+        # The largest crop of the requested aspect, at source resolution
+        assert render(make_image((400, 200)), width=2048, height=1024).size == (400, 200)
+        assert render(make_image((400, 300)), width=1024, height=1024).size == (300, 300)
+        assert render(make_image((400, 300)), width=2048, height=256, fit="scale").size == (400, 256)
+
+    def test_single_dimension(self):
+        assert render(make_image((1200, 800)), height=128).size == (192, 128)
+
+    def test_formats(self):
+        source = make_image((400, 400), "PNG", "RGBA")
+        assert render(source, width=64, output_format="webp").format == "WEBP"
+        assert render(source, width=64, output_format="png").mode == "RGBA"
+        assert render(source, width=64, output_format="jpeg").mode == "RGB"
+
+    def test_deterministic(self):
+        source = make_image((640, 480))
+        params = build_transform(width=160, height=128, output_format="webp")
+        assert apply_transform(source, params) == apply_transform(source, params)
+
+
+class TestSingleFlight:
+    """Test that identical concurrent requests render once"""
+
+    def test_concurrent_requests_coalesce(self, tmp_path, monkeypatch):
+        from media_cache import MediaCache
+        monkeypatch.setattr(image_transforms, "media_cache", MediaCache(str(tmp_path), 10 * 1024 * 1024))
+
+        service = TransformService()
+        loads = []
+
+        async def load_source():
+            loads.append(1)
+            await asyncio.sleep(0.05)
+            return make_image((600, 600))
+
+        async def run():
+            params = build_transform(width=64, height=64)
+            return await asyncio.gather(*(service.get("a" * 64, params, load_source) for _ in range(8)))
+
+        results = asyncio.run(run())
+        assert len(loads) == 1
+        assert len(set(results)) == 1
+        assert service.coalesced == 7
+
+    def test_render_reserves_source_and_output_pixels(self, tmp_path, monkeypatch):
+        from media_cache import MediaCache
+        monkeypatch.setattr(image_transforms, "media_cache", MediaCache(str(tmp_path), 10 * 1024 * 1024))
+        budget = PixelBudget(10 ** 9, 1.0)
+        monkeypatch.setattr(image_budget, "pixel_budget", budget)
+        reserved = []
+
+        def recording_transform(source, params):
+            reserved.append(budget.in_use)
+            return apply_transform(source, params)
+
+        monkeypatch.setattr(image_transforms, "apply_transform", recording_transform)
+
+        async def load_source():
+            return make_image((600, 400))
+
+        asyncio.run(TransformService().get("b" * 64, build_transform(width=1024, height=1024), load_source))
+
+        # Output is capped at the source, so 600x400 decoded plus at most 600x400 out
+        assert reserved == [2 * 600 * 400]
+        assert budget.in_use == 0
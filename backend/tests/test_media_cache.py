@@ -0,0 +1,81 @@
+"""
+Tests for the local media cache in PhotoPro AI backend.
+Eviction, crash recovery, key validation, and range parsing.
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from media_cache import MediaCache, parse_range_header
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestMediaCache:
+    """Test the content-addressed disk cache"""
+
+    def test_put_and_lookup(self, tmp_path):
+        """Stored entries are found with their size and type"""
+        cache = MediaCache(str(tmp_path), max_bytes=1024)
+        data = b"x" * 100
+        cache.put_sync(content_hash(data), "original", data, "image/jpeg")
+
+        path, size, content_type = cache.lookup_sync(content_hash(data), "original")
+        assert open(path, "rb").read() == data
+        assert (size, content_type) == (100, "image/jpeg")
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """The oldest entry goes first once the cap is exceeded"""
+        cache = MediaCache(str(tmp_path), max_bytes=250)
+        blobs = [bytes([i]) * 100 for i in range(3)]
+
+        for index, blob in enumerate(blobs[:2]):
+            cache.put_sync(content_hash(blob), "original", blob, "image/jpeg")
+            cache._db.execute("UPDATE entries SET last_access = ? WHERE hash = ?", (index, content_hash(blob)))
+        cache.put_sync(content_hash(blobs[2]), "original", blobs[2], "image/jpeg")
+
+        assert cache.lookup_sync(content_hash(blobs[0]), "original") is None
+        assert cache.lookup_sync(content_hash(blobs[2]), "original") is not None
+        assert cache.evictions == 1
+
+    def test_recovers_after_crash(self, tmp_path):
+        """Unindexed files are adopted and stale temp files removed on start"""
+        data = b"\x89PNG\r\n\x1a\n" + b"\x00" * 50
+        directory = tmp_path / "objects" / content_hash(data)[:2] / content_hash(data)
+        directory.mkdir(parents=True)
+        (directory / "original").write_bytes(data)
+        (directory / "abc.tmp").write_bytes(b"partial")
+
+        cache = MediaCache(str(tmp_path), max_bytes=1024)
+        _, size, content_type = cache.lookup_sync(content_hash(data), "original")
+
+        assert (size, content_type) == (len(data), "image/png")
+        assert not os.path.exists(directory / "abc.tmp")
+
+    def test_rejects_unsafe_keys(self, tmp_path):
+        """Keys that could escape the cache directory are refused"""
+        cache = MediaCache(str(tmp_path), max_bytes=1024)
+        with pytest.raises(ValueError):
+            cache.put_sync("../" + "a" * 61, "original", b"x", "image/jpeg")
+        assert cache.lookup_sync("a" * 64, "../../etc") is None
+
+
+class TestRangeParsing:
+    """Test Range header handling"""
+
+    def test_ranges(self):
+        """Explicit, open-ended and suffix ranges"""
+        assert parse_range_header("bytes=0-9", 100) == (0, 9)
+        assert parse_range_header("bytes=90-", 100) == (90, 99)
+        assert parse_range_header("bytes=-10", 100) == (90, 99)
+        assert parse_range_header("bytes=50-500", 100) == (50, 99)
+
+    def test_unsupported_and_unsatisfiable(self):
+        """Multi-range is served whole; out-of-bounds ranges are errors"""
+        assert parse_range_header("bytes=0-1,5-6", 100) is None
+        with pytest.raises(ValueError):
+            parse_range_header("bytes=200-", 100)
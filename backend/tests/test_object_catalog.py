@@ -0,0 +1,112 @@
+"""
+Tests for the content-addressed object catalog in PhotoPro AI backend.
+Repeat stores of the same bytes are deduplicated and reference-counted.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import object_catalog as catalog_module
+from config import settings
+from database import Base
+from models import StoredObject
+from object_catalog import ObjectCatalog, content_key, is_content_addressed
+from storage_backends import LocalBackend
+from write_spool import WriteSpool
+from utils import calculate_file_hash
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + b"\x00" * 64
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/catalog.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    backend = LocalBackend()
+    monkeypatch.setattr(catalog_module, "write_spool", WriteSpool(backend, str(tmp_path / "spool")))
+    return backend
+
+
+class TestObjectCatalog:
+    """Test deduplicated stores and reference counts"""
+
+    def test_repeat_store_skips_write(self, db, backend):
+        catalog = ObjectCatalog()
+        content_hash = calculate_file_hash(JPEG_BYTES)
+
+        first, first_deduplicated = asyncio.run(catalog.store(db, "uploads", content_hash, JPEG_BYTES))
+        second, second_deduplicated = asyncio.run(catalog.store(db, "uploads", content_hash, JPEG_BYTES))
+
+        assert (first_deduplicated, second_deduplicated) == (False, True)
+        assert first.key == content_key("uploads", content_hash, "jpg")
+        assert second.url == first.url
+        assert second.ref_count == 2
+        assert first.etag is not None
+        assert is_content_addressed(first.key)
+        assert not is_content_addressed("uploads/1/photo.jpg")
+        assert backend.get_stats()["operations"]["put"] == 1
+        assert catalog.get_stats()["bytes_saved"] == len(JPEG_BYTES)
+
+    def test_concurrent_stores_write_once(self, db, backend):
+        catalog = ObjectCatalog()
+        content_hash = calculate_file_hash(JPEG_BYTES)
+
+        async def store_many():
+            return await asyncio.gather(*(
+                catalog.store(db, "uploads", content_hash, JPEG_BYTES) for _ in range(5)
+            ))
+
+        results = asyncio.run(store_many())
+
+        assert sum(not deduplicated for _, deduplicated in results) == 1
+        assert db.query(StoredObject).one().ref_count == 5
+
+    def test_release(self, db, backend):
+        catalog = ObjectCatalog()
+        content_hash = calculate_file_hash(JPEG_BYTES)
+        asyncio.run(catalog.store(db, "uploads", content_hash, JPEG_BYTES))
+
+        assert catalog.release(db, content_hash) == 0
+        assert catalog.release(db, content_hash) == 0
+        assert catalog.release(db, "0" * 64) is None
+
+    def test_abandoned_reference_survives_caller_rollback(self, db, backend):
+        catalog = ObjectCatalog()
+        content_hash = calculate_file_hash(JPEG_BYTES)
+        asyncio.run(catalog.store(db, "uploads", content_hash, JPEG_BYTES))
+        asyncio.run(catalog.store(db, "uploads", content_hash, JPEG_BYTES))
+        # The caller fails before committing the row that would hold the reference
+        db.add(StoredObject(content_hash="f" * 64, key="uploads/x", url="x", size=1))
+
+        catalog.release_abandoned(db, [content_hash])
+
+        assert db.query(StoredObject).count() == 1
+        assert db.query(StoredObject.ref_count).scalar() == 1
+
+    def test_store_rewrites_after_stale_tombstone(self, db, backend, monkeypatch):
+        monkeypatch.setattr(catalog_module, "COLLECTION_WAIT_SECONDS", 0.0)
+        catalog = ObjectCatalog()
+        content_hash = calculate_file_hash(JPEG_BYTES)
+        key = content_key("uploads", content_hash, "jpg")
+        db.add(StoredObject(
+            content_hash=content_hash, key=key, url=backend.url(key), size=len(JPEG_BYTES),
+            content_type="image/jpeg", ref_count=catalog_module.TOMBSTONE
+        ))
+        db.commit()
+
+        stored, deduplicated = asyncio.run(catalog.store(db, "uploads", content_hash, JPEG_BYTES))
+
+        assert not deduplicated
+        assert stored.ref_count == 1
+        assert asyncio.run(backend.get(key)) == JPEG_BYTES
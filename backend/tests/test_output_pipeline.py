@@ -0,0 +1,108 @@
+"""
+Tests for the model output fan-out in PhotoPro AI backend.
+One download shared by all consumers, how consumer or download failures
+are reported, and cancellation.
+"""
+
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+import output_pipeline
+from output_pipeline import OutputFanOut
+from utils import calculate_file_hash
+
+
+def make_png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (10, 20, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeClient:
+    """Stands in for the pooled HTTP client"""
+
+    def __init__(self, content=None, error=None):
+        self.content = content
+        self.error = error
+        self.fetches = []
+
+    async def fetch_bytes(self, url):
+        self.fetches.append(url)
+        if self.error:
+            raise self.error
+        return self.content
+
+
+@pytest.fixture
+def png():
+    return make_png()
+
+
+class TestOutputFanOut:
+    """Test sharing the download and isolating failures"""
+
+    def test_failed_consumer_does_not_affect_others(self, png, monkeypatch):
+        client = FakeClient(png)
+        monkeypatch.setattr(output_pipeline, "http_client", client)
+        received = []
+
+        async def failing(data, content_hash):
+            raise RuntimeError("storage unavailable")
+
+        async def slow(data, content_hash):
+            # Still finishes after its sibling has already failed
+            await asyncio.sleep(0.02)
+            received.append((data, content_hash))
+            return "stored"
+
+        async def fast(data, content_hash):
+            return len(data)
+
+        fan_out = OutputFanOut()
+        result = asyncio.run(fan_out.run("https://model/out.png", {
+            "thumbnail": failing,
+            "storage": slow,
+            "cache": fast,
+        }))
+
+        assert client.fetches == ["https://model/out.png"]
+        assert result["hash"] == calculate_file_hash(png)
+        assert result["format"] == "PNG"
+        assert result["results"] == {"thumbnail": None, "storage": "stored", "cache": len(png)}
+        assert received == [(png, calculate_file_hash(png))]
+        assert (fan_out.outputs, fan_out.consumer_failures, fan_out.download_failures) == (1, 1, 0)
+
+    def test_cancelled_consumer_is_not_a_failure(self, png, monkeypatch):
+        monkeypatch.setattr(output_pipeline, "http_client", FakeClient(png))
+
+        async def cancelled(data, content_hash):
+            raise asyncio.CancelledError()
+
+        async def fast(data, content_hash):
+            return len(data)
+
+        fan_out = OutputFanOut()
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(fan_out.run("https://model/out.png", {"storage": cancelled, "cache": fast}))
+        assert fan_out.consumer_failures == 0
+
+    @pytest.mark.parametrize("client", [
+        FakeClient(error=ConnectionError("timed out")),
+        FakeClient(b"<html>not an image</html>"),
+    ])
+    def test_failed_download_skips_consumers(self, client, monkeypatch):
+        monkeypatch.setattr(output_pipeline, "http_client", client)
+        calls = []
+
+        async def consumer(data, content_hash):
+            calls.append(content_hash)
+
+        fan_out = OutputFanOut()
+        result = asyncio.run(fan_out.run("https://model/out.png", {"storage": consumer}))
+
+        assert result == {"hash": None, "bytes": 0, "format": None, "results": {"storage": None}}
+        assert calls == []
+        assert (fan_out.outputs, fan_out.download_failures) == (0, 1)
@@ -0,0 +1,114 @@
+"""
+Tests for resumable uploads in PhotoPro AI backend.
+Chunked appends, resuming, checksums and early header rejection.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from resumable_uploads import ResumableUploadManager, parse_upload_checksum
+
+
+def encode(size, image_format="JPEG") -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def dropped(chunk):
+    yield chunk
+    raise ConnectionResetError("client went away")
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return ResumableUploadManager(str(tmp_path))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestResumableUploads:
+    """Test the create, append and finalize steps"""
+
+    def test_resume_after_dropped_connection(self, manager, tmp_path):
+        data = encode((800, 600))
+        session = run(manager.create(1, "photo.jpg", "image/jpeg", len(data), hashlib.sha256(data).hexdigest()))
+
+        with pytest.raises(ConnectionResetError):
+            run(manager.append(session, 0, dropped(data[:5000])))
+        assert session.offset == 5000
+
+        # A restarted process picks the upload up from disk
+        restarted = ResumableUploadManager(str(tmp_path))
+        resumed = run(restarted.get(session.upload_id, 1))
+        assert resumed.offset == 5000
+
+        assert run(restarted.append(resumed, 5000, body(data[5000:]))) == len(data)
+        assert run(restarted.read_completed(resumed)) == data
+
+    def test_stale_offset_and_overrun(self, manager):
+        data = encode((800, 600))
+        session = run(manager.create(1, "photo.jpg", "image/jpeg", len(data)))
+        run(manager.append(session, 0, body(data[:1000])))
+
+        with pytest.raises(HTTPException) as exc_info:
+            run(manager.append(session, 0, body(data[:1000])))
+        assert exc_info.value.status_code == 409
+
+        with pytest.raises(HTTPException) as exc_info:
+            run(manager.append(session, 1000, body(data[1000:], b"extra")))
+        assert exc_info.value.status_code == 400
+        assert session.offset == 1000
+
+    def test_chunk_checksum_mismatch_rolls_back(self, manager):
+        data = encode((800, 600))
+        session = run(manager.create(1, "photo.jpg", "image/jpeg", len(data)))
+        wrong = hashlib.sha256(b"other").digest()
+
+        with pytest.raises(HTTPException) as exc_info:
+            run(manager.append(session, 0, body(data[:4000]), wrong))
+        assert exc_info.value.status_code == 460
+        assert session.offset == 0
+
+        run(manager.append(session, 0, body(data), hashlib.sha256(data).digest()))
+        assert session.hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+    def test_bad_header_rejected_before_upload_finishes(self, manager):
+        data = encode((300, 300))
+        session = run(manager.create(1, "photo.jpg", "image/jpeg", len(data)))
+
+        with pytest.raises(HTTPException) as exc_info:
+            run(manager.append(session, 0, body(data[:2000])))
+        assert exc_info.value.status_code == 400
+        with pytest.raises(HTTPException):
+            run(manager.get(session.upload_id, 1))
+
+    def test_incomplete_and_foreign_uploads(self, manager):
+        session = run(manager.create(1, "photo.png", "image/png", 1000))
+
+        with pytest.raises(HTTPException) as exc_info:
+            run(manager.read_completed(session))
+        assert exc_info.value.status_code == 409
+        with pytest.raises(HTTPException) as exc_info:
+            run(manager.get(session.upload_id, 2))
+        assert exc_info.value.status_code == 404
+
+    def test_parse_upload_checksum(self):
+        digest = hashlib.sha256(b"chunk").digest()
+        assert parse_upload_checksum("sha256 " + base64.b64encode(digest).decode()) == digest
+        assert parse_upload_checksum(None) is None
+        with pytest.raises(HTTPException):
+            parse_upload_checksum("md5 " + base64.b64encode(b"x" * 16).decode())
@@ -0,0 +1,46 @@
+"""
+Tests for gallery contact sheets in PhotoPro AI backend.
+Grid layout, skipped tiles, and cache keys.
+"""
+
+import io
+
+from PIL import Image
+
+from sprites import compose_sprite, sprite_key, SPRITE_COLUMNS
+
+
+def thumbnail(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 200), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class TestComposeSprite:
+    """Test sheet layout"""
+
+    def test_grid_offsets(self):
+        """Tiles fill rows left to right and wrap after SPRITE_COLUMNS"""
+        thumbnails = [thumbnail((i * 10, 0, 0)) for i in range(SPRITE_COLUMNS + 2)]
+        data, size, offsets = compose_sprite(thumbnails, 64)
+
+        assert size == (SPRITE_COLUMNS * 64, 128)
+        assert offsets[0] == (0, 0)
+        assert offsets[SPRITE_COLUMNS] == (0, 64)
+        assert Image.open(io.BytesIO(data)).size == size
+
+    def test_missing_and_corrupt_thumbnails_are_skipped(self):
+        """Unavailable tiles get no offset and leave no gap"""
+        data, size, offsets = compose_sprite([thumbnail("red"), None, b"not an image", thumbnail("blue")], 64)
+
+        assert offsets == [(0, 0), None, None, (64, 0)]
+        assert size == (128, 64)
+
+
+class TestSpriteKey:
+    """Test sheet cache keys"""
+
+    def test_version_changes_key(self):
+        assert sprite_key(1, 1, 50, 128) != sprite_key(1, 2, 50, 128)
+        assert sprite_key(1, 1, 50, 128) == sprite_key(1, 1, 50, 128)
+        assert len(sprite_key(1, 1, 50, 128)) == 64
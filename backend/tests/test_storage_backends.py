@@ -0,0 +1,93 @@
+"""
+Tests for the storage backend layer in PhotoPro AI backend.
+Exercises the local filesystem backend end to end.
+"""
+
+import asyncio
+import hashlib
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from config import settings
+from storage_backends import (
+    IMMUTABLE_CACHE_CONTROL, LocalBackend, StorageObjectNotFound, sign_local_key
+)
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_BASE_URL", "http://localhost:8000/files")
+    return LocalBackend()
+
+
+class TestLocalBackend:
+    """Test the local filesystem backend"""
+
+    def test_round_trip(self, backend):
+        async def run():
+            url = await backend.put("uploads/1/a.jpg", b"data", "image/jpeg")
+            data = await backend.get("uploads/1/a.jpg")
+            listed = await backend.list("uploads/")
+            await backend.delete("uploads/1/a.jpg")
+            return url, data, listed, await backend.list("uploads/")
+
+        url, data, listed, after_delete = asyncio.run(run())
+
+        assert url == "http://localhost:8000/files/uploads/1/a.jpg"
+        assert data == b"data"
+        assert [(item["key"], item["size"]) for item in listed] == [("uploads/1/a.jpg", 4)]
+        assert after_delete == []
+        assert backend.get_stats()["operations"] == {"put": 1, "get": 1, "list": 2, "delete": 1}
+
+    def test_put_object_returns_etag(self, backend):
+        stored = asyncio.run(backend.put_object(
+            "uploads/1/a.jpg", b"data", "image/jpeg", cache_control=IMMUTABLE_CACHE_CONTROL
+        ))
+
+        assert stored["url"] == "http://localhost:8000/files/uploads/1/a.jpg"
+        assert stored["etag"] == f'"{hashlib.md5(b"data").hexdigest()}"'
+
+    def test_missing_key(self, backend):
+        with pytest.raises(StorageObjectNotFound):
+            asyncio.run(backend.get("uploads/missing.jpg"))
+
+    def test_rejects_escaping_keys(self, backend):
+        with pytest.raises(ValueError):
+            backend.path("../outside.jpg")
+
+    def test_presign_signature(self, backend):
+        url = asyncio.run(backend.presign("uploads/1/a.jpg", expires_in=60))
+        query = parse_qs(urlsplit(url).query)
+
+        expires = int(query["expires"][0])
+        assert query["signature"][0] == sign_local_key("uploads/1/a.jpg", expires)
+
+    def test_delete_batch(self, backend):
+        async def run():
+            for name in ("a", "b"):
+                await backend.put(f"uploads/1/{name}.jpg", b"data", "image/jpeg")
+            failed = await backend.delete_batch(["uploads/1/a.jpg", "uploads/1/b.jpg", "uploads/1/missing.jpg", "../x"])
+            return failed, await backend.list("uploads/")
+
+        failed, remaining = asyncio.run(run())
+
+        assert failed == ["../x"]
+        assert remaining == []
+        assert backend.get_stats()["operations"]["delete_batch"] == 1
+
+    def test_iter_objects_in_key_order(self, backend):
+        async def run():
+            for key in ("uploads/b/y.jpg", "uploads/a/x.jpg", "uploads/a.jpg", "uploads/a-b.jpg"):
+                await backend.put(key, b"data", "image/jpeg")
+            listed = [item["key"] async for item in backend.iter_objects("uploads/")]
+            after = [item["key"] async for item in backend.iter_objects("uploads/", start_after="uploads/a.jpg")]
+            prefixed = [item["key"] async for item in backend.iter_objects("uploads/a")]
+            return listed, after, prefixed
+
+        listed, after, prefixed = asyncio.run(run())
+
+        assert listed == ["uploads/a-b.jpg", "uploads/a.jpg", "uploads/a/x.jpg", "uploads/b/y.jpg"]
+        assert after == ["uploads/a/x.jpg", "uploads/b/y.jpg"]
+        assert prefixed == listed[:3]
@@ -0,0 +1,203 @@
+"""
+Tests for orphan-object garbage collection in PhotoPro AI backend.
+Merge join against the local backend, grace period, dry runs and resumption.
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import bulk_deletion
+import storage_gc
+from config import settings
+from database import Base
+from models import GcRun, GeneratedPhoto, StoredObject, Upload, User
+from storage_backends import LocalBackend, StorageBackend
+from object_catalog import ObjectCatalog
+from storage_gc import GarbageCollector
+from write_spool import WriteSpool
+
+HASH_A = "a" * 64
+HASH_B = "b" * 64
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/gc.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(storage_gc, "SessionLocal", factory)
+    return factory
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(settings, "BULK_DELETE_BATCHES_PER_SECOND", 1000.0)
+    backend = LocalBackend()
+    backend.delete_batch_size = 2
+    monkeypatch.setattr(bulk_deletion, "storage_backend", backend)
+    monkeypatch.setattr(bulk_deletion, "write_spool", WriteSpool(backend, str(tmp_path / "spool")))
+    monkeypatch.setattr(storage_gc, "storage_backend", backend)
+    return backend
+
+
+def store(backend, keys, hours_ago=72):
+    async def run():
+        for key in keys:
+            await backend.put(key, b"data", "image/jpeg")
+
+    asyncio.run(run())
+    moment = time.time() - hours_ago * 3600
+    for key in keys:
+        os.utime(backend.path(key), (moment, moment))
+
+
+def remaining(backend):
+    return [item["key"] for item in asyncio.run(backend.list(""))]
+
+
+@pytest.fixture
+def tree(session_factory, backend):
+    """Referenced, orphaned, recently released and too-young objects"""
+    db = session_factory()
+    user = User(email="gc@example.com", username="gc", full_name="GC", hashed_password="x")
+    db.add(user)
+    db.flush()
+
+    live = f"uploads/{HASH_A[:2]}/{HASH_A}.jpg"
+    released = f"uploads/{HASH_B[:2]}/{HASH_B}.jpg"
+    store(backend, [
+        live, released,
+        "uploads/1/direct.jpg",
+        "uploads/1/orphan.jpg",
+        "thumbnails/legacy.jpg",
+        "thumbnails/orphan.jpg",
+        "generated/orphan.png",
+    ])
+    store(backend, ["generated/young.png"], hours_ago=1)
+
+    db.add(StoredObject(content_hash=HASH_A, key=live, url=backend.url(live), size=4, content_type="image/jpeg"))
+    db.add(StoredObject(
+        content_hash=HASH_B, key=released, url=backend.url(released), size=4, content_type="image/jpeg",
+        ref_count=0, last_referenced_at=datetime.utcnow() - timedelta(hours=72)
+    ))
+    db.add(Upload(
+        user_id=user.id, key="uploads/1/direct.jpg", url=backend.url("uploads/1/direct.jpg"),
+        filename="direct.jpg", format="JPEG", width=1, height=1, size=4
+    ))
+    db.add(Upload(
+        user_id=user.id, key="uploads/1/missing.jpg", url=backend.url("uploads/1/missing.jpg"),
+        filename="missing.jpg", format="JPEG", width=1, height=1, size=4
+    ))
+    # Thumbnails from before the object catalog are only referenced by URL
+    db.add(GeneratedPhoto(
+        user_id=user.id, style="corporate", original_url=backend.url(live),
+        thumbnail_url=backend.url("thumbnails/legacy.jpg")
+    ))
+    db.commit()
+    return db
+
+
+class TestGarbageCollector:
+    """Test orphan detection, deletion and checkpointing"""
+
+    def test_dry_run_reports_without_deleting(self, tree, backend):
+        collector = GarbageCollector()
+        run = collector.create_run(tree, dry_run=True)
+
+        asyncio.run(collector.run(run.id))
+
+        tree.refresh(run)
+        assert (run.status, run.scanned, run.orphans, run.deleted, run.missing) == ("completed", 8, 4, 0, 1)
+        assert sorted(json.loads(run.report)) == [
+            "generated/orphan.png",
+            "thumbnails/orphan.jpg",
+            "uploads/1/orphan.jpg",
+            f"uploads/{HASH_B[:2]}/{HASH_B}.jpg",
+        ]
+        assert len(remaining(backend)) == 8
+
+    def test_deletes_orphans_and_released_catalog_rows(self, tree, backend):
+        collector = GarbageCollector()
+        run = collector.create_run(tree, dry_run=False)
+
+        asyncio.run(collector.run(run.id))
+
+        tree.refresh(run)
+        assert (run.status, run.orphans, run.deleted, run.failed) == ("completed", 4, 4, 0)
+        assert remaining(backend) == [
+            "generated/young.png",
+            "thumbnails/legacy.jpg",
+            "uploads/1/direct.jpg",
+            f"uploads/{HASH_A[:2]}/{HASH_A}.jpg",
+        ]
+        assert [row.content_hash for row in tree.query(StoredObject)] == [HASH_A]
+
+    def test_resume_continues_after_checkpoint(self, tree, backend):
+        collector = GarbageCollector()
+        run = collector.create_run(tree, dry_run=False)
+        run.status = "failed"
+        run.checkpoint = "thumbnails/zzz"
+        tree.commit()
+
+        collector.resume(tree, run)
+        asyncio.run(collector.run(run.id))
+
+        tree.refresh(run)
+        assert (run.status, run.deleted) == ("completed", 2)
+        assert "generated/orphan.png" in remaining(backend)
+        assert "thumbnails/orphan.jpg" in remaining(backend)
+
+    def test_unordered_backend_is_refused(self, session_factory, monkeypatch):
+        class Unordered(LocalBackend):
+            iter_objects = StorageBackend.iter_objects
+
+        monkeypatch.setattr(storage_gc, "storage_backend", Unordered())
+
+        with pytest.raises(NotImplementedError):
+            GarbageCollector().create_run(session_factory())
+        assert session_factory().query(GcRun).count() == 0
+
+    def test_expired_uploads_do_not_hold_objects(self, tree, backend):
+        upload = tree.query(Upload).filter(Upload.key == "uploads/1/direct.jpg").one()
+        upload.expired_at = datetime.utcnow()
+        tree.commit()
+        collector = GarbageCollector()
+        run = collector.create_run(tree, dry_run=True)
+
+        asyncio.run(collector.run(run.id))
+
+        tree.refresh(run)
+        assert run.orphans == 5
+        assert "uploads/1/direct.jpg" in json.loads(run.report)
+
+    def test_reference_taken_after_recheck_spares_object(self, tree, session_factory, backend):
+        released = f"uploads/{HASH_B[:2]}/{HASH_B}.jpg"
+        collector = GarbageCollector()
+        recheck = collector._still_referenced
+
+        def recheck_then_reference(db, keys, cutoff):
+            referenced = recheck(db, keys, cutoff)
+            if released in keys:
+                # An upload of the same bytes lands between the recheck and the delete
+                other = session_factory()
+                ObjectCatalog()._add_reference(other, HASH_B)
+                other.close()
+            return referenced
+
+        collector._still_referenced = recheck_then_reference
+        run = collector.create_run(tree, dry_run=False)
+
+        asyncio.run(collector.run(run.id))
+
+        tree.expire_all()
+        assert released in remaining(backend)
+        assert tree.query(StoredObject).filter(StoredObject.content_hash == HASH_B).one().ref_count == 1
+        assert (tree.query(GcRun).one().deleted, tree.query(GcRun).one().orphans) == (3, 3)
@@ -0,0 +1,91 @@
+"""
+Tests for direct upload completion in PhotoPro AI backend.
+Replaying an upload token returns the first completion's upload.
+"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import direct_uploads
+from auth import get_current_user
+from config import settings
+from database import Base, get_db
+from main_full import app
+from models import Upload, User
+from storage_backends import LocalBackend
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    backend = LocalBackend()
+    monkeypatch.setattr(direct_uploads, "storage_backend", backend)
+
+    engine = create_engine(f"sqlite:///{tmp_path}/api.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    user = User(email="u@example.com", username="u", full_name="U", hashed_password="x")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    def override_get_db():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app), backend, db
+    app.dependency_overrides.clear()
+    db.close()
+
+
+def stored_intent(backend, user_id=1):
+    """Issue an intent and store a JPEG under its key, as the client would"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 512), (90, 120, 150)).save(buffer, format="JPEG")
+    content = buffer.getvalue()
+
+    async def run():
+        intent = await direct_uploads.create_upload_intent(user_id, "photo.jpg", "image/jpeg", len(content))
+        await backend.put(intent["key"], content, "image/jpeg")
+        return intent
+
+    return asyncio.run(run())
+
+
+class TestUploadCompletion:
+    """Test that completing a direct upload records it once"""
+
+    def test_replayed_token_returns_first_upload(self, client):
+        api, backend, db = client
+        intent = stored_intent(backend)
+
+        first = api.post("/photos/upload-complete", json={"upload_token": intent["upload_token"]})
+        replay = api.post("/photos/upload-complete", json={"upload_token": intent["upload_token"]})
+
+        assert first.status_code == replay.status_code == 200
+        assert replay.json() == first.json()
+        assert first.json()["dimensions"] == {"width": 640, "height": 512}
+        assert db.query(Upload).filter(Upload.key == intent["key"]).count() == 1
+
+    def test_replay_skips_storage(self, client):
+        api, backend, db = client
+        intent = stored_intent(backend)
+        api.post("/photos/upload-complete", json={"upload_token": intent["upload_token"]})
+        asyncio.run(backend.delete(intent["key"]))
+
+        replay = api.post("/photos/upload-complete", json={"upload_token": intent["upload_token"]})
+
+        assert replay.status_code == 200
+        assert db.query(Upload).count() == 1
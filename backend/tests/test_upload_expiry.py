@@ -0,0 +1,139 @@
+"""
+Tests for plan-based upload retention in PhotoPro AI backend.
+Expiry by plan and pin, object release and deletion, and growth stats.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import bulk_deletion
+from config import settings
+from database import Base
+from models import StoredObject, Upload, User
+from storage_backends import LocalBackend
+from upload_expiry import UploadExpiry, retention_days
+from write_spool import WriteSpool
+
+HASH = "c" * 64
+SHARED_KEY = f"uploads/{HASH[:2]}/{HASH}.jpg"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/expiry.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(bulk_deletion, "SessionLocal", factory)
+    session = factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(settings, "BULK_DELETE_BATCHES_PER_SECOND", 1000.0)
+    monkeypatch.setattr(settings, "UPLOAD_RETENTION_DAYS", {"free": 30, "pro": 365, "enterprise": 0})
+    backend = LocalBackend()
+    monkeypatch.setattr(bulk_deletion, "storage_backend", backend)
+    monkeypatch.setattr(bulk_deletion, "write_spool", WriteSpool(backend, str(tmp_path / "spool")))
+    return backend
+
+
+def add_user(db, name, plan):
+    user = User(email=f"{name}@example.com", username=name, full_name=name, hashed_password="x", plan=plan)
+    db.add(user)
+    db.flush()
+    return user
+
+
+def add_upload(db, backend, user, key, days_ago, pinned=False, content_hash=None):
+    asyncio.run(backend.put(key, b"data", "image/jpeg"))
+    upload = Upload(
+        user_id=user.id, key=key, url=backend.url(key), content_hash=content_hash, filename="a.jpg",
+        format="JPEG", width=1, height=1, size=4, pinned=pinned,
+        created_at=datetime.utcnow() - timedelta(days=days_ago)
+    )
+    db.add(upload)
+    return upload
+
+
+def remaining(backend):
+    return [item["key"] for item in asyncio.run(backend.list(""))]
+
+
+class TestUploadExpiry:
+    """Test retention by plan and pin"""
+
+    def test_retention_days(self, backend):
+        assert retention_days("free") == 30
+        assert retention_days("enterprise") is None
+        assert retention_days("unknown") is None
+
+    def test_expires_unpinned_uploads_past_plan_retention(self, db, backend):
+        free = add_user(db, "free", "free")
+        pro = add_user(db, "pro", "pro")
+        enterprise = add_user(db, "enterprise", "enterprise")
+        old = add_upload(db, backend, free, "uploads/1/old.jpg", 31)
+        pinned = add_upload(db, backend, free, "uploads/1/pinned.jpg", 31, pinned=True)
+        add_upload(db, backend, free, "uploads/1/new.jpg", 5)
+        shared = add_upload(db, backend, free, SHARED_KEY, 31, content_hash=HASH)
+        add_upload(db, backend, pro, "uploads/2/old.jpg", 100)
+        add_upload(db, backend, enterprise, "uploads/3/old.jpg", 1000)
+        db.add(StoredObject(content_hash=HASH, key=SHARED_KEY, url=backend.url(SHARED_KEY), size=4, content_type="image/jpeg"))
+        db.commit()
+
+        expiry = UploadExpiry()
+        result = asyncio.run(expiry.expire(db))
+
+        assert (result["expired"], result["bytes"], result["released"]) == (2, 8, 1)
+        db.refresh(old)
+        db.refresh(shared)
+        db.refresh(pinned)
+        assert old.expired_at is not None and shared.expired_at is not None
+        assert pinned.expired_at is None
+        # The shared object is left for garbage collection
+        assert db.query(StoredObject).one().ref_count == 0
+        assert remaining(backend) == [
+            "uploads/1/new.jpg", "uploads/1/pinned.jpg", "uploads/2/old.jpg", "uploads/3/old.jpg", SHARED_KEY
+        ]
+
+        # Already expired uploads are not expired again
+        assert asyncio.run(expiry.expire(db))["expired"] == 0
+        assert expiry.get_stats()["uploads_expired"] == 2
+
+    def test_storage_growth(self, db, backend):
+        user = add_user(db, "free", "free")
+        add_upload(db, backend, user, "uploads/1/a.jpg", 1)
+        add_upload(db, backend, user, "uploads/1/b.jpg", 2, pinned=True)
+        expired = add_upload(db, backend, user, "uploads/1/c.jpg", 40)
+        expired.expired_at = datetime.utcnow() - timedelta(days=1)
+        db.commit()
+
+        growth = UploadExpiry().storage_growth(db, days=2)
+
+        assert (growth["uploads"], growth["upload_bytes"], growth["pinned_uploads"]) == (2, 8, 1)
+        assert (growth["added_bytes_per_day"], growth["expired_bytes_per_day"], growth["net_bytes_per_day"]) == (2, 2, 0)
+        assert growth["retention_days"]["enterprise"] is None
+
+    def test_key_shared_with_live_upload_is_kept(self, db, backend):
+        user = add_user(db, "free", "free")
+        old = add_upload(db, backend, user, "uploads/1/shared.jpg", 31)
+        pinned = add_upload(db, backend, user, "uploads/1/shared.jpg", 31, pinned=True)
+        db.commit()
+
+        result = asyncio.run(UploadExpiry().expire(db))
+
+        assert result["expired"] == 1
+        db.refresh(old)
+        db.refresh(pinned)
+        assert old.expired_at is not None and pinned.expired_at is None
+        assert remaining(backend) == ["uploads/1/shared.jpg"]
+
+    def test_upload_indexes(self):
+        names = {index.name for index in Upload.__table__.indexes}
+        assert {"ix_uploads_user_created", "ix_uploads_expiry"} <= names
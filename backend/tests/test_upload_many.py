@@ -0,0 +1,138 @@
+"""
+Tests for batch uploads in PhotoPro AI backend.
+Per-file results, isolation of failed files, and request caps.
+"""
+
+import asyncio
+import io
+import random
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+import main_full
+import object_catalog
+from auth import get_current_user
+from config import settings
+from database import Base, get_db
+from main_full import app, limit_request_body
+from media_cache import MediaCache
+from models import StoredObject, Upload, User
+from storage_backends import LocalBackend
+from write_spool import WriteSpool
+
+
+def photo(seed: int) -> bytes:
+    rng = random.Random(seed)
+    noise = Image.frombytes("RGB", (32, 32), bytes(rng.randrange(256) for _ in range(32 * 32 * 3)))
+    buffer = io.BytesIO()
+    noise.resize((600, 600), Image.BICUBIC).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(settings, "QUALITY_GATE_MODE", "off")
+    monkeypatch.setattr(object_catalog, "write_spool", WriteSpool(LocalBackend(), str(tmp_path / "spool")))
+    monkeypatch.setattr(main_full, "media_cache", MediaCache(str(tmp_path / "cache"), 10 * 1024 * 1024))
+
+    engine = create_engine(f"sqlite:///{tmp_path}/api.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(main_full, "SessionLocal", factory)
+    db = factory()
+    user = User(email="u@example.com", username="u", full_name="U", hashed_password="x")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    def override_get_db():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app), db
+    app.dependency_overrides.clear()
+    db.close()
+
+
+def upload(api, contents):
+    files = [("files", (name, content, "image/jpeg")) for name, content in contents]
+    return api.post("/photos/upload-many", files=files)
+
+
+class TestUploadMany:
+    """Test per-file results and request caps"""
+
+    def test_failed_files_do_not_affect_others(self, client, monkeypatch):
+        api, db = client
+        # One file at a time, as SQLite would otherwise lock out the writers
+        monkeypatch.setattr(settings, "IMAGE_WORKERS", 1)
+        record_fingerprint = main_full.record_fingerprint
+        calls = []
+
+        def poisoning_record_fingerprint(session, user_id, image_url, phash):
+            if not calls:
+                # Leave the first file's session with a row that cannot be inserted
+                session.add(Upload(user_id=None, key="x", url="x", filename="x", format="JPEG", width=1, height=1, size=1))
+            calls.append(image_url)
+            return record_fingerprint(session, user_id, image_url, phash)
+
+        monkeypatch.setattr(main_full, "record_fingerprint", poisoning_record_fingerprint)
+
+        response = upload(api, [
+            ("a.jpg", photo(1)),
+            ("b.jpg", photo(2)),
+            ("c.jpg", photo(3)),
+            ("bad.jpg", b"not an image"),
+        ])
+
+        assert response.status_code == 200
+        results = {result["filename"]: result["status_code"] for result in response.json()["results"]}
+        assert results["bad.jpg"] == 400
+        assert sorted(results.values()) == [200, 200, 400, 500]
+        assert (response.json()["uploaded"], response.json()["failed"]) == (2, 2)
+        assert db.query(Upload).count() == 2
+        # The failed file gave back the reference its store took
+        assert sorted(row.ref_count for row in db.query(StoredObject)) == [0, 1, 1]
+
+    def test_too_many_files(self, client, monkeypatch):
+        api, _ = client
+        monkeypatch.setattr(settings, "UPLOAD_MANY_MAX_FILES", 2)
+
+        response = upload(api, [(f"{i}.jpg", photo(i)) for i in range(3)])
+
+        assert response.status_code == 400
+
+    def test_body_over_limit_is_refused_before_parsing(self, client, monkeypatch):
+        api, db = client
+        monkeypatch.setattr(settings, "UPLOAD_MANY_MAX_BYTES", 1024)
+
+        response = upload(api, [("a.jpg", photo(1))])
+
+        assert response.status_code == 413
+        assert db.query(Upload).count() == 0
+
+    def test_streamed_body_is_cut_off(self):
+        chunks = [b"x" * 600, b"x" * 600, b"x" * 600]
+
+        async def receive():
+            return {"type": "http.request", "body": chunks.pop(0), "more_body": bool(chunks)}
+
+        request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+        limited = limit_request_body(request, 1000)
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(limited.body())
+        assert exc_info.value.status_code == 413
+        assert len(chunks) == 1
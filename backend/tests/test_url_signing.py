@@ -0,0 +1,127 @@
+"""
+Tests for signed read URLs in PhotoPro AI backend.
+Bulk SigV4 presigning against botocore, memoization, passthrough, and
+rotating credentials.
+"""
+
+import datetime
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from botocore.auth import S3SigV4QueryAuth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials, ReadOnlyCredentials
+
+import url_signing
+from config import settings
+from storage_backends import LocalBackend, sign_local_key
+from url_signing import SigV4Presigner, UrlSigner
+
+
+def botocore_presign(url, signed_at, expires_in, token=None):
+    """Reference presigned URL from botocore with its clock pinned"""
+    moment = datetime.datetime.utcfromtimestamp(signed_at)
+    with mock.patch("botocore.auth.get_current_datetime", return_value=moment):
+        auth = S3SigV4QueryAuth(Credentials("AKID", "SECRET", token), "s3", "eu-west-1", expires=expires_in)
+        request = AWSRequest(method="GET", url=url)
+        auth.add_auth(request)
+        return request.prepare().url
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_BASE_URL", "http://localhost:8000/files")
+    monkeypatch.setattr(settings, "STORAGE_PRIVATE", True)
+    return LocalBackend()
+
+
+class TestSigV4Presigner:
+    """Test signatures against botocore's presigner"""
+
+    @pytest.mark.parametrize("url,token", [
+        ("https://bkt.s3.eu-west-1.amazonaws.com/uploads/ab/a%20b%2Bc.jpg", None),
+        ("http://127.0.0.1:9000/bkt/thumbnails/ab/abc.jpg", "TOKEN/+="),
+    ])
+    def test_matches_botocore(self, url, token):
+        presigner = SigV4Presigner("AKID", "SECRET", token, "eu-west-1")
+        ours = presigner.presign_many([url], 1760000000, 3900)[0]
+        theirs = botocore_presign(url, 1760000000, 3900, token)
+
+        assert urlsplit(ours).path == urlsplit(theirs).path
+        assert parse_qs(urlsplit(ours).query) == parse_qs(urlsplit(theirs).query)
+
+    def test_signing_key_derived_once_per_day(self):
+        presigner = SigV4Presigner("AKID", "SECRET", None, "eu-west-1")
+        key = presigner.signing_key("20251009")
+
+        assert presigner.signing_key("20251009") is key
+        assert presigner.signing_key("20251010") != key
+
+
+class TestUrlSigner:
+    """Test bulk signing through the configured backend"""
+
+    def test_local_urls_are_signed_and_memoized(self, backend):
+        signer = UrlSigner(backend)
+        urls = [backend.url(f"uploads/ab/{index}.jpg") for index in range(3)]
+
+        first = signer.sign_urls(urls + [urls[0]])
+        second = signer.sign_urls(urls)
+
+        query = parse_qs(urlsplit(first[0]).query)
+        expires = int(query["expires"][0])
+        assert query["signature"][0] == sign_local_key("uploads/ab/0.jpg", expires)
+        assert first[3] == first[0]
+        assert second == first[:3]
+        assert signer.get_stats()["urls_signed"] == 3
+        assert signer.get_stats()["cache_hits"] == 3
+
+    def test_foreign_and_missing_urls_pass_through(self, backend):
+        signer = UrlSigner(backend)
+
+        assert signer.sign_urls(["https://replicate.delivery/out.png", None]) == [
+            "https://replicate.delivery/out.png", None
+        ]
+
+    def test_public_bucket_is_unchanged(self, backend, monkeypatch):
+        monkeypatch.setattr(settings, "STORAGE_PRIVATE", False)
+        url = backend.url("uploads/ab/0.jpg")
+
+        assert UrlSigner(backend).sign_urls([url]) == [url]
+
+
+class TestRotatingCredentials:
+    """Test that the presigner follows refreshed credentials"""
+
+    def test_presigner_is_rebuilt_when_credentials_rotate(self, backend, monkeypatch):
+        monkeypatch.setattr(settings, "AWS_ACCESS_KEY_ID", None)
+        current = [ReadOnlyCredentials("AKID1", "SECRET1", "TOKEN1")]
+        sessions = []
+
+        class RefreshableCredentials:
+            def get_frozen_credentials(self):
+                return current[0]
+
+        class Session:
+            def __init__(self):
+                sessions.append(self)
+
+            def get_credentials(self):
+                return RefreshableCredentials()
+
+        monkeypatch.setattr(url_signing.boto3, "Session", Session)
+        signer = UrlSigner(backend)
+        signer._cache[("uploads/ab/0.jpg", "inline")] = ("signed with TOKEN1", 0.0)
+
+        first = signer._s3_presigner()
+        assert signer._s3_presigner() is first
+        assert first.session_token == "TOKEN1"
+
+        current[0] = ReadOnlyCredentials("AKID2", "SECRET2", "TOKEN2")
+        second = signer._s3_presigner()
+
+        assert (second.access_key, second.secret_key, second.session_token) == ("AKID2", "SECRET2", "TOKEN2")
+        assert len(sessions) == 1
+        assert len(signer._cache) == 0
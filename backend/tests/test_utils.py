@@ -0,0 +1,223 @@
+"""
+Tests for image utilities in PhotoPro AI backend.
+Header parsing, pre-validation, perceptual hashing, and quality checks.
+"""
+
+import base64
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+from image_quality import assess_image_quality, quality_gate
+from image_headers import parse_image_header, needs_more_header, IMAGE_HEADER_BYTES
+from utils import (
+    validate_image_file, prevalidate_image_header,
+    compute_perceptual_hash, hamming_distance,
+    create_thumbnail_with_placeholder, read_exif_orientation
+)
+
+SIZES = [
+    (64, 64), (511, 800), (512, 512), (800, 511),
+    (1024, 768), (4096, 600), (4097, 600), (600, 5000),
+]
+
+FORMATS = [
+    ("JPEG", "photo.jpg", {}),
+    ("JPEG", "photo.jpeg", {"progressive": True}),
+    ("PNG", "photo.png", {}),
+    ("WEBP", "photo.webp", {"quality": 50}),
+    ("WEBP", "photo.webp", {"lossless": True}),
+]
+
+
+def make_image(image_format: str, size, mode: str = "RGB", **save_kwargs) -> bytes:
+    """Encode a small solid-colour image"""
+    image = Image.new(mode, size, color=120 if mode in ("L", "P") else (120, 90, 60, 255)[:len(mode)])
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **save_kwargs)
+    return buffer.getvalue()
+
+
+def build_corpus():
+    """Well-formed images across formats, modes and dimensions"""
+    corpus = []
+    for image_format, filename, save_kwargs in FORMATS:
+        for size in SIZES:
+            corpus.append((make_image(image_format, size, **save_kwargs), filename))
+
+    corpus.append((make_image("PNG", (700, 700), mode="RGBA"), "alpha.png"))
+    corpus.append((make_image("PNG", (700, 300), mode="P"), "palette.png"))
+    corpus.append((make_image("WEBP", (900, 900), mode="RGBA"), "alpha.webp"))
+
+    # Large EXIF block pushes the JPEG frame header past the first read
+    exif = Image.Exif()
+    exif[0x010E] = "x" * 30000
+    corpus.append((make_image("JPEG", (640, 480), exif=exif.tobytes()), "exif.jpg"))
+    corpus.append((make_image("JPEG", (2048, 2048), exif=exif.tobytes()), "exif.jpg"))
+    return corpus
+
+
+def sniff(content: bytes) -> bytes:
+    """Mimic read_image_header on an in-memory payload"""
+    header = content[:IMAGE_HEADER_BYTES]
+    while needs_more_header(header) and len(header) < len(content):
+        header = content[:len(header) + IMAGE_HEADER_BYTES]
+    return header
+
+
+class TestImageHeaders:
+    """Test header-only dimension parsing"""
+
+    @pytest.mark.parametrize("content,filename", build_corpus())
+    def test_matches_pil(self, content, filename):
+        """Header dimensions match what PIL reports"""
+        image = Image.open(io.BytesIO(content))
+        assert parse_image_header(sniff(content)) == (image.format, image.width, image.height)
+
+    def test_unknown_format(self):
+        """Unrecognised data is left to the full validator"""
+        assert parse_image_header(b"GIF89a" + b"\x00" * 32) is None
+        assert parse_image_header(b"") is None
+
+
+class TestPrevalidation:
+    """Test that the header pre-check agrees with validate_image_file"""
+
+    @pytest.mark.parametrize("content,filename", build_corpus())
+    def test_agrees_on_valid_corpus(self, content, filename):
+        """Same verdict and message as the full check for well-formed files"""
+        assert prevalidate_image_header(sniff(content), filename, len(content)) == \
+            validate_image_file(content, filename)
+
+    def test_rejects_bad_extension(self):
+        """Extension check happens before any parsing"""
+        content = make_image("PNG", (600, 600))
+        assert prevalidate_image_header(content[:64], "photo.gif") == \
+            validate_image_file(content, "photo.gif")
+
+    def test_fuzz_never_stricter(self):
+        """A mutated file rejected by the pre-check is also rejected in full"""
+        rng = random.Random(1234)
+        corpus = build_corpus()
+
+        for _ in range(1500):
+            content, filename = rng.choice(corpus)
+            mutated = bytearray(content)
+
+            mutation = rng.randrange(3)
+            if mutation == 0:
+                mutated = mutated[:rng.randrange(1, len(mutated))]
+            elif mutation == 1:
+                for _ in range(rng.randrange(1, 8)):
+                    mutated[rng.randrange(min(64, len(mutated)))] = rng.randrange(256)
+            else:
+                mutated[2:2] = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 32)))
+
+            mutated = bytes(mutated)
+            is_valid, _ = prevalidate_image_header(sniff(mutated), filename, len(mutated))
+            if not is_valid:
+                assert not validate_image_file(mutated, filename)[0]
+
+
+def make_photo(seed: int, size=(800, 800)) -> Image.Image:
+    """Smooth random image standing in for a photo"""
+    rng = random.Random(seed)
+    noise = Image.frombytes("RGB", (32, 32), bytes(rng.randrange(256) for _ in range(32 * 32 * 3)))
+    return noise.resize(size, Image.Resampling.BICUBIC)
+
+
+def encode(image: Image.Image, image_format: str = "JPEG", **save_kwargs) -> bytes:
+    """Encode an image to bytes"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **save_kwargs)
+    return buffer.getvalue()
+
+
+class TestPerceptualHash:
+    """Test near-duplicate fingerprints"""
+
+    def test_near_duplicates_are_close(self):
+        """Re-encodes, small crops and resizes stay within a few bits"""
+        photo = make_photo(1)
+        original = compute_perceptual_hash(encode(photo))
+
+        variants = [
+            encode(photo, quality=40),
+            encode(photo.crop((12, 12, 788, 788))),
+            encode(photo.resize((600, 600)), "PNG"),
+        ]
+        for variant in variants:
+            assert hamming_distance(original, compute_perceptual_hash(variant)) <= 6
+
+    def test_different_images_are_far(self):
+        """Unrelated images differ in many bits"""
+        first = compute_perceptual_hash(encode(make_photo(1)))
+        second = compute_perceptual_hash(encode(make_photo(2)))
+        assert hamming_distance(first, second) > 12
+
+    def test_hash_fits_64_bits(self):
+        """Hashes are unsigned 64-bit integers"""
+        assert 0 <= compute_perceptual_hash(encode(make_photo(3))) < 2 ** 64
+
+
+def make_scene(size=(1024, 1024)) -> Image.Image:
+    """Mid-grey image with plenty of hard edges"""
+    rng = random.Random(7)
+    image = Image.new("RGB", size, (128, 110, 100))
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(size[0] - 100), rng.randrange(size[1] - 100)
+        draw.rectangle([x, y, x + rng.randrange(20, 100), y + rng.randrange(20, 100)],
+                       outline=(rng.randrange(256),) * 3, width=3)
+    return image
+
+
+class TestQualityGate:
+    """Test the pre-flight quality checks"""
+
+    def test_sharp_well_exposed_passes(self):
+        """A sharp, evenly lit image raises no issues"""
+        report = assess_image_quality(encode(make_scene()))
+        assert quality_gate.find_issues(report) == []
+
+    def test_blurry_and_dark_flagged(self):
+        """Blur and underexposure are both reported"""
+        blurry = assess_image_quality(encode(make_scene().filter(ImageFilter.GaussianBlur(12))))
+        dark = assess_image_quality(encode(make_scene().point(lambda value: value // 6)))
+
+        assert "Image is too blurry" in quality_gate.find_issues(blurry)
+        assert "Image is too dark" in quality_gate.find_issues(dark)
+
+
+class TestPlaceholder:
+    """Test the inline gallery placeholder"""
+
+    def test_placeholder_is_tiny_webp(self):
+        """Placeholder decodes as a WebP of at most 16px and stays small"""
+        thumbnail, placeholder = create_thumbnail_with_placeholder(encode(make_scene()))
+
+        prefix, _, payload = placeholder.partition(",")
+        assert prefix == "data:image/webp;base64"
+        assert len(placeholder) < 400
+
+        image = Image.open(io.BytesIO(base64.b64decode(payload)))
+        assert image.format == "WEBP"
+        assert max(image.size) <= 16
+        assert Image.open(io.BytesIO(thumbnail)).format == "JPEG"
+
+
+class TestExifOrientation:
+    """Test reading the EXIF orientation recorded at ingest"""
+
+    def test_orientation_from_header_prefix(self):
+        """The tag is read from the header alone; missing or junk data gives 1"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        content = encode(Image.new("RGB", (640, 480)), exif=exif)
+
+        assert read_exif_orientation(content) == 6
+        assert read_exif_orientation(content[:IMAGE_HEADER_BYTES]) == 6
+        assert read_exif_orientation(encode(Image.new("RGB", (640, 480)))) == 1
+        assert read_exif_orientation(b"not an image") == 1
@@ -0,0 +1,163 @@
+"""
+Tests for the write-behind storage spool in PhotoPro AI backend.
+Spooling on failure or timeout, reads, backoff, recovery after restart, and
+deletes of objects that are still pending.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from config import settings
+from storage_backends import LocalBackend, StorageObjectNotFound
+from write_spool import JOURNAL_NAME, WriteSpool
+
+
+class FlakyBackend(LocalBackend):
+    """Local backend whose writes can be made to fail or stall"""
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+        self.delay = 0.0
+        self.attempts = 0
+
+    async def put_object(self, key, data, content_type, metadata=None, cache_control=None):
+        self.attempts += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.down:
+            raise ConnectionError("provider unavailable")
+        return await super().put_object(key, data, content_type, metadata, cache_control)
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(settings, "WRITE_SPOOL_ENABLED", True)
+    monkeypatch.setattr(settings, "WRITE_SPOOL_TIMEOUT", 0.05)
+    monkeypatch.setattr(settings, "WRITE_SPOOL_RETRY_SECONDS", 0.0)
+    return FlakyBackend()
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / "spool")
+
+
+def exists(backend, key):
+    async def read():
+        try:
+            return await backend.get(key)
+        except StorageObjectNotFound:
+            return None
+
+    return asyncio.run(read()) is not None
+
+
+class TestWriteSpool:
+    """Test write-through, spooling and flushing"""
+
+    def test_healthy_provider_writes_through(self, backend, root):
+        spool = WriteSpool(backend, root)
+
+        stored = asyncio.run(spool.put_object("uploads/1/a.jpg", b"data", "image/jpeg"))
+
+        assert stored["etag"] is not None
+        assert spool.pending == {}
+        assert exists(backend, "uploads/1/a.jpg")
+
+    def test_failed_write_is_spooled_readable_and_flushed(self, backend, root):
+        backend.down = True
+        spool = WriteSpool(backend, root)
+
+        stored = asyncio.run(spool.put_object("uploads/1/a.jpg", b"data", "image/jpeg"))
+
+        assert stored == {"url": backend.url("uploads/1/a.jpg"), "etag": None}
+        assert spool.is_pending("uploads/1/a.jpg")
+        assert asyncio.run(spool.read_url(stored["url"])) == b"data"
+        assert not exists(backend, "uploads/1/a.jpg")
+
+        backend.down = False
+        assert asyncio.run(spool.flush()) == 1
+        assert spool.pending == {}
+        assert exists(backend, "uploads/1/a.jpg")
+        assert asyncio.run(spool.read("uploads/1/a.jpg")) is None
+        assert os.listdir(root) == [JOURNAL_NAME]
+
+    def test_slow_write_is_spooled(self, backend, root):
+        backend.delay = 0.2
+        spool = WriteSpool(backend, root)
+
+        stored = asyncio.run(spool.put_object("uploads/1/a.jpg", b"data", "image/jpeg"))
+
+        assert stored["etag"] is None
+        assert spool.get_stats()["spooled"] == 1
+
+    def test_writes_skip_provider_while_down(self, backend, root, monkeypatch):
+        monkeypatch.setattr(settings, "WRITE_SPOOL_RETRY_SECONDS", 60.0)
+        backend.down = True
+        spool = WriteSpool(backend, root)
+
+        async def run():
+            await spool.put_object("uploads/1/a.jpg", b"a", "image/jpeg")
+            await spool.put_object("uploads/1/b.jpg", b"b", "image/jpeg")
+
+        asyncio.run(run())
+
+        assert backend.attempts == 1
+        assert len(spool.pending) == 2
+        assert spool.get_stats()["provider_down"]
+
+    def test_failed_flush_backs_off(self, backend, root, monkeypatch):
+        backend.down = True
+        spool = WriteSpool(backend, root)
+        asyncio.run(spool.put_object("uploads/1/a.jpg", b"data", "image/jpeg"))
+        monkeypatch.setattr(settings, "WRITE_SPOOL_RETRY_SECONDS", 60.0)
+
+        assert asyncio.run(spool.flush()) == 0
+        attempts = backend.attempts
+        assert asyncio.run(spool.flush()) == 0
+
+        assert backend.attempts == attempts
+        assert spool.pending["uploads/1/a.jpg"].attempts == 1
+
+    def test_write_deleted_during_flush_is_removed(self, backend, root):
+        backend.down = True
+        spool = WriteSpool(backend, root)
+        asyncio.run(spool.put_object("uploads/1/a.jpg", b"data", "image/jpeg"))
+        backend.down = False
+        backend.delay = 0.05
+
+        async def delete_while_flushing():
+            flush = asyncio.ensure_future(spool.flush())
+            await asyncio.sleep(0.01)
+            assert await spool.discard("uploads/1/a.jpg")
+            await backend.delete("uploads/1/a.jpg")
+            return await flush
+
+        assert asyncio.run(delete_while_flushing()) == 1
+        assert not exists(backend, "uploads/1/a.jpg")
+        assert spool.pending == {}
+        restarted = WriteSpool(backend, root)
+        assert asyncio.run(restarted.flush()) == 0
+        assert restarted.pending == {}
+
+    def test_pending_writes_survive_restart(self, backend, root):
+        backend.down = True
+        asyncio.run(WriteSpool(backend, root).put_object(
+            "thumbnails/ab/c.jpg", b"thumb", "image/jpeg", cache_control="public, max-age=60"
+        ))
+        # A torn line from a crash mid-append is skipped
+        with open(os.path.join(root, JOURNAL_NAME), "a") as journal:
+            journal.write('{"op": "pu')
+
+        backend.down = False
+        restarted = WriteSpool(backend, root)
+
+        assert asyncio.run(restarted.flush()) == 1
+        assert asyncio.run(backend.get("thumbnails/ab/c.jpg")) == b"thumb"
+        fresh = WriteSpool(backend, root)
+        assert asyncio.run(fresh.flush()) == 0
+        assert fresh.pending == {}
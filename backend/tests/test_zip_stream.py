@@ -0,0 +1,71 @@
+"""
+Tests for streaming ZIP archives in PhotoPro AI backend.
+Completion order, bounded concurrency, and failed downloads.
+"""
+
+import asyncio
+import io
+import zipfile
+from datetime import datetime
+
+import zip_stream
+from zip_stream import ZipSource, stream_zip
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+
+
+def collect(sources, fetch, monkeypatch, concurrency=2):
+    monkeypatch.setattr(zip_stream.http_client, "fetch_bytes", fetch)
+
+    async def run():
+        return [chunk async for chunk in stream_zip(sources, concurrency)]
+
+    return asyncio.run(run())
+
+
+def sources(count):
+    return [ZipSource(f"photo_{i}", f"https://cdn/{i}", datetime(2024, 1, 1)) for i in range(count)]
+
+
+class TestStreamZip:
+    """Test on-the-fly archive construction"""
+
+    def test_entries_in_completion_order_and_stored(self, monkeypatch):
+        async def fetch(url, max_bytes=None):
+            index = int(url.rsplit("/", 1)[1])
+            await asyncio.sleep(0.02 if index == 0 else 0)
+            return JPEG
+
+        chunks = collect(sources(2), fetch, monkeypatch)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+        assert [info.filename for info in archive.infolist()] == ["photo_1.jpg", "photo_0.jpg"]
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+        assert archive.testzip() is None
+        # One chunk per entry plus the central directory
+        assert len(chunks) == 3
+
+    def test_concurrency_is_bounded(self, monkeypatch):
+        in_flight = []
+        peak = []
+
+        async def fetch(url, max_bytes=None):
+            in_flight.append(url)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(url)
+            return JPEG
+
+        collect(sources(8), fetch, monkeypatch, concurrency=3)
+        assert max(peak) == 3
+
+    def test_failed_downloads_listed(self, monkeypatch):
+        async def fetch(url, max_bytes=None):
+            if url.endswith("/1"):
+                raise RuntimeError("expired")
+            return JPEG
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(collect(sources(3), fetch, monkeypatch))))
+
+        assert "photo_1.jpg" not in archive.namelist()
+        assert archive.read("MISSING.txt") == b"photo_1: expired\n"
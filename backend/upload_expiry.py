@@ -0,0 +1,179 @@
+"""
+Retention of raw uploads for PhotoPro AI.
+Originals are kept for their owner's plan's UPLOAD_RETENTION_DAYS unless
+pinned. A periodic pass marks expired Upload rows, drops their references
+to shared content-addressed objects and deletes the rest in bulk.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from bulk_deletion import bulk_deleter
+from config import settings
+from database import SessionLocal
+from models import StoredObject, Upload, User
+
+# Upload rows expired per transaction
+EXPIRY_BATCH_SIZE = 500
+
+
+def retention_days(plan: str) -> Optional[int]:
+    """Days a plan keeps uploads, or None to keep them forever"""
+    days = settings.UPLOAD_RETENTION_DAYS.get(plan, 0)
+    return days or None
+
+
+class UploadExpiry:
+    """Removes uploads past their plan's retention"""
+
+    def __init__(self):
+        self.runs = 0
+        self.uploads_expired = 0
+        self.bytes_expired = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+
+    def _expire_batch(self, db: Session, plan: str, cutoff: datetime, now: datetime) -> List[Upload]:
+        """Mark one batch of a plan's expired uploads and release their objects"""
+        uploads = db.query(Upload).join(User, User.id == Upload.user_id).filter(
+            User.plan == plan,
+            Upload.pinned == False,
+            Upload.expired_at.is_(None),
+            Upload.created_at < cutoff
+        ).order_by(Upload.id).limit(EXPIRY_BATCH_SIZE).with_for_update(skip_locked=True, of=Upload).all()
+        if not uploads:
+            return []
+
+        # Committed with the releases and the deletion job (in create_job),
+        # so concurrent passes skip these rows once the locks are released
+        for upload in uploads:
+            upload.expired_at = now
+        db.flush()
+        return uploads
+
+    def _unreferenced(self, db: Session, keys: List[str]) -> List[str]:
+        """Keys no live upload points at; several uploads can share a direct-upload key"""
+        if not keys:
+            return keys
+        live = {
+            key for (key,) in db.query(Upload.key).filter(
+                Upload.key.in_(keys),
+                Upload.expired_at.is_(None)
+            )
+        }
+        return [key for key in keys if key not in live]
+
+    async def expire(self, db: Session) -> Dict[str, Any]:
+        """
+        Expire every unpinned upload older than its plan's retention
+
+        Shared content-addressed objects lose one reference (garbage
+        collection removes them once unreferenced); direct-upload objects no
+        live upload still uses are deleted through bulk deletion jobs.
+
+        Returns:
+            Dict with 'expired', 'bytes', 'released' and 'jobs'
+        """
+        async with self._lock:
+            now = datetime.utcnow()
+            expired = 0
+            expired_bytes = 0
+            released = 0
+            jobs = []
+
+            for plan in settings.UPLOAD_RETENTION_DAYS:
+                days = retention_days(plan)
+                if days is None:
+                    continue
+                cutoff = now - timedelta(days=days)
+                while True:
+                    uploads = self._expire_batch(db, plan, cutoff, now)
+                    if not uploads:
+                        break
+                    keys, batch_released = bulk_deleter.collect(db, [upload.url for upload in uploads])
+                    keys = self._unreferenced(db, keys)
+                    job = bulk_deleter.create_job(db, keys, "upload_expiry", released=batch_released)
+                    await bulk_deleter.run(job.id)
+
+                    expired += len(uploads)
+                    expired_bytes += sum(upload.size for upload in uploads)
+                    released += batch_released
+                    jobs.append(job.id)
+
+            self.runs += 1
+            self.uploads_expired += expired
+            self.bytes_expired += expired_bytes
+            self.last_run = {
+                "expired": expired,
+                "bytes": expired_bytes,
+                "released": released,
+                "jobs": jobs,
+                "started_at": now.isoformat(),
+                "seconds": round((datetime.utcnow() - now).total_seconds(), 2)
+            }
+            return self.last_run
+
+    async def run_periodically(self):
+        """Expire uploads every UPLOAD_EXPIRY_INTERVAL_HOURS"""
+        if not settings.UPLOAD_EXPIRY_INTERVAL_HOURS:
+            return
+        while True:
+            db = SessionLocal()
+            try:
+                await self.expire(db)
+            except Exception as e:
+                db.rollback()
+                print(f"Upload expiry failed: {e}")
+            finally:
+                db.close()
+            await asyncio.sleep(settings.UPLOAD_EXPIRY_INTERVAL_HOURS * 3600)
+
+    def storage_growth(self, db: Session, days: int = 30) -> Dict[str, Any]:
+        """
+        Upload storage and its daily growth over the last `days` days
+
+        Bytes are as recorded on Upload rows; identical uploads share one
+        object, so the catalog total is reported separately.
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+        live = db.query(func.count(Upload.id), func.coalesce(func.sum(Upload.size), 0)).filter(
+            Upload.expired_at.is_(None)
+        ).one()
+        pinned = db.query(func.count(Upload.id)).filter(
+            Upload.expired_at.is_(None),
+            Upload.pinned == True
+        ).scalar()
+        added = db.query(func.coalesce(func.sum(Upload.size), 0)).filter(Upload.created_at >= since).scalar()
+        expired = db.query(func.coalesce(func.sum(Upload.size), 0)).filter(Upload.expired_at >= since).scalar()
+        catalogued = db.query(func.coalesce(func.sum(StoredObject.size), 0)).filter(
+            StoredObject.ref_count > 0
+        ).scalar()
+
+        return {
+            "uploads": live[0],
+            "upload_bytes": int(live[1]),
+            "pinned_uploads": pinned,
+            "catalog_bytes": int(catalogued),
+            "period_days": days,
+            "added_bytes_per_day": round(added / days),
+            "expired_bytes_per_day": round(expired / days),
+            "net_bytes_per_day": round((added - expired) / days),
+            "retention_days": {plan: retention_days(plan) for plan in settings.UPLOAD_RETENTION_DAYS}
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get upload expiry statistics"""
+        return {
+            "runs": self.runs,
+            "uploads_expired": self.uploads_expired,
+            "bytes_expired": self.bytes_expired,
+            "last_run": self.last_run
+        }
+
+
+# Global upload expiry
+upload_expiry = UploadExpiry()
@@ -0,0 +1,252 @@
+"""
+Signed read URLs for PhotoPro AI.
+When the bucket is private (STORAGE_PRIVATE), list endpoints hand out
+presigned URLs instead of public ones. Signing is done in bulk with SigV4
+signing keys derived once per day, and each signature is memoized per
+(key, variant) until shortly before it expires.
+"""
+
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import boto3
+
+from config import settings
+from storage_backends import CloudinaryBackend, LocalBackend, S3Backend, sign_local_key, storage_backend
+
+# Extra response overrides signed into the URL for each variant
+SIGNED_URL_VARIANTS: Dict[str, Dict[str, str]] = {
+    "inline": {},
+    "download": {"response-content-disposition": "attachment"},
+}
+
+# URL fields of the response models that list stored objects
+PHOTO_URL_FIELDS = ("original_url", "processed_url", "thumbnail_url")
+UPLOAD_URL_FIELDS = ("url",)
+
+
+def _encode(value: str) -> str:
+    """AWS URI encoding: everything but unreserved characters"""
+    return quote(value, safe="-_.~")
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class SigV4Presigner:
+    """
+    S3 query-string (SigV4) presigner
+
+    Equivalent to botocore's presigning for GET, but the date-scoped signing
+    key is derived once and the per-URL work is two SHA-256 passes.
+    """
+
+    def __init__(self, access_key: str, secret_key: str, session_token: Optional[str], region: str):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.region = region
+        self._signing_key: Tuple[str, bytes] = ("", b"")
+
+    def signing_key(self, date_stamp: str) -> bytes:
+        """HMAC key for one day's credential scope, derived once per day"""
+        if self._signing_key[0] != date_stamp:
+            key = _hmac(("AWS4" + self.secret_key).encode(), date_stamp)
+            for part in (self.region, "s3", "aws4_request"):
+                key = _hmac(key, part)
+            self._signing_key = (date_stamp, key)
+        return self._signing_key[1]
+
+    def presign_many(
+        self,
+        urls: Sequence[str],
+        signed_at: int,
+        expires_in: int,
+        extra_params: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """
+        Presign GET requests for object URLs in one pass
+
+        Args:
+            urls: Unsigned object URLs (path- or virtual-host-style)
+            signed_at: Unix time the signatures are dated
+            expires_in: Seconds each signature stays valid from signed_at
+            extra_params: Response overrides to sign into every URL
+        """
+        moment = datetime.utcfromtimestamp(signed_at)
+        amz_date = moment.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = moment.strftime("%Y%m%d")
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        signing_key = self.signing_key(date_stamp)
+
+        params = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires_in),
+            "X-Amz-SignedHeaders": "host",
+        }
+        if self.session_token:
+            params["X-Amz-Security-Token"] = self.session_token
+        params.update(extra_params or {})
+        query = "&".join(f"{_encode(name)}={_encode(value)}" for name, value in sorted(params.items()))
+        string_to_sign_prefix = f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n"
+
+        signed = []
+        for url in urls:
+            # Object URLs are absolute and already path-encoded; slicing is
+            # much cheaper than urlsplit at this volume
+            path_start = url.index("/", url.index("://") + 3)
+            host, path = url[url.index("://") + 3:path_start], url[path_start:]
+            canonical_request = f"GET\n{path}\n{query}\nhost:{host}\n\nhost\nUNSIGNED-PAYLOAD"
+            string_to_sign = string_to_sign_prefix + hashlib.sha256(canonical_request.encode()).hexdigest()
+            signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+            signed.append(f"{url}?{query}&X-Amz-Signature={signature}")
+        return signed
+
+
+class UrlSigner:
+    """
+    Memoized bulk signer for the configured storage backend
+
+    Signatures are dated to the start of a SIGNED_URL_REFRESH_MARGIN window,
+    so every worker hands out the same URL for a key within a window and
+    browsers can keep serving it from cache.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.urls_signed = 0
+        self.cache_hits = 0
+        self.passthrough = 0
+        self.signing_seconds = 0.0
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._presigner: Optional[SigV4Presigner] = None
+        # botocore credentials from the default chain; role and instance
+        # credentials refresh themselves before they expire
+        self._credentials = None
+
+    def _s3_presigner(self) -> SigV4Presigner:
+        if settings.AWS_ACCESS_KEY_ID:
+            frozen = (settings.AWS_ACCESS_KEY_ID, settings.AWS_SECRET_ACCESS_KEY, None)
+        else:
+            if self._credentials is None:
+                self._credentials = boto3.Session().get_credentials()
+            # Freezing refreshes credentials that are about to expire
+            credentials = self._credentials.get_frozen_credentials()
+            frozen = (credentials.access_key, credentials.secret_key, credentials.token)
+
+        presigner = self._presigner
+        if presigner is None or (presigner.access_key, presigner.secret_key, presigner.session_token) != frozen:
+            if presigner is not None:
+                # URLs signed with the old session token stop working with it
+                self._cache.clear()
+            self._presigner = SigV4Presigner(*frozen, settings.AWS_REGION)
+        return self._presigner
+
+    def _sign(self, keys: List[str], urls: List[str], variant: str, signed_at: int, expires_in: int) -> List[str]:
+        extra_params = SIGNED_URL_VARIANTS[variant]
+
+        if isinstance(self.backend, S3Backend):
+            return self._s3_presigner().presign_many(urls, signed_at, expires_in, extra_params)
+
+        if isinstance(self.backend, LocalBackend):
+            expires = signed_at + expires_in
+            return [
+                f"{url}?expires={expires}&signature={sign_local_key(key, expires)}"
+                for key, url in zip(keys, urls)
+            ]
+
+        if isinstance(self.backend, CloudinaryBackend):
+            return [self.backend.private_url(key, signed_at + expires_in, variant == "download") for key in keys]
+
+        return urls
+
+    def sign_urls(self, urls: Sequence[Optional[str]], variant: str = "inline") -> List[Optional[str]]:
+        """
+        Signed equivalents of stored object URLs
+
+        URLs that do not point into the storage backend (e.g. a model
+        provider's output URL) are returned unchanged, as are all URLs when
+        the bucket is public.
+        """
+        if not settings.STORAGE_PRIVATE:
+            return list(urls)
+
+        started = time.perf_counter()
+        now = time.time()
+        margin = settings.SIGNED_URL_REFRESH_MARGIN
+        signed_at = int(now - now % margin)
+        expires_in = settings.SIGNED_URL_EXPIRES + margin
+
+        results: List[Optional[str]] = list(urls)
+        misses: Dict[str, List[int]] = {}
+        for index, url in enumerate(urls):
+            key = self.backend.key_for_url(url) if url else None
+            if key is None:
+                self.passthrough += 1
+                continue
+            cached = self._cache.get((key, variant))
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end((key, variant))
+                results[index] = cached[0]
+                self.cache_hits += 1
+            else:
+                misses.setdefault(key, []).append(index)
+
+        if misses:
+            keys = list(misses)
+            unsigned = [urls[misses[key][0]] for key in keys]
+            valid_until = signed_at + expires_in - margin
+            for key, signed_url in zip(keys, self._sign(keys, unsigned, variant, signed_at, expires_in)):
+                self._cache[(key, variant)] = (signed_url, valid_until)
+                self._cache.move_to_end((key, variant))
+                for index in misses[key]:
+                    results[index] = signed_url
+            self.urls_signed += len(keys)
+            while len(self._cache) > settings.SIGNED_URL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+        self.signing_seconds += time.perf_counter() - started
+        return results
+
+    def sign_models(self, items: Sequence[Any], response_model: Any, fields: Sequence[str],
+                    variant: str = "inline") -> List[Any]:
+        """
+        Response models for ORM rows with their URL fields signed in one batch
+
+        Rows are returned as-is when the bucket is public.
+        """
+        if not settings.STORAGE_PRIVATE:
+            return list(items)
+
+        responses = [response_model.model_validate(item) for item in items]
+        urls = [getattr(response, field) for response in responses for field in fields]
+        signed = iter(self.sign_urls(urls, variant))
+        for response in responses:
+            for field in fields:
+                setattr(response, field, next(signed))
+        return responses
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get URL signing statistics"""
+        lookups = self.urls_signed + self.cache_hits
+        return {
+            "private": settings.STORAGE_PRIVATE,
+            "urls_signed": self.urls_signed,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0,
+            "passthrough": self.passthrough,
+            "cached": len(self._cache),
+            "signing_ms": round(self.signing_seconds * 1000, 2)
+        }
+
+
+# Global URL signer
+url_signer = UrlSigner(storage_backend)
@@ -5,12 +5,29 @@ Image processing, validation, and helper functions.
 
 import os
 import uuid
+import base64
 import hashlib
 from typing import Optional, Tuple
 from PIL import Image, ImageOps
+import numpy as np
 import io
-import requests
-from fastapi import HTTPException
+from fastapi import HTTPException, UploadFile
+
+from image_headers import IMAGE_HEADER_BYTES, parse_image_header, needs_more_header
+from image_budget import open_image, run_decode
+from http_client import http_client
+
+# Upload validation rules shared by the header pre-check and the full check
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+ALLOWED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+MIN_IMAGE_DIMENSION = 512
+MAX_IMAGE_DIMENSION = 4096
+
+# Inline gallery placeholder: longest side in pixels and WebP quality
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+EXIF_ORIENTATION_TAG = 0x0112
 
 
 def generate_unique_filename(original_filename: str) -> str:
@@ -27,29 +44,20 @@ def validate_image_file(file_content: bytes, filename: str) -> Tuple[bool, str]:
     """
     try:
         # Check file size (max 10MB)
-        if len(file_content) > 10 * 1024 * 1024:
+        if len(file_content) > MAX_UPLOAD_BYTES:
             return False, "File size must be less than 10MB"
         
         # Check file extension
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
         file_ext = os.path.splitext(filename.lower())[1]
-        if file_ext not in allowed_extensions:
+        if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
             return False, "File must be JPG, PNG, or WEBP format"
         
         # Validate image with PIL
         try:
-            image = Image.open(io.BytesIO(file_content))
+            image = open_image(file_content)
             width, height = image.size
             
-            # Check dimensions
-            if width < 512 or height < 512:
-                return False, "Image must be at least 512x512 pixels"
-            
-            # Check if image is too large
-            if width > 4096 or height > 4096:
-                return False, "Image dimensions too large (max 4096x4096)"
-            
-            return True, ""
+            return _check_image_dimensions(width, height)
             
         except Exception as e:
             return False, f"Invalid image file: {str(e)}"
@@ -58,12 +66,79 @@ def validate_image_file(file_content: bytes, filename: str) -> Tuple[bool, str]:
         return False, f"File validation error: {str(e)}"
 
 
+def _check_image_dimensions(width: int, height: int) -> Tuple[bool, str]:
+    """Apply the upload dimension limits"""
+    if width < MIN_IMAGE_DIMENSION or height < MIN_IMAGE_DIMENSION:
+        return False, "Image must be at least 512x512 pixels"
+    
+    # Check if image is too large
+    if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+        return False, "Image dimensions too large (max 4096x4096)"
+    
+    return True, ""
+
+
+def prevalidate_image_header(
+    header: bytes,
+    filename: str,
+    file_size: Optional[int] = None
+) -> Tuple[bool, str]:
+    """
+    Cheap pre-check run on the first bytes of an upload, before the rest of
+    the body is read or anything is decoded.
+    
+    Only rejects what validate_image_file would also reject; a header that
+    cannot be parsed is passed through to the full check.
+    Returns (is_valid, error_message)
+    """
+    if file_size is not None and file_size > MAX_UPLOAD_BYTES:
+        return False, "File size must be less than 10MB"
+    
+    file_ext = os.path.splitext(filename.lower())[1]
+    if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
+        return False, "File must be JPG, PNG, or WEBP format"
+    
+    parsed = parse_image_header(header)
+    if parsed is None:
+        return True, ""
+    
+    _, width, height = parsed
+    return _check_image_dimensions(width, height)
+
+
+async def read_image_header(file: UploadFile) -> bytes:
+    """Read just enough of an upload to locate the image dimensions"""
+    header = await file.read(IMAGE_HEADER_BYTES)
+    
+    while needs_more_header(header):
+        chunk = await file.read(IMAGE_HEADER_BYTES)
+        if not chunk:
+            break
+        header += chunk
+    
+    return header
+
+
+def read_exif_orientation(image_content: bytes) -> int:
+    """
+    EXIF Orientation tag (1-8) of an image, or 1 if it has none
+    
+    Only the header is parsed, so a truncated prefix that includes the EXIF
+    segment is enough.
+    """
+    try:
+        orientation = Image.open(io.BytesIO(image_content)).getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in range(1, 9) else 1
+
+
 def optimize_image_for_upload(image_content: bytes, max_size: int = 2048) -> bytes:
     """
     Optimize image for upload by resizing if necessary
     """
     try:
-        image = Image.open(io.BytesIO(image_content))
+        image = open_image(image_content)
         
         # Convert to RGB if necessary
         if image.mode in ('RGBA', 'LA', 'P'):
@@ -83,25 +158,70 @@ def optimize_image_for_upload(image_content: bytes, max_size: int = 2048) -> byt
         return image_content
 
 
-def generate_thumbnail(image_url: str, size: Tuple[int, int] = (300, 300)) -> Optional[str]:
+def _thumbnail_image(image_content: bytes, size: Tuple[int, int]) -> Image.Image:
+    """Decode and shrink an image to fit within size, in a JPEG-safe mode"""
+    image = open_image(image_content)
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    
+    # JPEG has no alpha channel
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+
+def create_thumbnail(image_content: bytes, size: Tuple[int, int] = (300, 300)) -> bytes:
+    """
+    Create a JPEG thumbnail from image bytes
+    """
+    image = _thumbnail_image(image_content, size)
+    
+    # Convert to bytes
+    thumbnail_buffer = io.BytesIO()
+    image.save(thumbnail_buffer, format='JPEG', quality=85)
+    return thumbnail_buffer.getvalue()
+
+
+def create_placeholder(image: Image.Image) -> str:
+    """
+    Encode a tiny WebP data URI to show while the real thumbnail loads
+    
+    The browser upscales it into a soft blur; typically 100-250 bytes.
+    """
+    tiny = image.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+    
+    buffer = io.BytesIO()
+    tiny.save(buffer, format='WEBP', quality=PLACEHOLDER_QUALITY, method=6)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def create_thumbnail_with_placeholder(
+    image_content: bytes,
+    size: Tuple[int, int] = (300, 300)
+) -> Tuple[bytes, str]:
+    """
+    Create a JPEG thumbnail and its inline placeholder from a single decode
+    
+    Returns:
+        (thumbnail JPEG bytes, placeholder data URI)
+    """
+    image = _thumbnail_image(image_content, size)
+    
+    thumbnail_buffer = io.BytesIO()
+    image.save(thumbnail_buffer, format='JPEG', quality=85)
+    return thumbnail_buffer.getvalue(), create_placeholder(image)
+
+
+async def generate_thumbnail(image_url: str, size: Tuple[int, int] = (300, 300)) -> Optional[bytes]:
     """
     Generate thumbnail from image URL
     """
     try:
-        # Download image
-        response = requests.get(image_url, timeout=30)
-        response.raise_for_status()
+        # Download image over the shared connection pool
+        image_content = await http_client.fetch_bytes(image_url)
         
-        # Create thumbnail
-        image = Image.open(io.BytesIO(response.content))
-        image.thumbnail(size, Image.Resampling.LANCZOS)
-        
-        # Convert to bytes
-        thumbnail_buffer = io.BytesIO()
-        image.save(thumbnail_buffer, format='JPEG', quality=85)
-        thumbnail_buffer.seek(0)
-        
-        return thumbnail_buffer.getvalue()
+        # Create thumbnail within the decoded-pixel budget
+        return await run_decode(image_content, create_thumbnail, size)
         
     except Exception as e:
         print(f"Thumbnail generation failed: {str(e)}")
@@ -113,6 +233,29 @@ def calculate_file_hash(file_content: bytes) -> str:
     return hashlib.sha256(file_content).hexdigest()
 
 
+def compute_perceptual_hash(image_content: bytes, hash_size: int = 8) -> int:
+    """
+    Compute a 64-bit difference hash (dHash) of an image.
+    Near-identical images (re-encodes, small crops, resizes) differ in only
+    a few bits, so Hamming distance measures visual similarity.
+    """
+    image = open_image(image_content)
+    
+    # Let the JPEG decoder downscale during decode instead of afterwards
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    image = ImageOps.exif_transpose(image).convert('L')
+    image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    """Number of differing bits between two perceptual hashes"""
+    return (hash_a ^ hash_b).bit_count()
+
+
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format"""
     if size_bytes == 0:
@@ -0,0 +1,353 @@
+"""
+Write-behind spool for storage writes in PhotoPro AI.
+When the provider is slow or down, objects are written to local disk and
+recorded in a journal, the request is acknowledged with the object's URL,
+and a background task flushes them to the provider with retries and
+backoff. Until then, reads of those keys are served from the spool.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+from storage_backends import storage_backend
+
+JOURNAL_NAME = "journal.jsonl"
+
+
+class SpooledWrite:
+    """One object waiting to be flushed to the provider"""
+
+    def __init__(self, key: str, content_type: str, metadata: Optional[Dict[str, str]],
+                 cache_control: Optional[str], size: int, spooled_at: float):
+        self.key = key
+        self.content_type = content_type
+        self.metadata = metadata
+        self.cache_control = cache_control
+        self.size = size
+        self.spooled_at = spooled_at
+        self.attempts = 0
+        self.next_attempt = 0.0
+        self.last_error: Optional[str] = None
+        # Set when the object is deleted before it was flushed
+        self.discarded = False
+
+    @property
+    def file_name(self) -> str:
+        # Keys may nest and contain any character; spool files stay flat
+        return hashlib.sha256(self.key.encode()).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "op": "put",
+            "key": self.key,
+            "content_type": self.content_type,
+            "metadata": self.metadata,
+            "cache_control": self.cache_control,
+            "size": self.size,
+            "spooled_at": self.spooled_at
+        }
+
+
+class WriteSpool:
+    """
+    Puts objects through to a storage backend, spooling them when it fails
+
+    Spooled data lives in '<root>/<sha256 of key>' and each spool or flush
+    is appended to '<root>/journal.jsonl' (fsynced), so pending writes
+    survive a restart and are flushed by the next process.
+    """
+
+    def __init__(self, backend, root: str):
+        self.backend = backend
+        self.root = root
+        self.pending: Dict[str, SpooledWrite] = {}
+        self.direct_writes = 0
+        self.spooled = 0
+        self.flushed = 0
+        self.flush_failures = 0
+        self.spool_reads = 0
+        self.discarded = 0
+        # The provider is treated as down, and writes go straight to the
+        # spool, until this time (after a failed write or flush)
+        self._down_until = 0.0
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+
+    # Spool files --------------------------------------------------------
+
+    def _journal_path(self) -> str:
+        return os.path.join(self.root, JOURNAL_NAME)
+
+    def _data_path(self, write: SpooledWrite) -> str:
+        return os.path.join(self.root, write.file_name)
+
+    def _append(self, record: Dict[str, Any]):
+        """Append a journal record and fsync it (run off the event loop)"""
+        with self._journal_lock:
+            with open(self._journal_path(), "a") as journal:
+                journal.write(json.dumps(record) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def _load(self):
+        """Pick up writes spooled before a restart and compact the journal"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            pending: Dict[str, SpooledWrite] = {}
+            if os.path.exists(self._journal_path()):
+                with open(self._journal_path()) as journal:
+                    for line in journal:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Torn last line from a crash mid-append
+                        if record["op"] == "put":
+                            write = SpooledWrite(
+                                record["key"], record["content_type"], record.get("metadata"),
+                                record.get("cache_control"), record["size"], record["spooled_at"]
+                            )
+                            pending[write.key] = write
+                        elif record["op"] == "done":
+                            pending.pop(record["key"], None)
+
+            # Only writes whose data reached disk can be flushed
+            pending = {
+                key: write for key, write in pending.items()
+                if os.path.exists(self._data_path(write))
+            }
+            temp_path = self._journal_path() + ".tmp"
+            with open(temp_path, "w") as journal:
+                for write in pending.values():
+                    journal.write(json.dumps(write.to_dict()) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(temp_path, self._journal_path())
+
+            self.pending = pending
+            self._loaded = True
+
+    def _write_data(self, write: SpooledWrite, data: bytes):
+        """Durably write an object's bytes, then journal it (run off the event loop)"""
+        path = self._data_path(write)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as spool_file:
+            spool_file.write(data)
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+        os.replace(temp_path, path)
+        self._append(write.to_dict())
+
+    def _read_data(self, write: SpooledWrite) -> Optional[bytes]:
+        try:
+            with open(self._data_path(write), "rb") as spool_file:
+                return spool_file.read()
+        except FileNotFoundError:
+            return None  # Flushed and removed meanwhile
+
+    def _finish(self, write: SpooledWrite):
+        """Journal a flushed write and drop its data (run off the event loop)"""
+        self._append({"op": "done", "key": write.key})
+        try:
+            os.remove(self._data_path(write))
+        except FileNotFoundError:
+            pass
+
+    # Writes -------------------------------------------------------------
+
+    async def _spool(self, key: str, data: bytes, content_type: str,
+                     metadata: Optional[Dict[str, str]], cache_control: Optional[str]) -> Dict[str, Optional[str]]:
+        await asyncio.to_thread(self._load)
+        write = SpooledWrite(key, content_type, metadata, cache_control, len(data), time.time())
+        await asyncio.to_thread(self._write_data, write, data)
+        self.pending[key] = write
+        self.spooled += 1
+        if self._wake is not None:
+            self._wake.set()
+        # The URL is deterministic; the ETag is only known once flushed
+        return {"url": self.backend.url(key), "etag": None}
+
+    async def put_object(
+        self,
+        key: str,
+        data: bytes,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None,
+        cache_control: Optional[str] = None
+    ) -> Dict[str, Optional[str]]:
+        """
+        Store an object, spooling it if the provider fails or is slow
+
+        The provider gets WRITE_SPOOL_TIMEOUT seconds; a write still running
+        after that may land on its own, and the spooled copy is then flushed
+        over it with the same bytes.
+
+        Returns:
+            Dict with the public 'url' and the backend's 'etag' (None if spooled)
+        """
+        if not settings.WRITE_SPOOL_ENABLED:
+            return await self.backend.put_object(key, data, content_type, metadata, cache_control)
+
+        if time.monotonic() < self._down_until:
+            return await self._spool(key, data, content_type, metadata, cache_control)
+
+        write = asyncio.ensure_future(self.backend.put_object(key, data, content_type, metadata, cache_control))
+        try:
+            stored = await asyncio.wait_for(asyncio.shield(write), settings.WRITE_SPOOL_TIMEOUT)
+        except Exception as e:
+            if not write.done():
+                # Retrieve the abandoned write's outcome so it is never unhandled
+                write.add_done_callback(lambda task: task.cancelled() or task.exception())
+            print(f"Storage write of {key} spooled: {str(e) or type(e).__name__}")
+            self._down_until = time.monotonic() + settings.WRITE_SPOOL_RETRY_SECONDS
+            return await self._spool(key, data, content_type, metadata, cache_control)
+
+        self.direct_writes += 1
+        return stored
+
+    async def discard(self, key: str) -> bool:
+        """
+        Drop a pending write because its object is being deleted
+
+        Otherwise a later flush would put the deleted object back. Call it
+        before deleting the key from the provider.
+
+        Returns:
+            True if the key had a pending write
+        """
+        if not self._loaded:
+            await asyncio.to_thread(self._load)
+        write = self.pending.pop(key, None)
+        if write is None:
+            return False
+        write.discarded = True
+        await asyncio.to_thread(self._finish, write)
+        self.discarded += 1
+        return True
+
+    # Reads --------------------------------------------------------------
+
+    def is_pending(self, key: Optional[str]) -> bool:
+        """Whether a key's object is still only in the spool"""
+        return key is not None and key in self.pending
+
+    async def read(self, key: Optional[str]) -> Optional[bytes]:
+        """Bytes of a spooled object, or None if it is not (or no longer) spooled"""
+        write = self.pending.get(key) if key else None
+        if write is None:
+            return None
+        data = await asyncio.to_thread(self._read_data, write)
+        if data is not None:
+            self.spool_reads += 1
+        return data
+
+    async def read_url(self, url: Optional[str]) -> Optional[bytes]:
+        """Bytes of a spooled object by its public URL"""
+        return await self.read(self.backend.key_for_url(url) if url else None)
+
+    # Flushing -----------------------------------------------------------
+
+    async def _flush_one(self, write: SpooledWrite) -> bool:
+        data = await asyncio.to_thread(self._read_data, write)
+        if data is None:
+            self.pending.pop(write.key, None)
+            return True
+        try:
+            await self.backend.put_object(write.key, data, write.content_type, write.metadata, write.cache_control)
+        except Exception as e:
+            write.attempts += 1
+            write.last_error = str(e)
+            delay = min(
+                settings.WRITE_SPOOL_RETRY_SECONDS * 2 ** (write.attempts - 1),
+                settings.WRITE_SPOOL_MAX_BACKOFF_SECONDS
+            )
+            write.next_attempt = time.monotonic() + delay
+            self.flush_failures += 1
+            return False
+
+        if write.discarded:
+            # Deleted while this flush was in flight; take the object back out
+            try:
+                await self.backend.delete(write.key)
+            except Exception as e:
+                print(f"Delete of discarded spool write {write.key} failed: {e}")
+            return True
+
+        # A newer spool of the same key stays pending until it is flushed itself
+        if self.pending.get(write.key) is write:
+            await asyncio.to_thread(self._finish, write)
+            del self.pending[write.key]
+        self.flushed += 1
+        return True
+
+    async def flush(self) -> int:
+        """
+        Try every spooled write that is due, WRITE_SPOOL_FLUSH_CONCURRENCY at a time
+
+        Returns:
+            Number of writes flushed
+        """
+        await asyncio.to_thread(self._load)
+        now = time.monotonic()
+        due = [write for write in list(self.pending.values()) if write.next_attempt <= now]
+        if not due:
+            return 0
+
+        limit = asyncio.Semaphore(settings.WRITE_SPOOL_FLUSH_CONCURRENCY)
+
+        async def flush_one(write):
+            async with limit:
+                return await self._flush_one(write)
+
+        results = await asyncio.gather(*(flush_one(write) for write in due))
+        if all(results):
+            self._down_until = 0.0
+        else:
+            self._down_until = time.monotonic() + settings.WRITE_SPOOL_RETRY_SECONDS
+        return sum(results)
+
+    async def run(self):
+        """Flush spooled writes until the process exits"""
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Write spool flush failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.WRITE_SPOOL_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get write spool statistics"""
+        oldest = min((write.spooled_at for write in self.pending.values()), default=None)
+        return {
+            "enabled": settings.WRITE_SPOOL_ENABLED,
+            "pending": len(self.pending),
+            "pending_bytes": sum(write.size for write in self.pending.values()),
+            "oldest_pending_seconds": round(time.time() - oldest, 1) if oldest is not None else None,
+            "provider_down": time.monotonic() < self._down_until,
+            "direct_writes": self.direct_writes,
+            "spooled": self.spooled,
+            "flushed": self.flushed,
+            "flush_failures": self.flush_failures,
+            "spool_reads": self.spool_reads,
+            "discarded": self.discarded
+        }
+
+
+# Global write spool
+write_spool = WriteSpool(storage_backend, settings.WRITE_SPOOL_DIR)